@@ -1,25 +1,42 @@
 from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Depends, Request, Cookie
 from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal, InvalidOperation
 from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
 import os
+import re
+import shutil
+import socket
+import tempfile
+import unicodedata
+from contextlib import asynccontextmanager
 import uuid
+import numpy as np
 import pandas as pd
 import requests
 import logging
 from io import BytesIO
 import hashlib
+import json
 import secrets
 import time
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import codecs
+import csv
+import gc
+import multiprocessing
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 from reportlab.lib.pagesizes import A4, letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -45,6 +62,9 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Türkçe sıralama: Ç, Ğ, İ, Ö, Ş, Ü harfleri Z'den sonra değil, alfabedeki yerinde
+PRODUCT_NAME_COLLATION = {"locale": "tr"}
+
 # Create database indexes for better performance
 async def create_indexes():
     """Create database indexes for optimal performance with large datasets"""
@@ -65,6 +85,29 @@ async def create_indexes():
         await db.products.create_index([("company_id", 1), ("category_id", 1), ("name", 1)])  # For multi-filter queries
         await db.products.create_index([("is_favorite", -1), ("created_at", -1)])  # For favorites + date sorting
         
+        # Turkish collation indexes for favorites-first name sorting under each filter shape.
+        # List queries run with the same collation so the sort is index-backed.
+        await db.products.create_index(
+            [("is_favorite", -1), ("name", 1)],
+            collation=PRODUCT_NAME_COLLATION, name="tr_favorite_name"
+        )
+        await db.products.create_index(
+            [("company_id", 1), ("is_favorite", -1), ("name", 1)],
+            collation=PRODUCT_NAME_COLLATION, name="tr_company_favorite_name"
+        )
+        await db.products.create_index(
+            [("category_id", 1), ("is_favorite", -1), ("name", 1)],
+            collation=PRODUCT_NAME_COLLATION, name="tr_category_favorite_name"
+        )
+        await db.products.create_index(
+            [("company_id", 1), ("category_id", 1), ("is_favorite", -1), ("name", 1)],
+            collation=PRODUCT_NAME_COLLATION, name="tr_company_category_favorite_name"
+        )
+        await db.products.create_index(
+            [("category_id", 1), ("name", 1)],
+            collation=PRODUCT_NAME_COLLATION, name="tr_category_name"
+        )
+        
         # PERFORMANCE: Sparse indexes for optional fields
         await db.products.create_index("list_price_try", sparse=True)
         await db.products.create_index("discounted_price_try", sparse=True)
@@ -83,6 +126,37 @@ async def create_indexes():
             "name": "products_text_search"
         })
         
+        # Upload matching: one product per normalized name within a company (see migrate_product_name_keys)
+        try:
+            await db.products.create_index(
+                [("company_id", 1), ("name_key", 1)], unique=True, name=PRODUCT_NAME_KEY_INDEX
+            )
+        except Exception as e:
+            logger.error(f"Error creating unique product name index: {e}")
+        
+        # Cross-supplier comparison: fingerprint lookup and savings-sorted group pages
+        await db.products.create_index("fingerprint", sparse=True)
+        
+        # Upload provenance: products of an upload (currency relabeling, rollback)
+        await db.products.create_index("last_upload_id", sparse=True)
+        
+        # Upload rollback: before-images of an upload (one per product), dropped after UPLOAD_ROLLBACK_DAYS
+        await db.upload_before_images.create_index([("upload_id", 1), ("product_id", 1)])
+        await db.upload_before_images.create_index("created_at", expireAfterSeconds=UPLOAD_BEFORE_IMAGE_TTL_DAYS * 86400)
+        await db.product_groups.create_index("fingerprint", unique=True)
+        await db.product_groups.create_index([("savings_try", -1), ("company_count", 1)])
+        
+        # Upload history: latest upload of a company (re-upload detection, history lists)
+        await db.upload_history.create_index([("company_id", 1), ("upload_date", -1)])
+        
+        # Saved column layouts: one per company
+        await db.column_layouts.create_index("company_id", unique=True)
+        
+        # Background jobs: lookup by id, oldest runnable job first, expired leases
+        await db.jobs.create_index("id", unique=True)
+        await db.jobs.create_index([("status", 1), ("run_after", 1), ("created_at", 1)])
+        await db.jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+        
         # Companies collection indexes - ENHANCED
         await db.companies.create_index("name")
         await db.companies.create_index("created_at")
@@ -164,9 +238,15 @@ async def create_supplies_category():
 @app.on_event("startup")
 async def startup_event():
     """Initialize database indexes and create default categories on startup"""
+    # Tekil ürün adı indeksi kurulmadan önce name_key doldurulur ve kopyalar birleştirilir
+    await migrate_product_name_keys()
     await create_indexes()
     await create_supplies_category()
     await create_default_admin()
+    asyncio.create_task(initialize_product_groups())
+    asyncio.create_task(rebuild_product_counters())
+    start_upload_inbox_watcher()
+    start_job_worker()
     logger.info("Application startup completed")
 
 # Create a router with the /api prefix
@@ -245,8 +325,200 @@ def invalidate_cache(pattern: str = None):
             del cache[key]
         logger.info(f"Cache cleared for pattern: {pattern}")
 
-# Thread pool for CPU intensive tasks
-thread_pool = ThreadPoolExecutor(max_workers=4)
+# Filtered product count cache - product writes clear it. Writes also bump a generation stored in
+# db.cache_generations, so counts cached by other processes (API workers, job workers) expire too.
+products_count_cache = {}
+COUNT_CACHE_DURATION = 300  # 5 minutes
+COUNT_CACHE_MAX_ENTRIES = 1000
+PRODUCT_COUNT_GENERATION_ID = "product_counts"
+
+async def product_count_generation() -> int:
+    """Current generation of the product count cache, shared by all processes"""
+    generation = await db.cache_generations.find_one({"_id": PRODUCT_COUNT_GENERATION_ID})
+    return generation["generation"] if generation else 0
+
+async def invalidate_product_counts():
+    """Clear cached product counts after a write that changes which products match a filter"""
+    products_count_cache.clear()
+    invalidate_cache("/api/products/count")
+    try:
+        await db.cache_generations.update_one(
+            {"_id": PRODUCT_COUNT_GENERATION_ID}, {"$inc": {"generation": 1}}, upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error bumping product count generation: {e}")
+
+# Executor for CPU intensive tasks (Excel parsing) - keeps the event loop free
+EXCEL_PARSE_EXECUTOR = os.environ.get('EXCEL_PARSE_EXECUTOR', 'process').lower()  # process | thread
+EXCEL_PARSE_WORKERS = int(os.environ.get('EXCEL_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+_parse_executor = None
+
+def get_parse_executor():
+    """Create the bounded parse executor on first use"""
+    global _parse_executor
+    if _parse_executor is None:
+        if EXCEL_PARSE_EXECUTOR == 'thread':
+            _parse_executor = ThreadPoolExecutor(max_workers=EXCEL_PARSE_WORKERS)
+        else:
+            # API süreci motor ve loglama iş parçacıkları taşıdığı için fork yerine forkserver ile başlatılır
+            _parse_executor = ProcessPoolExecutor(
+                max_workers=EXCEL_PARSE_WORKERS, mp_context=multiprocessing.get_context("forkserver")
+            )
+        logger.info(f"Excel parse executor started: {EXCEL_PARSE_EXECUTOR} x {EXCEL_PARSE_WORKERS}")
+    return _parse_executor
+
+async def run_in_parse_executor(func, *args):
+    """Run a CPU bound function in the parse executor"""
+    global _parse_executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_parse_executor(), func, *args)
+    except BrokenProcessPool:
+        # Bir işçi süreç çöktüyse (ör. bellek yetersizliği) havuzu yeniden oluştur
+        logger.error("Excel parse process pool is broken, recreating it")
+        _parse_executor = None
+        raise HTTPException(status_code=500, detail="Excel dosyası işlenirken işçi süreç durdu, lütfen tekrar deneyin")
+
+def shutdown_parse_executor():
+    """Stop parse workers on application shutdown"""
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+
+# Excel uploads are spooled to a temp file in chunks; parsers get the file path instead of the bytes
+EXCEL_UPLOAD_MAX_BYTES = int(float(os.environ.get('EXCEL_UPLOAD_MAX_MB', 25)) * 1024 * 1024)
+EXCEL_UPLOAD_SPOOL_DIR = os.environ.get('EXCEL_UPLOAD_SPOOL_DIR') or None  # None: system temp dir
+UPLOAD_SPOOL_CHUNK_SIZE = 1024 * 1024
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024  # multipart sınırları ve diğer form alanları
+# CSV satırları parça parça okunup yazıldığı için çok daha büyük listeler kabul edilir
+CSV_UPLOAD_MAX_BYTES = int(float(os.environ.get('CSV_UPLOAD_MAX_MB', 250)) * 1024 * 1024)
+# Toplu yüklemede dosya başına sınır EXCEL_UPLOAD_MAX_BYTES, istek başına bu kadar dosya
+MAX_BATCH_UPLOAD_FILES = int(os.environ.get('MAX_BATCH_UPLOAD_FILES', 20))
+
+def upload_too_large_detail(max_bytes: int = EXCEL_UPLOAD_MAX_BYTES) -> str:
+    return f"Dosya çok büyük, en fazla {max_bytes / (1024 * 1024):g} MB yüklenebilir"
+
+@app.middleware("http")
+async def upload_size_limit_middleware(request: Request, call_next):
+    """Reject oversize Excel/CSV uploads from their Content-Length before the body is received
+
+    The multipart body is fully received (and spooled by Starlette) before an endpoint runs, so this is
+    the only point where an upload can be stopped early: uploads without a Content-Length (chunked
+    transfer) are refused with 411.
+    """
+    if request.method == "POST" and request.url.path.endswith(("/upload-excel", "/upload-csv", "/upload-excel/batch")):
+        if request.url.path.endswith("/upload-csv"):
+            max_bytes = CSV_UPLOAD_MAX_BYTES
+        elif request.url.path.endswith("/batch"):
+            max_bytes = EXCEL_UPLOAD_MAX_BYTES * MAX_BATCH_UPLOAD_FILES
+        else:
+            max_bytes = EXCEL_UPLOAD_MAX_BYTES
+        content_length = request.headers.get("content-length", "")
+        if not content_length.isdigit():
+            return JSONResponse(status_code=411, content={"detail": "Dosya yüklemesi için Content-Length başlığı gerekli"})
+        if int(content_length) > max_bytes + UPLOAD_FORM_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": upload_too_large_detail(max_bytes)})
+    return await call_next(request)
+
+async def spool_upload(file: UploadFile, max_bytes: int = EXCEL_UPLOAD_MAX_BYTES) -> Tuple[str, str]:
+    """Copy an upload to a temp file chunk by chunk, rejecting it as soon as it exceeds the size limit
+
+    The request size was already checked from its Content-Length (upload_size_limit_middleware); this
+    enforces the limit per file.
+
+    Returns the spool path and the SHA-256 of the file content.
+    """
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=Path(file.filename or "").suffix, dir=EXCEL_UPLOAD_SPOOL_DIR)
+    try:
+        size = 0
+        content_hash = hashlib.sha256()
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await file.read(UPLOAD_SPOOL_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=upload_too_large_detail(max_bytes))
+                content_hash.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        remove_spooled_upload(path)
+        raise
+    return path, content_hash.hexdigest()
+
+def remove_spooled_upload(path: Optional[str]):
+    """Delete a spooled upload once it has been parsed"""
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+# Parser output version - increase whenever the parsers may produce different rows for the same file.
+# Stored on upload_history with the file hash; cached parse results are only reused for the same version.
+# Uploads imported by an older version can be re-imported from their stored files (POST /api/upload-history/reparse).
+EXCEL_PARSER_VERSION = 2
+
+# Original upload files, stored once per content under their SHA-256 (empty: files are not kept)
+UPLOAD_ARCHIVE_DIR = os.environ.get('UPLOAD_ARCHIVE_DIR', str(ROOT_DIR / 'upload_archive'))
+
+def archive_upload_file(file_path: str, file_hash: str, filename: str) -> Optional[str]:
+    """Copy a spooled upload into the archive; returns its archive key ("ab/<sha256>.xlsx")
+
+    A file whose content is already archived is not copied again. Runs in a thread (file copy).
+    """
+    if not UPLOAD_ARCHIVE_DIR or not file_path or not file_hash:
+        return None
+    stored_file = f"{file_hash[:2]}/{file_hash}{Path(filename).suffix.lower()}"
+    target_path = os.path.join(UPLOAD_ARCHIVE_DIR, stored_file)
+    if not os.path.exists(target_path):
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        # Yarım kalan kopya arşivde görünmesin diye geçici adla yazılıp taşınır
+        temp_path = f"{target_path}.{uuid.uuid4()}.tmp"
+        try:
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, target_path)
+        finally:
+            remove_spooled_upload(temp_path)
+    return stored_file
+
+async def store_upload_file(file_path: str, file_hash: str, filename: str) -> Optional[str]:
+    """Archive an upload before it is imported; a failing archive never fails the upload"""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, archive_upload_file, file_path, file_hash, filename)
+    except Exception as e:
+        logger.warning(f"Could not archive upload {filename}: {e}")
+        return None
+
+def stored_upload_path(stored_file: Optional[str]) -> Optional[str]:
+    """Local path of an archived upload, None when it is not (or no longer) stored"""
+    if not stored_file or not UPLOAD_ARCHIVE_DIR:
+        return None
+    path = os.path.join(UPLOAD_ARCHIVE_DIR, stored_file)
+    return path if os.path.exists(path) else None
+
+# Parsed upload cache - a re-sent price list (same content, company and parser version) is not parsed again
+parse_result_cache = {}
+PARSE_CACHE_DURATION = 3600  # 1 hour
+PARSE_CACHE_MAX_ENTRIES = 8  # parsed rows of large lists are big, keep only a few
+
+def parse_cache_key(file_hash: str, company_name: str, layout_key: Optional[str], sheet_names: Optional[List[str]]) -> tuple:
+    """Everything the parse result depends on besides the parser code"""
+    return (file_hash, EXCEL_PARSER_VERSION, company_name, layout_key, tuple(sorted(sheet_names)) if sheet_names else None)
+
+def get_cached_parse_result(file_hash: str, company_name: str, layout_key: Optional[str] = None,
+                            sheet_names: Optional[List[str]] = None):
+    """Parsed (products, color_table, layout) of an identical earlier upload, or None"""
+    cached = parse_result_cache.get(parse_cache_key(file_hash, company_name, layout_key, sheet_names))
+    if cached and time.time() - cached[1] < PARSE_CACHE_DURATION:
+        return cached[0]
+    return None
+
+def store_parse_result(file_hash: str, company_name: str, result, layout_key: Optional[str] = None,
+                       sheet_names: Optional[List[str]] = None):
+    """Remember a parse result by file hash, evicting the oldest entry when full"""
+    cache_key = parse_cache_key(file_hash, company_name, layout_key, sheet_names)
+    parse_result_cache.pop(cache_key, None)
+    if len(parse_result_cache) >= PARSE_CACHE_MAX_ENTRIES:
+        parse_result_cache.pop(next(iter(parse_result_cache)))
+    parse_result_cache[cache_key] = (result, time.time())
 
 # Pydantic Models
 class Company(BaseModel):
@@ -273,6 +545,9 @@ class Product(BaseModel):
     is_favorite: bool = False
     stock_quantity: Optional[int] = None  # Sadece favori ürünler için stok takibi
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    display_currency: Optional[str] = None  # İstenirse fiyatların gösterim dövizi
+    display_list_price: Optional[float] = None
+    display_discounted_price: Optional[float] = None
 
 class ProductCreate(BaseModel):
     name: str
@@ -286,6 +561,10 @@ class ProductCreate(BaseModel):
     currency: str
     is_favorite: bool = False
 
+class ProductBatchRequest(BaseModel):
+    ids: List[str]
+    fields: Optional[List[str]] = None  # Sadece istenen alanlar (projection)
+
 class Category(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -324,6 +603,25 @@ class CategoryGroupUpdate(BaseModel):
     category_ids: Optional[List[str]] = None
     sort_order: Optional[int] = None  # Sıralama güncellemesi için
 
+# Column Layout Models (firma başına kayıtlı Excel kolon eşlemesi)
+class ColumnLayoutSheet(BaseModel):
+    sheet: Optional[str] = None  # Sayfa adı; geleneksel ayrıştırıcı yalnızca ilk sayfayı okur (None)
+    header_row: int  # 0 tabanlı başlık satırı, -1: başlık yok
+    columns: Dict[str, int] = {}  # Rol -> 0 tabanlı kolon (renk tabanlı ayrıştırıcı)
+    currency: Optional[str] = None  # Liste fiyatı para birimi (renk tabanlı ayrıştırıcı)
+    header_fingerprint: Optional[str] = None  # Başlık satırının özeti, sabitlenmiş eşlemede kullanılmaz
+
+class ColumnLayout(BaseModel):
+    company_id: str
+    parser: str  # color, traditional
+    sheets: List[ColumnLayoutSheet]
+    pinned: bool = False  # Sabitlenmiş eşleme başlık değişse de kullanılır, algılanan eşleme üzerine yazılmaz
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class ColumnLayoutUpdate(BaseModel):
+    parser: str = "color"
+    sheets: List[ColumnLayoutSheet]
+
 # Upload History Models
 class UploadHistory(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -334,9 +632,41 @@ class UploadHistory(BaseModel):
     total_products: int
     new_products: int
     updated_products: int
+    unchanged_products: int = 0  # Rows equal to the stored product, not written
     currency_distribution: Dict[str, int]  # Currency -> count
     price_changes: List[Dict[str, Any]] = []  # Price change details
-    status: str = "completed"  # completed, failed, processing
+    failed_products: int = 0
+    import_errors: List[Dict[str, Any]] = []  # Chunk/product/error of rows that could not be written
+    file_hash: Optional[str] = None  # SHA-256 of the uploaded file
+    parser_version: Optional[int] = None  # EXCEL_PARSER_VERSION used for the import
+    upload_options: Dict[str, Any] = {}  # Currency override and discount applied to the rows
+    status: str = "completed"  # completed, failed, cancelled, rolled_back, processing (queued/running background job)
+    source: str = "upload"  # upload (API/UI) or inbox (watched upload directory)
+    error: Optional[str] = None  # Reason of a failed upload
+    stored_file: Optional[str] = None  # Archive key of the original file (see archive_upload_file)
+    reparsed_at: Optional[datetime] = None  # Last re-import of the stored file with a newer parser
+    superseded_products: int = 0  # Re-parse: rows skipped because a later upload owns the product
+
+# Background job: queued by the API, run by a worker holding its lease
+class Job(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    type: str  # excel_import, reparse_upload, refresh_prices, change_upload_currency, rollback_upload
+    params: Dict[str, Any] = {}
+    serial_key: Optional[str] = None  # Jobs with the same key never run at the same time (company:<id>)
+    status: str = "queued"  # queued, running, completed, failed, cancelled
+    progress: Dict[str, Any] = {}  # done / total
+    attempts: int = 0
+    max_attempts: int = 3
+    cancel_requested: bool = False
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    upload_id: Optional[str] = None  # Upload history entry kept in "processing" while the job runs
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    run_after: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 # Package Models
 class Package(BaseModel):
@@ -405,6 +735,9 @@ class PackageWithProducts(BaseModel):
     supplies: List[Dict[str, Any]] = []  # Sarf malzemeleri
     total_discounted_price: Optional[Decimal] = None
     total_discounted_price_with_supplies: Optional[Decimal] = None
+    display_currency: Optional[str] = None
+    display_total_discounted_price: Optional[float] = None
+    display_total_discounted_price_with_supplies: Optional[float] = None
     status: str
 class UploadHistoryResponse(BaseModel):
     id: str
@@ -415,9 +748,20 @@ class UploadHistoryResponse(BaseModel):
     total_products: int
     new_products: int
     updated_products: int
+    unchanged_products: int = 0
     currency_distribution: Dict[str, int]
     price_changes: List[Dict[str, Any]]
+    failed_products: int = 0
+    import_errors: List[Dict[str, Any]] = []
+    file_hash: Optional[str] = None
+    parser_version: Optional[int] = None
+    upload_options: Dict[str, Any] = {}
     status: str
+    source: str = "upload"
+    error: Optional[str] = None
+    stored_file: Optional[str] = None
+    reparsed_at: Optional[datetime] = None
+    superseded_products: int = 0
 
 class QuoteCreate(BaseModel):
     name: str
@@ -454,6 +798,10 @@ class QuoteResponse(BaseModel):
     notes: Optional[str] = None
     created_at: str
     status: str = "active"
+    display_currency: Optional[str] = None
+    display_total_list_price: Optional[float] = None
+    display_total_discounted_price: Optional[float] = None
+    display_total_net_price: Optional[float] = None
 
 class ExchangeRate(BaseModel):
     currency: str
@@ -597,14 +945,31 @@ class CurrencyService:
                 'GBP': Decimal('35.0')
             }
     
+    async def get_rates_snapshot(self) -> Dict[str, Decimal]:
+        """Get the last known rates without calling the external API when possible"""
+        if self.rates_cache:
+            return self.rates_cache
+        
+        rates_from_db = await db.exchange_rates.find().to_list(None)
+        if rates_from_db:
+            return {rate['currency']: Decimal(str(rate['rate_to_try'])) for rate in rates_from_db}
+        
+        return await self.get_exchange_rates()
+    
     async def convert_to_try(self, amount: Decimal, from_currency: str) -> Decimal:
         """Convert amount to Turkish Lira"""
         if from_currency.upper() == 'TRY':
             return amount
             
         rates = await self.get_exchange_rates()
-        rate = rates.get(from_currency.upper(), Decimal('1'))
-        return amount * rate
+        return self.convert_with_rates(amount, from_currency, rates)
+    
+    @staticmethod
+    def convert_with_rates(amount: Decimal, from_currency: str, rates: Dict[str, Decimal]) -> Decimal:
+        """Convert amount to Turkish Lira with already fetched rates (no API call)"""
+        if from_currency.upper() == 'TRY':
+            return amount
+        return amount * rates.get(from_currency.upper(), Decimal('1'))
 
     async def convert_from_try(self, amount_try: Decimal, to_currency: str) -> Decimal:
         """Convert amount from Turkish Lira to target currency"""
@@ -713,124 +1078,886 @@ async def get_db():
     """Get database connection"""
     return db
 
+# Toplu ürün getirme için üst sınır
+MAX_BATCH_PRODUCT_IDS = 5000
+
+# Excel içe aktarımında bulk_write parça boyutu ve yanıtta raporlanan en fazla hata sayısı
+BULK_WRITE_CHUNK_SIZE = 1000
+MAX_REPORTED_IMPORT_ERRORS = 100
+
+# Excel içe aktarımında karşılaştırılan alanlar: hepsi aynı olan satırlar yazılmaz.
+# TL fiyatları kurla değişir ve /refresh-prices ile güncellenir, karşılaştırmaya girmez.
+UPLOAD_DIFF_FIELDS = ("list_price", "discounted_price", "currency", "brand")
+# Upload geri alma: değiştirilen ürünlerin bu alanlarının yüklemeden önceki hali saklanır.
+# TL fiyatları saklanmaz, geri almada güncel kurla yeniden hesaplanır.
+UPLOAD_BEFORE_IMAGE_FIELDS = (
+    "list_price", "discounted_price", "currency", "brand", "fingerprint", "updated_at", "last_upload_id"
+)
+UPLOAD_BEFORE_IMAGE_TTL_DAYS = int(os.environ.get('UPLOAD_ROLLBACK_DAYS', 30))
+UPLOAD_SNAPSHOT_PROJECTION = {
+    "_id": 0, "id": 1, "company_id": 1, "name_key": 1,
+    **{field: 1 for field in UPLOAD_BEFORE_IMAGE_FIELDS}
+}
+
+def product_edit_changes_upload_fields(existing_product: Dict[str, Any], update: Dict[str, Any]) -> bool:
+    """True when a manual product edit changes a price, the currency or the brand written by uploads
+
+    Such an edit releases the product from its upload (last_upload_id is removed), so rolling back or
+    relabeling the upload never overwrites the correction.
+    """
+    return any(
+        field in update and (update[field] or None) != (existing_product.get(field) or None)
+        for field in UPLOAD_DIFF_FIELDS
+    )
+
+def upload_row_changed(existing_product: Dict[str, Any], set_fields: Dict[str, Any]) -> bool:
+    """True when an uploaded row differs from the stored product in a price, the currency or the brand"""
+    # Boş değerler ("", None, 0) eşit sayılır: eski kayıtlarda marka alanı hiç olmayabilir
+    return any((existing_product.get(field) or None) != (set_fields[field] or None) for field in UPLOAD_DIFF_FIELDS)
+
+def build_upload_row(product_data: Dict[str, Any], company_id: str, user_selected_currency: Optional[str], discount_percentage: float) -> Dict[str, Any]:
+    """Pending upsert for one parsed Excel row: match key, fields set on every import, insert-only fields
+
+    TRY prices are left to the caller, which converts row["prices"] (the Decimal list/discounted prices).
+    """
+    # Use user-selected currency if provided, otherwise use detected currency
+    final_currency = user_selected_currency if user_selected_currency else product_data.get('currency', 'USD')
+    
+    # Apply discount if specified
+    original_list_price = Decimal(str(product_data['list_price']))
+    list_price = original_list_price  # Liste fiyatı orijinal fiyat olarak kalır
+    
+    # Calculate discounted price based on user discount percentage
+    discounted_price = None
+    if discount_percentage > 0:
+        # İskonto yüzdesi varsa, orijinal fiyattan indirim yap
+        discount_amount = original_list_price * (Decimal(str(discount_percentage)) / Decimal('100'))
+        discounted_price = original_list_price - discount_amount
+    elif product_data.get('discounted_price'):
+        # Excel'de zaten indirimli fiyat varsa onu kullan
+        discounted_price = Decimal(str(product_data['discounted_price']))
+    
+    product_name = product_data['name']
+    return {
+        "name": product_name,
+        "company_id": company_id,
+        "name_key": build_product_name_key(product_name),
+        "prices": (list_price, discounted_price),
+        "set_fields": {
+            "brand": product_data.get('brand', ''),  # Marka alanı
+            "fingerprint": build_product_fingerprint(product_name, product_data.get('brand', '')),
+            "list_price": float(list_price),
+            "discounted_price": float(discounted_price) if discounted_price else None,
+            "currency": final_currency
+        },
+        # Yalnızca yeni ürün oluşturulurken yazılan alanlar
+        "insert_fields": {
+            "id": str(uuid.uuid4()),
+            "name": product_name,
+            "description": product_data.get('description'),
+            "image_url": None,
+            "created_at": datetime.now(timezone.utc)
+        }
+    }
+
+# Upload önizlemesinde (dry run) her durum için gösterilen en fazla örnek satır
+UPLOAD_PREVIEW_SAMPLE_SIZE = 20
+# Dosya içinde tekrar eden satırları yakalamak için izlenen en fazla ürün; bellek dosya boyutuyla büyümez
+UPLOAD_PREVIEW_MAX_TRACKED_ROWS = 50000
+
+async def preview_excel_import(company: Dict[str, Any], product_chunks, user_selected_currency: Optional[str], discount_percentage: float) -> Dict[str, Any]:
+    """Diff parsed upload rows against the catalog the way the import would, without writing anything
+
+    product_chunks is an async iterable of product lists, as for import_product_chunks; rows are not kept.
+    A product repeated in the file is compared with its earlier row, for the first
+    UPLOAD_PREVIEW_MAX_TRACKED_ROWS products of the file (later ones with the stored product).
+    Returns new/updated/unchanged/removed counts, the currency distribution and sample rows per status.
+    """
+    company_ids = {company['name']: company['id']}
+    new_companies = []
+    planned = {}  # (company_id, name_key) -> UPLOAD_DIFF_FIELDS değerlerinin içe aktarımdan sonraki hali
+    matched_keys = set()  # dosyada bulunan mevcut ürünler (yüklenen firma)
+    counts = {"new": 0, "updated": 0, "unchanged": 0}
+    samples = {"new": [], "updated": [], "unchanged": []}
+    currency_distribution = {}
+    price_changes = 0
+    invalid_products = 0
+    total_products = 0
+    
+    async for products_data in product_chunks:
+        total_products += len(products_data)
+        rows = []
+        for product_data in products_data:
+            # Renk tabanlı listelerde ürün başka bir firmaya ait olabilir; önizleme firma oluşturmaz
+            target_company_id = company['id']
+            company_name = product_data.get('company_name')
+            if company_name and company_name != company['name'] and company_name != "Unknown":
+                if company_name not in company_ids:
+                    existing_company = await db.companies.find_one({"name": company_name}, {"_id": 0, "id": 1})
+                    if existing_company:
+                        company_ids[company_name] = existing_company['id']
+                    else:
+                        company_ids[company_name] = f"new-company:{company_name}"
+                        new_companies.append(company_name)
+                target_company_id = company_ids[company_name]
+            try:
+                rows.append(build_upload_row(product_data, target_company_id, user_selected_currency, discount_percentage))
+            except Exception as e:
+                logger.warning(f"Error previewing product {product_data.get('name', 'Unknown')}: {e}")
+                invalid_products += 1
+        
+        existing_products = {}
+        lookup_rows = [row for row in rows if (row['company_id'], row['name_key']) not in planned]
+        if lookup_rows:
+            async for existing_product in db.products.find(
+                {
+                    "company_id": {"$in": list({row['company_id'] for row in lookup_rows})},
+                    "name_key": {"$in": list({row['name_key'] for row in lookup_rows})}
+                },
+                UPLOAD_SNAPSHOT_PROJECTION
+            ):
+                existing_products[(existing_product['company_id'], existing_product['name_key'])] = existing_product
+        
+        for row in rows:
+            key = (row['company_id'], row['name_key'])
+            set_fields = row['set_fields']
+            currency_distribution[set_fields['currency']] = currency_distribution.get(set_fields['currency'], 0) + 1
+            
+            # Dosyada aynı ürün tekrar ediyorsa ilk satırın yazılmış hali ile karşılaştırılır
+            current = planned.get(key)
+            if current is not None:
+                current = dict(zip(UPLOAD_DIFF_FIELDS, current))
+            else:
+                current = existing_products.get(key)
+                if current and row['company_id'] == company['id']:
+                    matched_keys.add(row['name_key'])
+            
+            sample = {
+                "name": row['name'],
+                "brand": set_fields['brand'],
+                "list_price": set_fields['list_price'],
+                "discounted_price": set_fields['discounted_price'],
+                "currency": set_fields['currency']
+            }
+            if current is None:
+                status = "new"
+            elif upload_row_changed(current, set_fields):
+                status = "updated"
+                sample["changes"] = {
+                    field: {"old": current.get(field), "new": set_fields[field]}
+                    for field in UPLOAD_DIFF_FIELDS
+                    if (current.get(field) or None) != (set_fields[field] or None)
+                }
+                if float(current.get('list_price') or 0) != set_fields['list_price']:
+                    price_changes += 1
+            else:
+                status = "unchanged"
+            
+            counts[status] += 1
+            if len(samples[status]) < UPLOAD_PREVIEW_SAMPLE_SIZE:
+                samples[status].append(sample)
+            if key in planned or len(planned) < UPLOAD_PREVIEW_MAX_TRACKED_ROWS:
+                planned[key] = tuple(set_fields[field] for field in UPLOAD_DIFF_FIELDS)
+    
+    # Katalogda olup dosyada olmayan ürünler (içe aktarma bunları silmez, yalnızca raporlanır)
+    catalog_products = await db.products.count_documents({"company_id": company['id']})
+    
+    return {
+        "total_products": total_products,
+        "new_products": counts["new"],
+        "updated_products": counts["updated"],
+        "unchanged_products": counts["unchanged"],
+        "removed_products": catalog_products - len(matched_keys),
+        "invalid_products": invalid_products,
+        "price_changes": price_changes,
+        "currency_distribution": currency_distribution,
+        "new_companies": new_companies,
+        "preview": samples
+    }
+
+async def store_upload_before_images(before_images: List[Dict[str, Any]]):
+    """Keep the first before-image of every product of an upload
+
+    A retried import (or a product repeated in the file) sees the rows it already wrote; their images
+    would show the half-imported state, so an existing image is never replaced. An ownership-only
+    image is completed when the product is written later in the same upload, keeping its previous owner.
+    """
+    operations = []
+    for image in before_images:
+        image_filter = {"upload_id": image['upload_id'], "product_id": image['product_id']}
+        operations.append(UpdateOne(image_filter, {"$setOnInsert": image}, upsert=True))
+        if not image.get('owner_only') and not image.get('created'):
+            fields = {f"fields.{field}": value for field, value in image['fields'].items() if field != "last_upload_id"}
+            operations.append(UpdateOne(
+                {**image_filter, "owner_only": True},
+                {"$set": fields, "$unset": {"owner_only": ""}} if fields else {"$unset": {"owner_only": ""}}
+            ))
+    if operations:
+        await db.upload_before_images.bulk_write(operations, ordered=False)
+
+async def iterate_product_chunks(products_data: List[Dict[str, Any]]):
+    """Parsed upload rows in write-chunk sized lists, the input of the import and the preview"""
+    for chunk_start in range(0, len(products_data), BULK_WRITE_CHUNK_SIZE):
+        yield products_data[chunk_start:chunk_start + BULK_WRITE_CHUNK_SIZE]
+
+async def import_product_chunks(company: Dict[str, Any], product_chunks, filename: str, file_hash: Optional[str],
+                                upload_options: Dict[str, Any], user_selected_currency: Optional[str],
+                                discount_percentage: float, color_table: Optional[List[Dict[str, Any]]] = None,
+                                rates: Optional[Dict[str, Decimal]] = None, source: str = "upload",
+                                upload_id: Optional[str] = None, on_progress=None, stored_file: Optional[str] = None,
+                                reparse_of: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Upsert parsed upload rows into the company's catalog and record the upload history
+
+    product_chunks is an async iterable of product lists (parsed rows), consumed chunk by chunk so
+    streamed sources are never held in memory. Prices are converted with one rate snapshot: rates
+    when given (batch uploads share one), else fetched once for this upload.
+    upload_id completes an existing "processing" history entry (background jobs) instead of adding one;
+    on_progress is awaited with the number of rows read after every chunk.
+    Every product of the file, written or unchanged, is stamped with last_upload_id. The before-image
+    of every written product, and the previous owner of every unchanged one, is kept in
+    upload_before_images for rollback.
+    stored_file is the archive key of the original file, recorded on the history entry.
+    An import that stops partway records a "failed" history entry under upload_id (unless the upload
+    already has one) with the rows written so far, so the partial import can be rolled back.
+    reparse_of is the history entry of an earlier upload of the same file: it is imported again under
+    its id and date, and rows whose product now belongs to a later upload are skipped (superseded).
+    Returns the upload response (message and summary).
+    """
+    company_id = company['id']
+    if reparse_of:
+        upload_id = reparse_of['id']
+    history_exists = upload_id is not None
+    upload_id = upload_id or str(uuid.uuid4())
+    
+    # Get current exchange rates (satır başına kur isteği yapılmaz)
+    if rates is None:
+        rates = await currency_service.get_exchange_rates()
+    
+    # Initialize counters and tracking
+    total_products = 0
+    new_products = 0
+    updated_products = 0
+    price_changes = []
+    currency_distribution = {}
+    touched_fingerprints = set()
+    created_counts = {}  # company_id -> yeni ürün sayısı (ürün sayaçları için)
+    
+    # Firma çözümlemeleri istek boyunca önbellekte tutulur (satır başına find_one yok)
+    company_cache = {company['name']: (company_id, company['name'])}
+    
+    # Satırlar (company_id, name_key) üzerinden upsert edilir; katalog belleğe yüklenmez,
+    # her parça için eşleşen mevcut ürünlerin fiyat/para birimi/marka görüntüsü okunur ve
+    # yalnızca değişen satırlar yazılır
+    unchanged_products = 0
+    pending_rows = []
+    pending_keys = set()
+    import_errors = []
+    failed_products = 0
+    superseded_products = 0
+    chunk_number = 1
+    upload_dates = {}  # yeniden işlemede ürünün sahibi olan yüklemelerin tarihleri
+    
+    async def superseded_owners(existing_products) -> set:
+        """Ids of the uploads newer than the re-parsed one among the owners of the chunk's products"""
+        owner_ids = {product.get('last_upload_id') for product in existing_products} - {None, upload_id}
+        unknown_ids = list(owner_ids - upload_dates.keys())
+        if unknown_ids:
+            async for owner in db.upload_history.find({"id": {"$in": unknown_ids}}, {"_id": 0, "id": 1, "upload_date": 1}):
+                upload_dates[owner['id']] = owner['upload_date']
+        # Tarihler aynı kaynaktan (upload_history) okunur, doğrudan karşılaştırılabilir
+        return {
+            owner_id for owner_id in owner_ids
+            if owner_id in upload_dates and upload_dates[owner_id] > reparse_of['upload_date']
+        }
+    
+    async def flush_operations():
+        """Diff the pending chunk against the stored products and upsert only new or changed rows"""
+        nonlocal pending_rows, pending_keys, chunk_number, new_products, updated_products, unchanged_products, failed_products, superseded_products
+        if not pending_rows:
+            return
+        
+        existing_products = {}
+        async for existing_product in db.products.find(
+            {
+                "company_id": {"$in": list({row['company_id'] for row in pending_rows})},
+                "name_key": {"$in": list({row['name_key'] for row in pending_rows})}
+            },
+            UPLOAD_SNAPSHOT_PROJECTION
+        ):
+            existing_products[(existing_product['company_id'], existing_product['name_key'])] = existing_product
+        
+        # Eski bir dosya yeniden işlenirken sonraki yüklemelerin yazdığı fiyatlar geri alınmaz
+        if reparse_of:
+            newer_owners = await superseded_owners(existing_products.values())
+            if newer_owners:
+                kept_rows = []
+                for row in pending_rows:
+                    existing_product = existing_products.get((row['company_id'], row['name_key']))
+                    if existing_product and existing_product.get('last_upload_id') in newer_owners:
+                        superseded_products += 1
+                    else:
+                        kept_rows.append(row)
+                pending_rows = kept_rows
+        
+        # Fiyatı, para birimi ve markası aynı olan ürünler yeniden yazılmaz (updated_at dahil),
+        # yalnızca bu yüklemeye ait oldukları işaretlenir
+        changed_rows = []
+        unchanged_keys = {}
+        before_images = []
+        for row in pending_rows:
+            existing_product = existing_products.get((row['company_id'], row['name_key']))
+            if existing_product and not upload_row_changed(existing_product, row['set_fields']):
+                unchanged_products += 1
+                if existing_product.get('last_upload_id') != upload_id:
+                    unchanged_keys.setdefault(row['company_id'], []).append(row['name_key'])
+                    # Değişmeyen ürünün yalnızca önceki sahibi saklanır; geri almada sahiplik ona döner
+                    before_images.append({
+                        "upload_id": upload_id,
+                        "company_id": row['company_id'],
+                        "product_id": existing_product['id'],
+                        "owner_only": True,
+                        "fields": {"last_upload_id": existing_product['last_upload_id']} if existing_product.get('last_upload_id') else {},
+                        "created_at": datetime.now(timezone.utc)
+                    })
+            else:
+                changed_rows.append((row, existing_product))
+        
+        # Geri alma için önce eski halleri yazılır (yeni ürünler için yalnızca id)
+        for row, existing_product in changed_rows:
+            before_image = {"upload_id": upload_id, "company_id": row['company_id'], "created_at": datetime.now(timezone.utc)}
+            if existing_product:
+                before_image["product_id"] = existing_product['id']
+                before_image["fields"] = {
+                    field: existing_product[field] for field in UPLOAD_BEFORE_IMAGE_FIELDS if field in existing_product
+                }
+            else:
+                before_image["product_id"] = row['insert_fields']['id']
+                before_image["created"] = True
+            before_images.append(before_image)
+        await store_upload_before_images(before_images)
+        
+        for target_company_id, name_keys in unchanged_keys.items():
+            await db.products.update_many(
+                {"company_id": target_company_id, "name_key": {"$in": name_keys}},
+                {"$set": {"last_upload_id": upload_id}}
+            )
+        
+        operations = [
+            UpdateOne(
+                {"company_id": row['company_id'], "name_key": row['name_key']},
+                {"$set": row['set_fields'], "$setOnInsert": row['insert_fields']},
+                upsert=True
+            )
+            for row, _ in changed_rows
+        ]
+        failed_rows = await bulk_write_chunk(db.products, operations) if operations else {}
+        
+        for index, (row, existing_product) in enumerate(changed_rows):
+            if index in failed_rows:
+                failed_products += 1
+                if len(import_errors) < MAX_REPORTED_IMPORT_ERRORS:
+                    import_errors.append({"chunk": chunk_number, "product_name": row['name'], "error": failed_rows[index]})
+                continue
+            
+            set_fields = row['set_fields']
+            if existing_product:
+                # Product existed - it was updated
+                old_list_price = float(existing_product.get('list_price') or 0)
+                new_list_price = set_fields['list_price']
+                if old_list_price != new_list_price:
+                    price_change_amount = new_list_price - old_list_price
+                    price_change_percent = ((new_list_price - old_list_price) / old_list_price * 100) if old_list_price > 0 else 0
+                    
+                    price_changes.append({
+                        "product_name": row['name'],
+                        "old_price": old_list_price,
+                        "new_price": new_list_price,
+                        "change_amount": price_change_amount,
+                        "change_percent": round(price_change_percent, 2),
+                        "currency": set_fields['currency'],
+                        "change_type": "increase" if price_change_amount > 0 else "decrease"
+                    })
+                touched_fingerprints.update([existing_product.get('fingerprint'), set_fields['fingerprint']])
+                updated_products += 1
+            else:
+                # New product - it was inserted by the upsert
+                created_counts[row['company_id']] = created_counts.get(row['company_id'], 0) + 1
+                touched_fingerprints.add(set_fields['fingerprint'])
+                new_products += 1
+        
+        if failed_rows:
+            logger.warning(f"Excel import chunk {chunk_number}: {len(failed_rows)} of {len(operations)} writes failed")
+        pending_rows = []
+        pending_keys = set()
+        chunk_number += 1
+    
+    # Process and save products with smart update
+    try:
+        async for products_data in product_chunks:
+            total_products += len(products_data)
+            for product_data in products_data:
+                try:
+                    # Handle company management for color-based parsing
+                    target_company_id = company_id
+                    
+                    # If product has a different company name (from color-based parsing)
+                    if (product_data.get('company_name') and 
+                        product_data['company_name'] != company['name'] and
+                        product_data['company_name'] != "Unknown"):
+                        
+                        if product_data['company_name'] not in company_cache:
+                            # Check if this company already exists
+                            existing_company = await db.companies.find_one({"name": product_data['company_name']})
+                            if existing_company:
+                                company_cache[existing_company['name']] = (existing_company['id'], existing_company['name'])
+                            else:
+                                # Create new company
+                                new_company_dict = {
+                                    "id": str(uuid.uuid4()),
+                                    "name": product_data['company_name'],
+                                    "created_at": datetime.now(timezone.utc)
+                                }
+                                await db.companies.insert_one(new_company_dict)
+                                company_cache[new_company_dict['name']] = (new_company_dict['id'], new_company_dict['name'])
+                                logger.info(f"Created new company: {product_data['company_name']}")
+                        target_company_id = company_cache[product_data['company_name']][0]
+                    
+                    row = build_upload_row(product_data, target_company_id, user_selected_currency, discount_percentage)
+                    list_price, discounted_price = row.pop('prices')
+                    final_currency = row['set_fields']['currency']
+                    
+                    # Convert prices to TRY
+                    list_price_try = currency_service.convert_with_rates(list_price, final_currency, rates)
+                    
+                    discounted_price_try = None
+                    if discounted_price:
+                        discounted_price_try = currency_service.convert_with_rates(discounted_price, final_currency, rates)
+                    
+                    row['set_fields'].update({
+                        "list_price_try": float(list_price_try),
+                        "discounted_price_try": float(discounted_price_try) if discounted_price_try else None,
+                        "updated_at": datetime.now(timezone.utc),
+                        "last_upload_id": upload_id
+                    })
+                    
+                    # Count currency distribution (use final currency)
+                    currency_distribution[final_currency] = currency_distribution.get(final_currency, 0) + 1
+                    
+                    # Aynı parçada aynı ürün ikinci kez geçiyorsa önce parça yazılır, ikinci satır güncelleme olur
+                    name_key = row['name_key']
+                    if (target_company_id, name_key) in pending_keys:
+                        await flush_operations()
+                    
+                    pending_rows.append(row)
+                    pending_keys.add((target_company_id, name_key))
+                    
+                except Exception as e:
+                    logger.warning(f"Error processing product {product_data.get('name', 'Unknown')}: {e}")
+                    failed_products += 1
+                    if len(import_errors) < MAX_REPORTED_IMPORT_ERRORS:
+                        import_errors.append({"chunk": chunk_number, "product_name": product_data.get('name', 'Unknown'), "error": str(e)})
+                    continue
+                
+                if len(pending_rows) >= BULK_WRITE_CHUNK_SIZE:
+                    await flush_operations()
+            
+            if on_progress:
+                await on_progress(total_products)
+        
+        await flush_operations()
+    except Exception as e:
+        # Yazılmış parçalar görünür ve geri alınabilir kalsın diye yarım kalan yükleme de kaydedilir
+        logger.error(f"Import of {filename} stopped after {total_products} rows: {e}")
+        await record_failed_upload(
+            company, filename, file_hash, upload_options, e.detail if isinstance(e, HTTPException) else str(e),
+            source, stored_file, upload_id=upload_id, summary={
+                "total_products": total_products,
+                "new_products": new_products,
+                "updated_products": updated_products,
+                "unchanged_products": unchanged_products,
+                "currency_distribution": currency_distribution,
+                "price_changes": price_changes,
+                "failed_products": failed_products,
+                "import_errors": import_errors
+            }
+        )
+        await adjust_product_counters([
+            (target_company_id, None, count) for target_company_id, count in created_counts.items()
+        ])
+        await refresh_product_groups_safely(list(touched_fingerprints))
+        raise
+    
+    if total_products == 0:
+        raise HTTPException(status_code=400, detail="Dosyada geçerli ürün verisi bulunamadı")
+    
+    # Create upload history record
+    upload_history = {
+        "id": upload_id,
+        "company_id": company_id,
+        "company_name": company['name'],
+        "filename": filename,
+        "upload_date": datetime.now(timezone.utc),
+        "total_products": total_products,
+        "new_products": new_products,
+        "updated_products": updated_products,
+        "unchanged_products": unchanged_products,
+        "currency_distribution": currency_distribution,
+        "price_changes": price_changes,
+        "failed_products": failed_products,
+        "import_errors": import_errors,
+        "file_hash": file_hash,
+        "parser_version": EXCEL_PARSER_VERSION,
+        "upload_options": upload_options,
+        "status": "completed",
+        "source": source,
+        "stored_file": stored_file,
+        "superseded_products": superseded_products
+    }
+    if reparse_of:
+        upload_history.update({
+            "upload_date": reparse_of['upload_date'],
+            "source": reparse_of.get('source', source),
+            "reparsed_at": datetime.now(timezone.utc)
+        })
+    
+    if history_exists:
+        await db.upload_history.replace_one({"id": upload_id}, upload_history, upsert=True)
+    else:
+        await db.upload_history.insert_one(upload_history)
+    
+    await adjust_product_counters([
+        (target_company_id, None, count) for target_company_id, count in created_counts.items()
+    ])
+    
+    # Fiyat karşılaştırma gruplarını sadece etkilenen ürünler için güncelle
+    await refresh_product_groups_safely(list(touched_fingerprints))
+    
+    # Create detailed response message
+    messages = []
+    if new_products > 0:
+        messages.append(f"{new_products} yeni ürün eklendi")
+    if updated_products > 0:
+        messages.append(f"{updated_products} ürün güncellendi")
+    if unchanged_products > 0:
+        messages.append(f"{unchanged_products} ürün değişmedi")
+    if failed_products > 0:
+        messages.append(f"{failed_products} ürün kaydedilemedi")
+    if superseded_products > 0:
+        messages.append(f"{superseded_products} ürün daha yeni bir yüklemeye ait olduğu için atlandı")
+    if price_changes:
+        price_increases = len([c for c in price_changes if c['change_type'] == 'increase'])
+        price_decreases = len([c for c in price_changes if c['change_type'] == 'decrease'])
+        if price_increases > 0:
+            messages.append(f"{price_increases} ürünün fiyatı zamlandı")
+        if price_decreases > 0:
+            messages.append(f"{price_decreases} ürünün fiyatı ucuzladı")
+    
+    message = ". ".join(messages) if messages else "Liste başarıyla yüklendi"
+    
+    return {
+        "success": True,
+        "message": message,
+        "upload_id": upload_history["id"],
+        "summary": {
+            "total_products": total_products,
+            "new_products": new_products,
+            "updated_products": updated_products,
+            "unchanged_products": unchanged_products,
+            "price_changes": len(price_changes),
+            "currency_distribution": currency_distribution,
+            "failed_products": failed_products,
+            "superseded_products": superseded_products,
+            "import_errors": import_errors,
+            # Renk algılama hata ayıklaması için: dosyadaki her farklı dolgu ve kategorisi
+            "color_table": color_table
+        }
+    }
+
+async def get_column_layout(company_id: str) -> Optional[Dict[str, Any]]:
+    """Saved column layout of a company, None when its lists were never parsed with a header row"""
+    return await db.column_layouts.find_one({"company_id": company_id}, {"_id": 0})
+
+def column_layout_key(layout: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Hash of a pinned layout; pinned layouts change the parse result, detected ones reproduce it"""
+    if not layout or not layout.get('pinned'):
+        return None
+    return hashlib.sha1(
+        json.dumps({"parser": layout['parser'], "sheets": layout['sheets']}, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+async def save_detected_column_layout(company_id: str, saved_layout: Optional[Dict[str, Any]], detected_layout: Optional[Dict[str, Any]]):
+    """Store the layout the parser used for the next upload; pinned layouts are kept as they are"""
+    if not detected_layout or (saved_layout and saved_layout.get('pinned')):
+        return
+    if (saved_layout and saved_layout['parser'] == detected_layout['parser']
+            and saved_layout['sheets'] == detected_layout['sheets']):
+        return
+    await db.column_layouts.update_one(
+        {"company_id": company_id},
+        {"$set": ColumnLayout(company_id=company_id, **detected_layout).dict()},
+        upsert=True
+    )
+    logger.info(f"Saved detected column layout for company {company_id}")
+
+async def get_documents_by_ids(collection, ids: List[str], projection: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Fetch documents by their `id` field with a single $in query, keyed by id"""
+    unique_ids = list(dict.fromkeys(i for i in ids if i))
+    if not unique_ids:
+        return {}
+
+    # _id alanı hiçbir zaman döndürülmez, id alanı her zaman döndürülür
+    if projection:
+        mongo_projection = {field: 1 for field in projection}
+        mongo_projection["id"] = 1
+        mongo_projection["_id"] = 0
+    else:
+        mongo_projection = {"_id": 0}
+
+    documents = await collection.find({"id": {"$in": unique_ids}}, mongo_projection).to_list(None)
+    return {document["id"]: document for document in documents}
+
+async def resolve_display_rate(display_currency: Optional[str]) -> Optional[float]:
+    """TRY value of one unit of the display currency, from a single rate snapshot"""
+    if not display_currency:
+        return None
+    
+    rates = await currency_service.get_rates_snapshot()
+    rate = rates.get(display_currency.upper())
+    if not rate or rate <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Geçersiz gösterim para birimi. Geçerli seçenekler: {', '.join(sorted(rates.keys()))}"
+        )
+    return float(rate)
+
+def display_price_expression(field_path: str, rate: float) -> Dict[str, Any]:
+    """Aggregation expression converting a TRY price field to the display currency (null-safe)"""
+    return {"$cond": [
+        {"$eq": [{"$ifNull": [field_path, None]}, None]},
+        None,
+        {"$round": [{"$divide": [field_path, rate]}, 2]}
+    ]}
+
+def convert_from_try_value(value, rate: float) -> Optional[float]:
+    """Python counterpart of display_price_expression for already loaded documents"""
+    if value is None:
+        return None
+    return round(float(value) / rate, 2)
+
 # Color-based Excel parsing service
+# Renk sınıflandırma kuralları - sıra önemli, ilk eşleşen kategori kazanır
+FILL_RGB_RULES = [
+    ('RED', re.compile('FFFF0000|FF0000|CC0000')),  # Kırmızı = Ürün Adı
+    ('BLUE', re.compile('FF0070C0|0070C0|0000FF|4472C4')),  # Mavi = Ürün Açıklaması
+    ('ORANGE', re.compile('FFFFC000|FFF4B183|F4B183|FF7F00|FFA500|FF8C00|FFFF9900|FF9900')),  # Turuncu = İndirimli Fiyat
+    ('YELLOW', re.compile('FFFFFF00|FFFF00|FFC000')),  # Sarı = Marka
+    ('GREEN', re.compile('FF00B050|00B050|00FF00|008000')),  # Yeşil = Liste Fiyatı
+]
+
+# Excel theme color mappings (9: bu dosyalarda hem yeşil hem turuncu olabilir, varsayılan turuncu)
+FILL_THEME_CATEGORIES = {2: 'RED', 4: 'BLUE', 5: 'YELLOW', 6: 'GREEN', 7: 'ORANGE', 9: 'ORANGE'}
+
+# Excel'in standart renk indeksleri (9: İNDİRİMLİ fiyat için kullanılıyor)
+FILL_INDEX_CATEGORIES = {
+    '10': 'RED', '3': 'RED',
+    '12': 'BLUE', '5': 'BLUE',
+    '13': 'YELLOW', '6': 'YELLOW',
+    '11': 'GREEN', '4': 'GREEN',
+    '46': 'ORANGE', '53': 'ORANGE', '9': 'ORANGE'
+}
+
+class FillColorTable:
+    """Per-workbook memo of fill -> color category
+
+    Workbooks reuse a handful of fill styles, so each distinct fill is classified once:
+    cells are looked up by the fill id of the shared style table, fills by their
+    (rgb, theme, index, tint) color key.
+    """
+
+    def __init__(self):
+        self.by_fill_id: Dict[int, str] = {}
+        self.by_color_key: Dict[tuple, Dict[str, Any]] = {}
+
+    def classify_cell(self, cell) -> str:
+        """Color category of a cell; empty cells past the row end have no style"""
+        style_array = getattr(cell, 'style_array', None)
+        if style_array is None:
+            return self.classify_fill(getattr(cell, 'fill', None))
+
+        fill_id = style_array.fillId
+        category = self.by_fill_id.get(fill_id)
+        if category is None:
+            category = self.by_fill_id[fill_id] = self.classify_fill(cell.fill, fill_id)
+        return category
+
+    def classify_fill(self, fill, fill_id: Optional[int] = None) -> str:
+        """Color category of a fill, classified once per distinct color key"""
+        if not fill or not hasattr(fill, 'start_color'):
+            return 'NONE'
+
+        color = fill.start_color
+        # Renk tipine göre yalnızca dolu alan anahtara girer (rgb / theme / indexed)
+        color_type = getattr(color, 'type', None)
+        value = getattr(color, 'value', None)
+        key = (
+            value if color_type == 'rgb' else None,
+            value if color_type == 'theme' else None,
+            value if color_type == 'indexed' else None,
+            getattr(color, 'tint', None)
+        )
+        entry = self.by_color_key.get(key)
+        if entry is None:
+            entry = self.by_color_key[key] = {
+                "rgb": key[0],
+                "theme": key[1],
+                "index": key[2],
+                "tint": key[3],
+                "category": ColorBasedExcelService.classify_color(color),
+                "fill_ids": []
+            }
+            logger.debug(f"Classified fill {key} -> {entry['category']}")
+        if fill_id is not None and fill_id not in entry['fill_ids']:
+            entry['fill_ids'].append(fill_id)
+        return entry['category']
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Distinct fills seen in the workbook with their category, for the upload summary"""
+        return [dict(entry, fill_ids=sorted(entry['fill_ids'])) for entry in self.by_color_key.values()]
+
+def open_excel_source(source: Union[str, bytes]):
+    """Workbook source for openpyxl/pandas: a spooled upload path as is, raw bytes wrapped in a buffer"""
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+# Kaydedilen kolon eşlemesindeki roller (renk tabanlı ayrıştırıcı)
+COLUMN_LAYOUT_ROLES = ('product_name', 'description', 'brand', 'company', 'list_price', 'discounted_price')
+
+def build_header_fingerprint(values) -> str:
+    """Stable hash of a header row's cell texts, to recognise a supplier layout on later uploads"""
+    return hashlib.sha1("\x1f".join(values).encode('utf-8')).hexdigest()
+
 class ColorBasedExcelService:
+    # Başlık satırı yalnızca ilk satırlarda aranır
+    HEADER_SEARCH_ROWS = 20
+    # Renk eşlemesi için incelenen başlık hücresi sayısı
+    HEADER_COLUMNS = 15
+    
     @staticmethod
     def detect_color_category(fill):
         """Detect color category from cell fill"""
         if not fill or not hasattr(fill, 'start_color'):
             return 'NONE'
-            
-        color = fill.start_color
-        
+        return ColorBasedExcelService.classify_color(fill.start_color)
+    
+    @staticmethod
+    def classify_color(color) -> str:
+        """Classify a fill color with the precompiled RGB, theme and index rules"""
         # RGB renk kontrolü
-        if hasattr(color, 'rgb') and color.rgb:
-            try:
-                rgb = str(color.rgb).upper()
-                
-                # Debug için
-                logger.debug(f"Checking RGB: {rgb}")
-                
-                # Kırmızı tonları (Ürün Adı) - FFFF0000 formatını kontrol et
-                if 'FFFF0000' in rgb or 'FF0000' in rgb or 'CC0000' in rgb:
-                    return 'RED'
-                # Mavi tonları (Ürün Açıklaması) - özel mavi tonları
-                elif 'FF0070C0' in rgb or '0070C0' in rgb or '0000FF' in rgb or '4472C4' in rgb:
-                    return 'BLUE'  
-                # Turuncu tonları (İndirimli Fiyat) - Önce daha spesifik kontroller
-                elif ('FFFFC000' in rgb or 'FFF4B183' in rgb or 'F4B183' in rgb or 'FF7F00' in rgb or 'FFA500' in rgb or 
-                      'FF8C00' in rgb or 'FFFF9900' in rgb or 'FF9900' in rgb):
-                    return 'ORANGE'
-                # Sarı tonları (Firma) - FFFFFF00 formatını kontrol et
-                elif 'FFFFFF00' in rgb or 'FFFF00' in rgb or 'FFC000' in rgb:
-                    return 'YELLOW'
-                # Yeşil tonları (Liste Fiyatı) - FF00B050 formatını kontrol et
-                elif 'FF00B050' in rgb or '00B050' in rgb or '00FF00' in rgb or '008000' in rgb:
-                    return 'GREEN'
-                    
-            except Exception as e:
-                logger.warning(f"RGB parsing error: {e}")
-                
+        rgb = getattr(color, 'rgb', None)
+        if rgb:
+            rgb = str(rgb).upper()
+            for category, pattern in FILL_RGB_RULES:
+                if pattern.search(rgb):
+                    return category
+        
         # Theme color kontrolü (Excel'de theme color kullanıldığında)
-        if hasattr(color, 'theme') and color.theme is not None:
-            try:
-                theme = color.theme
-                logger.debug(f"Checking theme color: {theme}")
-                
-                # Excel theme color mappings
-                if theme == 2:  # Theme color 2 genelde koyu kırmızı
-                    return 'RED'
-                elif theme == 4:  # Theme color 4 genelde mavi
-                    return 'BLUE'  
-                elif theme == 5:  # Theme color 5 genelde sarı/accent
-                    return 'YELLOW'
-                elif theme == 6:  # Theme color 6 genelde yeşil
-                    return 'GREEN'
-                elif theme == 9:  # Theme color 9 - özel durum: hem yeşil hem turuncu olabilir
-                    return 'ORANGE'  # Varsayılan turuncu, ama yeşil de olabilir
-                elif theme == 7:  # Theme color 7 genelde turuncu
-                    return 'ORANGE'
-                    
-            except Exception as e:
-                logger.warning(f"Theme color parsing error: {e}")
-                
+        theme = getattr(color, 'theme', None)
+        if theme is not None and theme in FILL_THEME_CATEGORIES:
+            return FILL_THEME_CATEGORIES[theme]
+        
         # Index renk kontrolü
-        if hasattr(color, 'index') and color.index:
-            try:
-                index = str(color.index)
-                logger.debug(f"Checking color index: {index}")
-                # Excel'in standart renk indeksleri
-                if index in ['10', '3']:  # Kırmızı
-                    return 'RED' 
-                elif index in ['12', '5']:  # Mavi
-                    return 'BLUE'
-                elif index in ['13', '6']:  # Sarı
-                    return 'YELLOW'
-                elif index in ['11', '4']:  # Yeşil
-                    return 'GREEN'
-                elif index in ['46', '53']:  # Turuncu
-                    return 'ORANGE'
-                elif index == '9':  # Bu dosyada index 9 İNDİRİMLİ fiyat için kullanılıyor
-                    return 'ORANGE'
-            except Exception as e:
-                logger.warning(f"Index parsing error: {e}")
-                
+        index = getattr(color, 'index', None)
+        if index:
+            return FILL_INDEX_CATEGORIES.get(str(index), 'NONE')
+        
         return 'NONE'
     
     @staticmethod
-    def parse_colored_excel(file_content: bytes, company_name: str = "Unknown") -> List[Dict[str, Any]]:
-        """Parse Excel file using color-based column detection"""
+    def parse_colored_excel(source: Union[str, bytes], company_name: str = "Unknown",
+                            color_table: Optional[FillColorTable] = None,
+                            saved_layout: Optional[Dict[str, Any]] = None,
+                            detected_layout: Optional[List[Dict[str, Any]]] = None,
+                            sheet_names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Parse Excel file using color-based column detection
+
+        The workbook is opened in read-only mode and every sheet is streamed row by row,
+        so memory stays flat no matter how many rows the price list has. Pass a
+        FillColorTable to inspect the fills that were classified, sheet_names to parse
+        only those sheets.
+
+        saved_layout is the company's stored column layout: a sheet whose header row still has the
+        saved fingerprint (or any sheet of a pinned layout) skips header detection. The layout of
+        every sheet parsed with a header row is appended to detected_layout.
+        """
+        workbook = None
+        if color_table is None:
+            color_table = FillColorTable()
+        saved_sheets = {}
+        if saved_layout and saved_layout.get('parser') == 'color':
+            saved_sheets = {sheet['sheet']: sheet for sheet in saved_layout.get('sheets', [])}
+        pinned = bool(saved_layout and saved_layout.get('pinned'))
         try:
-            # Load workbook with data_only=True to get formula results
-            workbook = openpyxl.load_workbook(io.BytesIO(file_content), data_only=True)
+            # read_only: satırlar XML'den akış halinde okunur, stiller paylaşılan stil tablosundan çözülür
+            workbook = openpyxl.load_workbook(open_excel_source(source), read_only=True, data_only=True)
             all_products = []
             
-            logger.info(f"Processing Excel with {len(workbook.sheetnames)} sheets: {workbook.sheetnames}")
+            selected_sheets = [name for name in workbook.sheetnames if sheet_names is None or name in sheet_names]
+            logger.info(f"Processing Excel with {len(selected_sheets)} of {len(workbook.sheetnames)} sheets: {selected_sheets}")
             
-            for sheet_name in workbook.sheetnames:
+            for sheet_name in selected_sheets:
                 logger.info(f"Processing sheet: {sheet_name}")
                 sheet = workbook[sheet_name]
+                # Dosyadaki <dimension> etiketi hatalı olabilir, gerçek satırların tamamını oku
+                sheet.reset_dimensions()
+                rows = sheet.iter_rows()
+                saved_sheet = saved_sheets.get(sheet_name)
                 
-                # Find header row by looking for colored cells
-                header_row = ColorBasedExcelService._find_colored_header_row(sheet)
-                if header_row == -1:
-                    logger.warning(f"No header found in sheet {sheet_name}, trying to analyze first row as data")
-                    # Header yoksa direkt 0. satırı data olarak kabul et ve renkleri analiz et
-                    column_mapping = ColorBasedExcelService._analyze_data_row_colors(sheet, 0)
-                    if all(val == -1 for val in column_mapping.values()):
-                        logger.warning(f"No colored columns found in {sheet_name}, skipping")
-                        continue
-                    header_row = -1  # Data başlangıcı için -1 kullan
+                # Başlık araması için yalnızca ilk satırlar bellekte tutulur
+                head_row_count = ColorBasedExcelService.HEADER_SEARCH_ROWS
+                if saved_sheet:
+                    head_row_count = max(head_row_count, saved_sheet['header_row'] + 1)
+                head_rows = list(islice(rows, head_row_count))
+                
+                # Kayıtlı eşleme geçerliyse başlık tespiti atlanır
+                column_mapping = None
+                if saved_sheet:
+                    column_mapping = ColorBasedExcelService._apply_saved_layout(head_rows, saved_sheet, pinned, color_table)
+                if column_mapping is not None:
+                    header_row = saved_sheet['header_row']
+                    logger.info(f"Using saved column layout for sheet {sheet_name} (header row {header_row + 1})")
                 else:
-                    logger.info(f"Found colored header at row {header_row + 1}")
-                    # Analyze header colors to map columns
-                    column_mapping = ColorBasedExcelService._analyze_header_colors(sheet, header_row)
+                    # Find header row by looking for colored cells
+                    header_row = ColorBasedExcelService._find_colored_header_row(head_rows, color_table)
+                    if header_row == -1:
+                        logger.warning(f"No header found in sheet {sheet_name}, trying to analyze first row as data")
+                        # Header yoksa direkt 0. satırı data olarak kabul et ve renkleri analiz et
+                        first_row = head_rows[0] if head_rows else ()
+                        column_mapping = ColorBasedExcelService._analyze_data_row_colors(first_row, color_table)
+                        if all(val == -1 for val in column_mapping.values()):
+                            logger.warning(f"No colored columns found in {sheet_name}, skipping")
+                            continue
+                        header_row = -1  # Data başlangıcı için -1 kullan
+                    else:
+                        logger.info(f"Found colored header at row {header_row + 1}")
+                        # Analyze header colors to map columns
+                        column_mapping = ColorBasedExcelService._analyze_header_colors(head_rows[header_row], color_table)
                 
                 logger.info(f"Column mapping: {column_mapping}")
+                if detected_layout is not None and 0 <= header_row < len(head_rows):
+                    detected_layout.append({
+                        "sheet": sheet_name,
+                        "header_row": header_row,
+                        "columns": {role: column_mapping[role] for role in COLUMN_LAYOUT_ROLES},
+                        "currency": column_mapping['currency'],
+                        "header_fingerprint": ColorBasedExcelService._header_fingerprint(head_rows[header_row], color_table)
+                    })
+                
+                # Start row hesaplama: header varsa header_row + 1, yoksa 0
+                start_row = 0 if header_row == -1 else header_row + 1
+                data_rows = chain(head_rows[start_row:], rows)
                 
                 # Extract products from this sheet
-                sheet_products = ColorBasedExcelService._extract_products_from_sheet(
-                    sheet, header_row, column_mapping, company_name
+                sheet_products = ColorBasedExcelService._extract_products_from_rows(
+                    data_rows, start_row, column_mapping, company_name, color_table
                 )
                 
                 logger.info(f"Extracted {len(sheet_products)} products from {sheet_name}")
@@ -842,19 +1969,48 @@ class ColorBasedExcelService:
         except Exception as e:
             logger.error(f"Error in color-based Excel parsing: {e}")
             raise HTTPException(status_code=400, detail=f"Renkli Excel dosyası işlenemedi: {str(e)}")
+        finally:
+            if workbook is not None:
+                workbook.close()
+    
+    @staticmethod
+    def _cell_at(row, col_idx: int):
+        """Return the cell at a zero-based column of a streamed row, None past the row end"""
+        return row[col_idx] if col_idx < len(row) else None
+    
+    @staticmethod
+    def _header_fingerprint(header_cells, color_table: FillColorTable) -> str:
+        """Fingerprint of the mapped header cells: text and color category of each"""
+        return build_header_fingerprint(
+            f"{str(cell.value).strip() if cell.value is not None else ''}|{color_table.classify_cell(cell)}"
+            for cell in header_cells[:ColorBasedExcelService.HEADER_COLUMNS]
+        )
+    
+    @staticmethod
+    def _apply_saved_layout(head_rows, saved_sheet: Dict[str, Any], pinned: bool,
+                            color_table: FillColorTable) -> Optional[Dict[str, Any]]:
+        """Column mapping of a saved sheet layout, None when the header row no longer matches it"""
+        header_row = saved_sheet['header_row']
+        if not pinned:
+            if not 0 <= header_row < len(head_rows):
+                return None
+            fingerprint = ColorBasedExcelService._header_fingerprint(head_rows[header_row], color_table)
+            if fingerprint != saved_sheet.get('header_fingerprint'):
+                logger.info(f"Header of sheet {saved_sheet['sheet']} changed, detecting columns again")
+                return None
+        column_mapping = {role: saved_sheet['columns'].get(role, -1) for role in COLUMN_LAYOUT_ROLES}
+        column_mapping['currency'] = saved_sheet.get('currency') or 'TRY'
+        return column_mapping
     
     @staticmethod
-    def _find_colored_header_row(sheet) -> int:
+    def _find_colored_header_row(head_rows, color_table: FillColorTable) -> int:
         """Find the header row with colored cells"""
-        max_search_rows = min(20, sheet.max_row)
-        
-        for row_idx in range(max_search_rows):
+        for row_idx, row in enumerate(head_rows):
             colored_cells = 0
             non_empty_cells = 0
             meaningful_cells = 0
             
-            for col_idx in range(min(10, sheet.max_column)):
-                cell = sheet.cell(row=row_idx + 1, column=col_idx + 1)
+            for cell in row[:10]:
                 if cell.value and str(cell.value).strip():
                     cell_text = str(cell.value).strip().lower()
                     non_empty_cells += 1
@@ -863,8 +2019,8 @@ class ColorBasedExcelService:
                     if any(word in cell_text for word in ['ürün', 'ad', 'açık', 'marka', 'firma', 'fiyat', 'price', 'name']):
                         meaningful_cells += 1
                     
-                    color_category = ColorBasedExcelService.detect_color_category(cell.fill)
-                    logger.debug(f"Row {row_idx + 1}, Col {col_idx + 1}: '{cell_text}' -> {color_category}")
+                    color_category = color_table.classify_cell(cell)
+                    logger.debug(f"Row {row_idx + 1}: '{cell_text}' -> {color_category}")
                     if color_category != 'NONE':
                         colored_cells += 1
             
@@ -875,10 +2031,9 @@ class ColorBasedExcelService:
                 return row_idx
         
         # Fallback: Anlamlı kelimeler içeren satırı bul
-        for row_idx in range(max_search_rows):
+        for row_idx, row in enumerate(head_rows):
             meaningful_cells = 0
-            for col_idx in range(min(10, sheet.max_column)):
-                cell = sheet.cell(row=row_idx + 1, column=col_idx + 1)
+            for cell in row[:10]:
                 if cell.value:
                     cell_text = str(cell.value).strip().lower()
                     if any(word in cell_text for word in ['ürün', 'ad', 'açık', 'marka', 'firma', 'fiyat']):
@@ -917,7 +2072,7 @@ class ColorBasedExcelService:
             return 'TRY'
 
     @staticmethod
-    def _analyze_header_colors(sheet, header_row: int) -> Dict[str, int]:
+    def _analyze_header_colors(header_cells, color_table: FillColorTable) -> Dict[str, int]:
         """Analyze header colors and map to column purposes - ONLY COLOR-BASED"""
         column_mapping = {
             'product_name': -1,
@@ -929,12 +2084,11 @@ class ColorBasedExcelService:
             'currency': 'TRY'  # Varsayılan döviz
         }
         
-        for col_idx in range(min(15, sheet.max_column)):
-            cell = sheet.cell(row=header_row + 1, column=col_idx + 1)
+        for col_idx, cell in enumerate(header_cells[:ColorBasedExcelService.HEADER_COLUMNS]):
             if not cell.value:
                 continue
                 
-            color_category = ColorBasedExcelService.detect_color_category(cell.fill)
+            color_category = color_table.classify_cell(cell)
             
             # SADECE renk kategorilerine göre kolon belirleme - text-based fallback YOK
             if color_category == 'RED':  # Kırmızı = Ürün Adı
@@ -956,7 +2110,7 @@ class ColorBasedExcelService:
         return column_mapping
     
     @staticmethod
-    def _analyze_data_row_colors(sheet, data_row: int) -> Dict[str, int]:
+    def _analyze_data_row_colors(row_cells, color_table: FillColorTable) -> Dict[str, int]:
         """Analyze first data row colors when no header is found - ONLY COLOR-BASED"""
         column_mapping = {
             'product_name': -1,
@@ -968,12 +2122,11 @@ class ColorBasedExcelService:
             'currency': 'TRY'  # Header yoksa varsayılan TRY
         }
         
-        for col_idx in range(min(15, sheet.max_column)):
-            cell = sheet.cell(row=data_row + 1, column=col_idx + 1)
+        for col_idx, cell in enumerate(row_cells[:15]):
             if not cell.value:
                 continue
                 
-            color_category = ColorBasedExcelService.detect_color_category(cell.fill)
+            color_category = color_table.classify_cell(cell)
             
             # SADECE renk kategorilerine göre kolon belirleme - text-based fallback YOK
             if color_category == 'RED':  # Kırmızı = Ürün Adı
@@ -993,16 +2146,14 @@ class ColorBasedExcelService:
         return column_mapping
     
     @staticmethod
-    def _extract_products_from_sheet(sheet, header_row: int, column_mapping: Dict[str, int], company_name: str) -> List[Dict[str, Any]]:
-        """Extract products from a sheet using column mapping"""
+    def _extract_products_from_rows(rows, start_row: int, column_mapping: Dict[str, int], company_name: str,
+                                    color_table: FillColorTable) -> List[Dict[str, Any]]:
+        """Extract products from streamed sheet rows using column mapping"""
         import random
         products = []
+        cell_at = ColorBasedExcelService._cell_at
         
-        # Start row hesaplama: header varsa header_row + 1, yoksa 0
-        start_row = 0 if header_row == -1 else header_row + 1
-        
-        # Start from the appropriate row
-        for row_idx in range(start_row, sheet.max_row):
+        for row_idx, row in enumerate(rows, start=start_row):
             try:
                 # Extract data based on column mapping
                 product_name = ""
@@ -1014,23 +2165,23 @@ class ColorBasedExcelService:
                 
                 # Ürün adı (Kırmızı) - SADECE kırmızı hücre kabul edilir
                 if column_mapping['product_name'] >= 0:
-                    name_cell = sheet.cell(row=row_idx + 1, column=column_mapping['product_name'] + 1)
-                    if (name_cell.value and 
-                        ColorBasedExcelService.detect_color_category(name_cell.fill) == 'RED'):
+                    name_cell = cell_at(row, column_mapping['product_name'])
+                    if (name_cell is not None and name_cell.value and 
+                        color_table.classify_cell(name_cell) == 'RED'):
                         product_name = str(name_cell.value).strip()
 
                 # Açıklama (Mavi) - SADECE mavi hücre kabul edilir
                 if column_mapping['description'] >= 0:
-                    desc_cell = sheet.cell(row=row_idx + 1, column=column_mapping['description'] + 1)
-                    if (desc_cell.value and 
-                        ColorBasedExcelService.detect_color_category(desc_cell.fill) == 'BLUE'):
+                    desc_cell = cell_at(row, column_mapping['description'])
+                    if (desc_cell is not None and desc_cell.value and 
+                        color_table.classify_cell(desc_cell) == 'BLUE'):
                         description = str(desc_cell.value).strip()
 
                 # Marka (Sarı) - SADECE sarı hücre kabul edilir
                 if column_mapping['brand'] >= 0:
-                    brand_cell = sheet.cell(row=row_idx + 1, column=column_mapping['brand'] + 1)
-                    if (brand_cell.value and 
-                        ColorBasedExcelService.detect_color_category(brand_cell.fill) == 'YELLOW'):
+                    brand_cell = cell_at(row, column_mapping['brand'])
+                    if (brand_cell is not None and brand_cell.value and 
+                        color_table.classify_cell(brand_cell) == 'YELLOW'):
                         brand_value = str(brand_cell.value).strip()
                         # Excel formülü değilse VE sayısal değer değilse kullan
                         if not brand_value.startswith('='):
@@ -1045,9 +2196,9 @@ class ColorBasedExcelService:
 
                 # Liste Fiyatı (Yeşil) - SADECE yeşil hücre kabul edilir
                 if column_mapping['list_price'] >= 0:
-                    price_cell = sheet.cell(row=row_idx + 1, column=column_mapping['list_price'] + 1)
-                    if (price_cell.value and 
-                        ColorBasedExcelService.detect_color_category(price_cell.fill) == 'GREEN'):
+                    price_cell = cell_at(row, column_mapping['list_price'])
+                    if (price_cell is not None and price_cell.value and 
+                        color_table.classify_cell(price_cell) == 'GREEN'):
                         try:
                             list_price = float(str(price_cell.value).replace(',', '.'))
                         except:
@@ -1055,9 +2206,9 @@ class ColorBasedExcelService:
 
                 # İndirimli Fiyat (Turuncu) - SADECE turuncu hücre kabul edilir
                 if column_mapping['discounted_price'] >= 0:
-                    disc_price_cell = sheet.cell(row=row_idx + 1, column=column_mapping['discounted_price'] + 1)
-                    if (disc_price_cell.value and 
-                        ColorBasedExcelService.detect_color_category(disc_price_cell.fill) == 'ORANGE'):
+                    disc_price_cell = cell_at(row, column_mapping['discounted_price'])
+                    if (disc_price_cell is not None and disc_price_cell.value and 
+                        color_table.classify_cell(disc_price_cell) == 'ORANGE'):
                         try:
                             discounted_price = float(str(disc_price_cell.value).replace(',', '.'))
                         except:
@@ -1091,20 +2242,68 @@ class ColorBasedExcelService:
         
         return products
 
+# Para birimi anahtar kelimeleri - sıra önemli: önce dolar, sonra euro, sonra TL
+CURRENCY_TEXT_KEYWORDS = [
+    ('USD', ['$', 'DOLAR', 'DOLLAR', 'USD', 'DOLAR İSARETİ', 'DOLAR IŞARETI', 'AMERİKAN DOLARI', 'AMERIKAN DOLARI']),
+    ('EUR', ['€', 'EURO', 'EUR', 'AVRO', 'AVRUPA']),
+    ('TRY', ['₺', 'TL', 'TRY', 'TÜRK', 'LIRA', 'TÜRK LİRASI', 'TURK LIRASI', 'TURKİYE', 'TURKIYE'])
+]
+CURRENCY_TEXT_PATTERNS = [
+    (currency, '|'.join(re.escape(keyword) for keyword in keywords)) for currency, keywords in CURRENCY_TEXT_KEYWORDS
+]
+CURRENCY_TEXT_ANY_PATTERN = '|'.join(pattern for _, pattern in CURRENCY_TEXT_PATTERNS)
+
+# float() ile sayıya çevrilebilecek metinlerin biçimi (1.5, -2e3, 1_000, inf, nan ...)
+FLOAT_TEXT_PATTERN = r'\s*[+-]?(?:(?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:e[+-]?\d[\d_]*)?|inf|infinity|nan)\s*'
+
+def safe_float(value) -> Optional[float]:
+    """float(value), None when float() rejects it"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
 # Excel parsing service
 class ExcelService:
     @staticmethod
-    def parse_excel_file(file_content: bytes) -> List[Dict[str, Any]]:
-        """Parse Excel file and extract product data"""
+    def parse_excel_file(source: Union[str, bytes], saved_layout: Optional[Dict[str, Any]] = None,
+                         detected_layout: Optional[List[Dict[str, Any]]] = None,
+                         sheet_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Parse Excel file (path or bytes) and extract product data
+
+        Only one sheet is read: sheet_name, or the first sheet. A saved traditional layout whose
+        header row fingerprint still matches (or a pinned one) skips the header keyword scan;
+        the header row used is appended to detected_layout.
+        """
         try:
             # Read Excel file
-            df = pd.read_excel(io.BytesIO(file_content))
+            df = pd.read_excel(open_excel_source(source), sheet_name=sheet_name if sheet_name is not None else 0)
             
             logger.info(f"Excel file loaded: {len(df)} rows, {len(df.columns)} columns")
             
-            # İlk veri satırını bul (header'ı tespit et)
-            header_row = ExcelService._find_header_row(df)
-            logger.info(f"Header row found at index: {header_row}")
+            # Kayıtlı başlık satırı hâlâ aynıysa doğrudan kullanılır
+            header_row = None
+            if saved_layout and saved_layout.get('parser') == 'traditional' and saved_layout.get('sheets'):
+                saved_sheet = saved_layout['sheets'][0]
+                if saved_sheet['header_row'] < len(df) and (
+                        saved_layout.get('pinned')
+                        or ExcelService._header_fingerprint(df, saved_sheet['header_row']) == saved_sheet.get('header_fingerprint')):
+                    header_row = saved_sheet['header_row']
+                    logger.info(f"Using saved header row: {header_row}")
+            
+            if header_row is None:
+                # İlk veri satırını bul (header'ı tespit et)
+                header_row = ExcelService._find_header_row(df)
+                logger.info(f"Header row found at index: {header_row}")
+            
+            if detected_layout is not None and header_row >= 0:
+                detected_layout.append({
+                    "sheet": sheet_name,
+                    "header_row": header_row,
+                    "columns": {},
+                    "currency": None,
+                    "header_fingerprint": ExcelService._header_fingerprint(df, header_row)
+                })
             
             if header_row == -1:
                 # Header bulunamazsa tüm kolonları kontrol et
@@ -1120,6 +2319,13 @@ class ExcelService:
             logger.error(f"Error parsing Excel file: {e}")
             raise HTTPException(status_code=400, detail=f"Excel dosyası işlenemedi: {str(e)}")
     
+    @staticmethod
+    def _header_fingerprint(df, row_idx: int) -> str:
+        """Fingerprint of a DataFrame row used as header"""
+        return build_header_fingerprint(
+            str(value).strip() if pd.notna(value) else '' for value in df.iloc[row_idx].tolist()
+        )
+    
     @staticmethod
     def _find_header_row(df) -> int:
         """Excel dosyasında header satırını bul"""
@@ -1166,54 +2372,60 @@ class ExcelService:
         """Header'sız Excel dosyasını parse et"""
         logger.info("Parsing without header, analyzing all columns...")
         
-        products = []
-        
-        # Her satırı kontrol et, veri olan satırları bul
-        for row_idx in range(len(df)):
-            row_data = {}
-            product_name = ""
-            list_price = 0
-            discounted_price = None
-            currency = "USD"  # Default currency
+        row_count = len(df)
+        product_names = np.full(row_count, "", dtype=object)
+        name_lengths = np.zeros(row_count, dtype=np.int64)
+        list_prices = np.zeros(row_count)
+        discounted_prices = np.full(row_count, np.nan)
+        currencies = np.full(row_count, "USD", dtype=object)  # Default currency
+        
+        # Satırlar birlikte işlenir, hücreler kolon kolon soldan sağa değerlendirilir
+        for col_idx in range(len(df.columns)):
+            # Kontroller yalnızca hücre metnine bağlı, her farklı metin bir kez incelenir (boş hücreler "")
+            codes, unique_texts = pd.factorize(ExcelService._text_column(df.iloc[:, col_idx]).to_numpy(dtype=object))
+            unique_texts = pd.Series(unique_texts, dtype=object)
             
-            # Bu satırdaki tüm hücreleri kontrol et
-            for col_idx in range(len(df.columns)):
-                cell_value = df.iloc[row_idx, col_idx]
-                
-                if pd.notna(cell_value):
-                    str_value = str(cell_value).strip()
-                    
-                    # Fiyat hücresi mi kontrol et (sayısal değer)
-                    try:
-                        numeric_value = float(str_value.replace(',', '.'))
-                        if 1 <= numeric_value <= 100000:  # Makul fiyat aralığı
-                            if list_price == 0:
-                                list_price = numeric_value
-                            elif discounted_price is None and numeric_value < list_price:
-                                discounted_price = numeric_value
-                    except:
-                        pass
-                    
-                    # Ürün adı hücresi mi kontrol et (text ve uzun)
-                    if len(str_value) > 10 and any(char.isalpha() for char in str_value):
-                        if not product_name or len(str_value) > len(product_name):
-                            product_name = str_value
-                    
-                    # Para birimi kontrol et - gelişmiş algılama
-                    detected_currency = ExcelService.detect_currency_from_text(str_value, None)
-                    if detected_currency:
-                        currency = detected_currency
+            # Fiyat hücresi mi kontrol et (sayısal değer, makul fiyat aralığı)
+            unique_numbers, unique_converted = ExcelService._float_column(unique_texts.str.replace(',', '.', regex=False))
+            numbers = unique_numbers[codes]
+            in_range = unique_converted[codes] & (numbers >= 1) & (numbers <= 100000)
+            takes_list_price = in_range & (list_prices == 0)
+            takes_discount = in_range & ~takes_list_price & np.isnan(discounted_prices) & (numbers < list_prices)
+            list_prices = np.where(takes_list_price, numbers, list_prices)
+            discounted_prices = np.where(takes_discount, numbers, discounted_prices)
             
-            # Geçerli ürün bilgisi var mı kontrol et
-            if product_name and list_price > 0:
-                products.append({
-                    'name': product_name,
-                    'list_price': list_price,
-                    'currency': currency,
-                    'discounted_price': discounted_price
-                })
-                logger.info(f"Extracted product: {product_name[:50]}... - ${list_price}")
+            # Ürün adı hücresi mi kontrol et (text ve uzun) - en uzun metin kazanır
+            unique_lengths = unique_texts.str.len().to_numpy()
+            unique_is_text = unique_lengths > 10
+            long_texts = unique_texts[unique_is_text]
+            has_alpha = long_texts.str.contains('[A-Za-zÇĞİÖŞÜçğıöşü]', regex=True).to_numpy(dtype=bool)
+            # Latin/Türkçe harf içermeyenler için karakter bazında kontrol
+            has_alpha[~has_alpha] = long_texts[~has_alpha].map(lambda text: any(char.isalpha() for char in text)).to_numpy(dtype=bool)
+            unique_is_text[unique_is_text] = has_alpha
+            lengths = unique_lengths[codes]
+            is_name = unique_is_text[codes] & ((name_lengths == 0) | (lengths > name_lengths))
+            product_names = np.where(is_name, unique_texts.to_numpy(dtype=object)[codes], product_names)
+            name_lengths = np.where(is_name, lengths, name_lengths)
+            
+            # Para birimi kontrol et - satırdaki son algılanan para birimi geçerli (sayı hücrelerinde işaret olmaz)
+            detected = ExcelService._detect_currency_column(unique_texts.where(~unique_converted))[codes]
+            currencies = np.where(detected != "", detected, currencies)
         
+        # Geçerli ürün bilgisi var mı kontrol et
+        valid = (name_lengths > 0) & (list_prices > 0)
+        products = [
+            {
+                'name': name,
+                'list_price': list_price,
+                'currency': currency,
+                'discounted_price': discounted_price
+            }
+            for name, list_price, currency, discounted_price in zip(
+                product_names[valid], list_prices[valid].tolist(), currencies[valid],
+                np.where(np.isnan(discounted_prices), None, discounted_prices.astype(object))[valid]
+            )
+        ]
+        logger.info(f"Extracted {len(products)} products without header")
         return products
     
     @staticmethod
@@ -1239,98 +2451,185 @@ class ExcelService:
     @staticmethod
     def _parse_elektrozirve_format(df) -> List[Dict[str, Any]]:
         """ELEKTROZİRVE formatında Excel parse et"""
-        products = []
-        
         # İlk satır header (Güneş Panelleri, LİSTE FİYATI, İskonto, Net Fiyat)
         df.columns = ['product_name', 'list_price', 'discount_rate', 'net_price']
+        columns = ExcelService._row_value_columns(df)
         
-        for index, row in df.iterrows():
-            try:
-                if index == 0:  # Header satırını atla
-                    continue
-                
-                product_name = str(row['product_name']).strip() if pd.notna(row['product_name']) else ""
-                list_price = float(row['list_price']) if pd.notna(row['list_price']) else 0
-                net_price = float(row['net_price']) if pd.notna(row['net_price']) else 0
-                
-                # Kategori başlıkları atla (örn: "Esnek Güneş Panelleri")
-                if ('panelleri' in product_name.lower() or 'aküler' in product_name.lower() or 
-                    'regülatörler' in product_name.lower()) and list_price == 0:
-                    continue
-                
-                # Geçerli ürün kontrolü
-                if (product_name and len(product_name) > 5 and 
-                    list_price > 0 and not product_name.lower().startswith('liste')):
-                    
-                    products.append({
-                        'name': product_name,
-                        'list_price': list_price,
-                        'currency': 'TRY',  # ELEKTROZİRVE TL fiyatları
-                        'discounted_price': net_price if net_price != list_price else None
-                    })
-                    logger.info(f"Added ELEKTROZİRVE product: {product_name[:50]}... - {list_price} TL")
-                    
-            except Exception as e:
-                logger.warning(f"Error processing ELEKTROZİRVE row {index}: {e}")
-                continue
+        product_names = ExcelService._text_column(columns['product_name'])
+        list_prices, list_price_converted = ExcelService._float_column(columns['list_price'])
+        net_prices, net_price_converted = ExcelService._float_column(columns['net_price'])
         
+        # Header satırı ve sayıya çevrilemeyen fiyatı olan satırlar atlanır
+        readable = (
+            (np.asarray(df.index) != 0)
+            & ~(columns['list_price'].notna().to_numpy() & ~list_price_converted)
+            & ~(columns['net_price'].notna().to_numpy() & ~net_price_converted)
+        )
+        list_prices = np.where(list_price_converted, list_prices, 0)
+        net_prices = np.where(net_price_converted, net_prices, 0)
+        
+        # Geçerli ürün kontrolü (kategori başlıklarının fiyatı yoktur, bu kontrolde elenir)
+        valid = (
+            readable
+            & (product_names.str.len().to_numpy() > 5)
+            & (list_prices > 0)
+            & ~product_names.str.lower().str.startswith('liste').to_numpy(dtype=bool)
+        )
+        products = [
+            {
+                'name': name,
+                'list_price': list_price,
+                'currency': 'TRY',  # ELEKTROZİRVE TL fiyatları
+                'discounted_price': net_price if net_price != list_price else None
+            }
+            for name, list_price, net_price in zip(
+                product_names.to_numpy(dtype=object)[valid], list_prices[valid].tolist(), net_prices[valid].tolist()
+            )
+        ]
+        logger.info(f"Added {len(products)} ELEKTROZİRVE products")
         return products
     
     @staticmethod
     def _parse_havensis_format(df) -> List[Dict[str, Any]]:
         """HAVENSİS formatında Excel parse et"""
-        products = []
-        
         # HAVENSİS formatı: Col3=Ürün, Col6=Fiyat$, Col7=İskonto, Col8=İskontolu Fiyat$
         product_col = 3
         price_col = 6
-        discount_rate_col = 7
         discounted_price_col = 8
         
-        for index, row in df.iterrows():
-            try:
-                if index < 12:  # İlk 12 satır header/boş satırlar
-                    continue
-                
-                # Ürün adı (Col3)
-                product_name = ""
-                if len(row) > product_col and pd.notna(row.iloc[product_col]):
-                    product_name = str(row.iloc[product_col]).strip()
-                
-                # Liste fiyatı (Col6)
-                list_price = 0
-                if len(row) > price_col and pd.notna(row.iloc[price_col]):
-                    try:
-                        list_price = float(row.iloc[price_col])
-                    except:
-                        list_price = 0
-                
-                # İndirimli fiyat (Col8)
-                discounted_price = None
-                if len(row) > discounted_price_col and pd.notna(row.iloc[discounted_price_col]):
-                    try:
-                        discounted_price = float(row.iloc[discounted_price_col])
-                    except:
-                        discounted_price = None
-                
-                # Geçerli ürün kontrolü
-                if (product_name and len(product_name) > 10 and 
-                    list_price > 0 and 'panel' in product_name.lower()):
-                    
-                    products.append({
-                        'name': product_name,
-                        'list_price': list_price,
-                        'currency': 'USD',  # HAVENSİS USD fiyatları
-                        'discounted_price': discounted_price
-                    })
-                    logger.info(f"Added HAVENSİS product: {product_name[:50]}... - ${list_price}")
-                    
-            except Exception as e:
-                logger.warning(f"Error processing HAVENSİS row {index}: {e}")
-                continue
-        
+        columns = ExcelService._row_value_columns(df, by_position=True)
+        row_count = len(df)
+        
+        # Ürün adı (Col3)
+        product_names = pd.Series("", index=range(row_count), dtype=object)
+        if len(columns) > product_col:
+            product_names = ExcelService._text_column(columns[product_col])
+        
+        # Liste fiyatı (Col6)
+        list_prices = np.zeros(row_count)
+        if len(columns) > price_col:
+            prices, converted = ExcelService._float_column(columns[price_col])
+            list_prices = np.where(converted, prices, 0)
+        
+        # İndirimli fiyat (Col8)
+        discounted_prices = np.full(row_count, None, dtype=object)
+        if len(columns) > discounted_price_col:
+            prices, converted = ExcelService._float_column(columns[discounted_price_col])
+            discounted_prices = np.where(converted, prices.astype(object), None)
+        
+        # İlk 12 satır header/boş satırlar; geçerli ürün kontrolü
+        valid = (
+            (np.asarray(df.index) >= 12)
+            & (product_names.str.len().to_numpy() > 10)
+            & (list_prices > 0)
+            & product_names.str.lower().str.contains('panel', regex=False).to_numpy(dtype=bool)
+        )
+        products = [
+            {
+                'name': name,
+                'list_price': list_price,
+                'currency': 'USD',  # HAVENSİS USD fiyatları
+                'discounted_price': discounted_price
+            }
+            for name, list_price, discounted_price in zip(
+                product_names.to_numpy(dtype=object)[valid], list_prices[valid].tolist(), discounted_prices[valid]
+            )
+        ]
+        logger.info(f"Added {len(products)} HAVENSİS products")
         return products
     
+    @staticmethod
+    def _row_value_columns(df, by_position: bool = False):
+        """Columns of the values a row-wise read (iterrows) sees, as positional Series
+
+        Row-wise reads interleave dtypes (e.g. int becomes float in an all-numeric sheet),
+        so the columns are cut from df.values to keep the same cell values.
+        """
+        values = df.to_numpy()
+        columns = [pd.Series(values[:, col_idx]) for col_idx in range(values.shape[1])]
+        if by_position:
+            return columns
+        return dict(zip(df.columns, columns))
+    
+    @staticmethod
+    def _text_column(column) -> pd.Series:
+        """str(cell).strip() for every cell of a column, "" for empty cells"""
+        column = column.reset_index(drop=True)
+        return column.astype(object).where(column.notna(), "").astype(str).str.strip()
+    
+    @staticmethod
+    def _float_column(column) -> Tuple[np.ndarray, np.ndarray]:
+        """float(cell) for every cell of a column: (values, converted)
+
+        converted is False for empty cells and for cells float() rejects. Numbers go through
+        pd.to_numeric; text cells are converted with float() itself, which pd.to_numeric does
+        not match exactly (rounding of long decimals, '1_000').
+        """
+        column = column.reset_index(drop=True)
+        if pd.api.types.is_numeric_dtype(column.dtype):
+            values = column.to_numpy(dtype=float, na_value=np.nan)
+            return values, ~np.isnan(values)
+        if column.dtype.kind in 'mM':
+            # Tarih hücreleri float() ile çevrilemez
+            return np.full(len(column), np.nan), np.zeros(len(column), dtype=bool)
+        
+        kind = pd.api.types.infer_dtype(column, skipna=True)
+        if kind == 'string':
+            values = np.full(len(column), np.nan)
+            converted = np.zeros(len(column), dtype=bool)
+            is_text = column.notna().to_numpy()
+        else:
+            values = pd.to_numeric(column, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            converted = ~np.isnan(values)
+            is_text = np.zeros(len(column), dtype=bool)
+            if kind in ('mixed', 'mixed-integer'):
+                is_text = column.str.len().notna().to_numpy()
+                values[is_text] = np.nan
+                converted[is_text] = False
+        if kind == 'string' and is_text.all():
+            # Tamamı sayı metni olan kolonlar tek seferde çevrilir
+            try:
+                return column.astype(float).to_numpy(), np.ones(len(column), dtype=bool)
+            except ValueError:
+                pass
+        if is_text.any():
+            candidates = is_text & column.str.fullmatch(FLOAT_TEXT_PATTERN, case=False).to_numpy(dtype=bool, na_value=False)
+            if candidates.any():
+                texts = column[candidates]
+                try:
+                    values[candidates] = texts.astype(float).to_numpy()
+                    converted[candidates] = True
+                except ValueError:
+                    parsed = [safe_float(text) for text in texts]
+                    values[candidates] = [np.nan if value is None else value for value in parsed]
+                    converted[candidates] = [value is not None for value in parsed]
+        return values, converted
+    
+    @staticmethod
+    def _detect_currency_column(column, fallback_currency: str = "") -> np.ndarray:
+        """detect_currency_from_text for every cell of a column; fallback for empty cells and where nothing matches"""
+        kind = pd.api.types.infer_dtype(column, skipna=True)
+        if kind in ('floating', 'integer', 'mixed-integer-float', 'boolean', 'empty'):
+            # Sayı hücrelerinin metninde para birimi işareti bulunmaz
+            return np.full(len(column), fallback_currency, dtype=object)
+        
+        # Kolonlarda aynı değer çok tekrar eder (marka, birim), her farklı değer bir kez kontrol edilir
+        codes, unique_values = pd.factorize(np.asarray(column, dtype=object))
+        texts = pd.Series(unique_values, dtype=object)
+        if kind != 'string':
+            texts = texts.astype(str)
+        upper_texts = texts.str.upper()
+        detected = np.full(len(unique_values) + 1, fallback_currency, dtype=object)  # son eleman boş hücreler için
+        has_keyword = np.append(upper_texts.str.contains(CURRENCY_TEXT_ANY_PATTERN, regex=True).to_numpy(dtype=bool), False)
+        if has_keyword.any():
+            upper_texts = upper_texts[has_keyword[:-1]]
+            conditions = [
+                upper_texts.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+                for _, pattern in CURRENCY_TEXT_PATTERNS
+            ]
+            detected[has_keyword] = np.select(conditions, [currency for currency, _ in CURRENCY_TEXT_PATTERNS], default=fallback_currency)
+        return detected[codes]
+    
     @staticmethod
     def detect_currency_from_text(text: str, fallback_currency: str = 'USD') -> str:
         """Detect currency from any text (header, cell value, etc.)"""
@@ -1339,28 +2638,26 @@ class ExcelService:
             
         text = str(text).upper().strip()
         
-        # Dolar kontrolü - gelişmiş
-        dollar_keywords = ['$', 'DOLAR', 'DOLLAR', 'USD', 'DOLAR İSARETİ', 'DOLAR IŞARETI', 'AMERİKAN DOLARI', 'AMERIKAN DOLARI']
-        if any(keyword in text for keyword in dollar_keywords):
-            return 'USD'
-        
-        # Euro kontrolü - gelişmiş
-        euro_keywords = ['€', 'EURO', 'EUR', 'AVRO', 'AVRUPA']
-        if any(keyword in text for keyword in euro_keywords):
-            return 'EUR'
-        
-        # TL kontrolü - gelişmiş
-        tl_keywords = ['₺', 'TL', 'TRY', 'TÜRK', 'LIRA', 'TÜRK LİRASI', 'TURK LIRASI', 'TURKİYE', 'TURKIYE']
-        if any(keyword in text for keyword in tl_keywords):
-            return 'TRY'
+        # Dolar, euro, TL sırasıyla kontrol
+        for currency, keywords in CURRENCY_TEXT_KEYWORDS:
+            if any(keyword in text for keyword in keywords):
+                return currency
             
         return fallback_currency
 
     @staticmethod
     def _parse_general_format(df) -> List[Dict[str, Any]]:
         """Genel format parsing"""
-        products = []
-        
+        df.columns = ExcelService._map_general_columns(df)
+        return ExcelService._extract_general_rows(df)
+    
+    @staticmethod
+    def _map_general_columns(df) -> List[str]:
+        """Role names (product_name, list_price, ...) for the columns of a general format sheet
+
+        Unmapped columns keep their normalized header. Also used for every chunk of a streamed CSV,
+        where the mapping of the first chunk is applied to the whole file.
+        """
         # Gelişmiş kolon mapping
         column_mapping = {
             # Ürün adı varyantları
@@ -1398,112 +2695,638 @@ class ExcelService:
         }
         
         # Kolonları normalize et
-        df.columns = df.columns.astype(str).str.lower().str.strip()
-        logger.info(f"Normalized columns: {list(df.columns)}")
+        normalized_columns = list(df.columns.astype(str).str.lower().str.strip())
+        columns = list(normalized_columns)
+        logger.info(f"Normalized columns: {normalized_columns}")
+        
+        def rename(old_name, new_name):
+            # Aynı isimli tüm kolonlar birlikte yeniden adlandırılır
+            return [new_name if column == old_name else column for column in columns]
         
         # Kolon mapping uygula
-        for col in df.columns:
+        for col in normalized_columns:
             for mapping_key, mapping_value in column_mapping.items():
                 if mapping_key in col:
-                    df = df.rename(columns={col: mapping_value})
+                    columns = rename(col, mapping_value)
                     logger.info(f"Mapped column '{col}' to '{mapping_value}'")
                     break
         
-        logger.info(f"Final mapped columns: {list(df.columns)}")
+        logger.info(f"Final mapped columns: {columns}")
         
-        # Eğer standart kolonlar yoksa, konum bazlı mapping dene
-        if 'product_name' not in df.columns:
+        # Eğer standart kolonlar yoksa, konum bazlı mapping dene (tekrarlanan başlıklar atlanır)
+        if 'product_name' not in columns:
             # İlk metin kolonu ürün adı olabilir
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    df = df.rename(columns={col: 'product_name'})
+            for position, col in enumerate(columns):
+                if columns.count(col) == 1 and df.iloc[:, position].dtype == 'object':
+                    columns = rename(col, 'product_name')
                     logger.info(f"Using first text column '{col}' as product_name")
                     break
         
-        if 'list_price' not in df.columns:
+        if 'list_price' not in columns:
             # İlk sayısal kolon liste fiyatı olabilir  
-            for col in df.columns:
-                if col != 'product_name' and pd.api.types.is_numeric_dtype(df[col]):
-                    df = df.rename(columns={col: 'list_price'})
+            for position, col in enumerate(columns):
+                if col != 'product_name' and columns.count(col) == 1 and pd.api.types.is_numeric_dtype(df.iloc[:, position]):
+                    columns = rename(col, 'list_price')
                     logger.info(f"Using first numeric column '{col}' as list_price")
                     break
         
-        # Ürünleri çıkar
-        for index, row in df.iterrows():
-            try:
-                # Ürün adı
-                product_name = ""
-                if 'product_name' in row:
-                    product_name = str(row['product_name']).strip() if pd.notna(row['product_name']) else ""
-                
-                # Marka (yeni)
-                brand = ""
-                if 'brand' in row and pd.notna(row['brand']):
-                    brand = str(row['brand']).strip()
-                
-                # Liste fiyatı
-                list_price = 0
-                if 'list_price' in row:
-                    try:
-                        list_price = float(row['list_price']) if pd.notna(row['list_price']) else 0
-                    except:
-                        list_price = 0
-                
-                # İndirimli fiyat
-                discounted_price = None
-                if 'discounted_price' in row and pd.notna(row['discounted_price']):
-                    try:
-                        discounted_price = float(row['discounted_price'])
-                    except:
-                        discounted_price = None
-                
-                # Para birimi algılama - gelişmiş
-                currency = "USD"  # varsayılan
-                
-                # Önce currency sütunu varsa onu kullan
-                if 'currency' in row and pd.notna(row['currency']):
-                    detected = ExcelService.detect_currency_from_text(str(row['currency']))
-                    if detected:
-                        currency = detected
-                
-                # Tüm sütunlarda para birimi işaretçilerini ara
-                for col_name, col_value in row.items():
-                    if pd.notna(col_value):
-                        cell_text = str(col_value)
-                        detected = ExcelService.detect_currency_from_text(cell_text, None)
-                        if detected:
-                            currency = detected
-                            break
-                
-                # Sütun başlıklarında da para birimi ara
-                for col_name in df.columns:
-                    detected = ExcelService.detect_currency_from_text(str(col_name), None)
-                    if detected:
-                        currency = detected
-                        break
-                
-                # Geçerli ürün kontrolü
-                if product_name and len(product_name) > 3 and list_price > 0:
-                    product = {
-                        'name': product_name,
-                        'brand': brand,  # Yeni: marka alanı
-                        'list_price': list_price,
-                        'currency': currency,
-                        'discounted_price': discounted_price
-                    }
-                    products.append(product)
-                    logger.info(f"Added product: {product_name[:50]}... - {list_price} {currency}")
-                else:
-                    logger.info(f"Skipped row {index}: name='{product_name}', price={list_price}")
-                    
-            except Exception as e:
-                logger.warning(f"Error processing row {index}: {e}")
-                continue
+        return columns
+    
+    @staticmethod
+    def _extract_general_rows(df) -> List[Dict[str, Any]]:
+        """Products of a general format sheet whose columns carry role names (see _map_general_columns)"""
+        # Aynı role birden fazla kolon eşlendiyse satır değerleri belirsizdir, ürün çıkarılamaz
+        ambiguous_roles = set(df.columns[df.columns.duplicated()]) & {
+            'product_name', 'brand', 'list_price', 'discounted_price', 'currency'
+        }
+        if ambiguous_roles:
+            logger.warning(f"Ambiguous column mapping for {sorted(ambiguous_roles)}, no products extracted")
+            return []
+        
+        # Ürünleri kolon kolon çıkar
+        value_columns = ExcelService._row_value_columns(df, by_position=True)
+        columns = dict(zip(df.columns, value_columns))
+        row_count = len(df)
+        no_text = pd.Series("", index=range(row_count), dtype=object)
+        
+        # Ürün adı ve marka
+        product_names = ExcelService._text_column(columns['product_name']) if 'product_name' in columns else no_text
+        brands = ExcelService._text_column(columns['brand']) if 'brand' in columns else no_text
+        
+        # Liste fiyatı
+        list_prices = np.zeros(row_count)
+        if 'list_price' in columns:
+            prices, converted = ExcelService._float_column(columns['list_price'])
+            list_prices = np.where(converted, prices, 0)
+        
+        # İndirimli fiyat
+        discounted_prices = np.full(row_count, None, dtype=object)
+        if 'discounted_price' in columns:
+            prices, converted = ExcelService._float_column(columns['discounted_price'])
+            discounted_prices = np.where(converted, prices.astype(object), None)
+        
+        # Para birimi algılama - sütun başlığındaki para birimi tüm satırlar için geçerli
+        header_currency = next(
+            (currency for currency in (ExcelService.detect_currency_from_text(str(col), None) for col in df.columns) if currency),
+            None
+        )
+        if header_currency:
+            currencies = np.full(row_count, header_currency, dtype=object)
+        else:
+            currencies = np.full(row_count, "USD", dtype=object)  # varsayılan
+            
+            # Önce currency sütunu varsa onu kullan
+            if 'currency' in columns:
+                currencies = ExcelService._detect_currency_column(columns['currency'], 'USD')
+            
+            # Satırdaki ilk para birimi işaretçisi currency sütununu ezer
+            cell_currencies = np.full(row_count, "", dtype=object)
+            for column in reversed(value_columns):
+                detected = ExcelService._detect_currency_column(column)
+                cell_currencies = np.where(detected != "", detected, cell_currencies)
+            currencies = np.where(cell_currencies != "", cell_currencies, currencies)
+        
+        # Geçerli ürün kontrolü
+        valid = (product_names.str.len().to_numpy() > 3) & (list_prices > 0)
+        products = [
+            {
+                'name': name,
+                'brand': brand,  # Yeni: marka alanı
+                'list_price': list_price,
+                'currency': currency,
+                'discounted_price': discounted_price
+            }
+            for name, brand, list_price, currency, discounted_price in zip(
+                product_names.to_numpy(dtype=object)[valid], brands.to_numpy(dtype=object)[valid],
+                list_prices[valid].tolist(), currencies[valid], discounted_prices[valid]
+            )
+        ]
+        logger.info(f"Added {len(products)} products, skipped {row_count - len(products)} rows")
         
         return products
 
 excel_service = ExcelService()
 
+class ExcelParseError(Exception):
+    """Parse failure that can cross the process pool boundary (HTTPException cannot be unpickled)"""
+
+def parse_colored_sheets(source: Union[str, bytes], company_name: str, saved_layout: Optional[Dict[str, Any]] = None,
+                         sheet_names: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Colour-based parse of the given sheets (all when None). Runs in the parse executor.
+
+    Returns the products, the fill classification table and the layout of each sheet with a header row.
+    """
+    color_table = FillColorTable()
+    detected_sheets = []
+    try:
+        products_data = ColorBasedExcelService.parse_colored_excel(
+            source, company_name, color_table, saved_layout, detected_sheets, sheet_names
+        )
+    except HTTPException as e:
+        raise ExcelParseError(e.detail)
+    return products_data, color_table.summary(), detected_sheets
+
+def parse_traditional_excel(source: Union[str, bytes], saved_layout: Optional[Dict[str, Any]] = None,
+                            sheet_name: Optional[str] = None) -> Tuple[List[Dict[str, Any]], None, Optional[Dict[str, Any]]]:
+    """Traditional (header keyword) parse of one sheet, the fallback of the colour-based parser"""
+    detected_sheets = []
+    try:
+        products_data = ExcelService.parse_excel_file(source, saved_layout, detected_sheets, sheet_name)
+    except HTTPException as e:
+        raise ExcelParseError(e.detail)
+    except Exception as e:
+        raise ExcelParseError(f"Excel dosyası işlenemedi: {str(e)}")
+    logger.info(f"Traditional parsing used: {len(products_data)} products")
+    layout = {"parser": "traditional", "sheets": detected_sheets} if detected_sheets else None
+    return products_data, None, layout
+
+def parse_excel_content(source: Union[str, bytes], company_name: str, saved_layout: Optional[Dict[str, Any]] = None,
+                        sheet_names: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[List[Dict[str, Any]]], Optional[Dict[str, Any]]]:
+    """Parse an uploaded workbook: colour-based first, traditional as fallback. Runs in the parse executor.
+
+    source is normally the path of the spooled upload, so only the path crosses the process boundary.
+    saved_layout is the company's stored column layout (see get_column_layout); sheet_names limits
+    parsing to those sheets (the traditional parser reads the first of them).
+    Returns the products, the fill classification table (None when the traditional parser was used)
+    and the column layout the parser used ({"parser", "sheets"}, None when no header row was found).
+    """
+    try:
+        products_data, color_table, detected_sheets = parse_colored_sheets(source, company_name, saved_layout, sheet_names)
+        logger.info(f"Color-based parsing successful: {len(products_data)} products")
+        return products_data, color_table, {"parser": "color", "sheets": detected_sheets} if detected_sheets else None
+    except ExcelParseError as color_parse_error:
+        logger.warning(f"Color-based parsing failed: {color_parse_error}")
+    
+    # Fall back to traditional parsing
+    return parse_traditional_excel(source, saved_layout, sheet_names[0] if sheet_names else None)
+
+def list_workbook_sheets(source: Union[str, bytes]) -> Optional[List[str]]:
+    """Sheet names of an .xlsx workbook, None when openpyxl cannot open it (e.g. .xls)"""
+    try:
+        workbook = openpyxl.load_workbook(open_excel_source(source), read_only=True)
+    except Exception as e:
+        logger.warning(f"Could not list workbook sheets: {e}")
+        return None
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+def merge_color_table_summaries(summaries: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Combine the fill tables of sheets parsed in separate workers (fill ids are workbook wide)"""
+    merged = {}
+    for summary in summaries:
+        for entry in summary:
+            key = (entry['rgb'], entry['theme'], entry['index'], entry['tint'])
+            if key in merged:
+                merged[key]['fill_ids'] = sorted(set(merged[key]['fill_ids']) | set(entry['fill_ids']))
+            else:
+                merged[key] = dict(entry)
+    return list(merged.values())
+
+async def parse_excel_upload(file_path: str, company_name: str, saved_layout: Optional[Dict[str, Any]] = None,
+                             sheet_names: Optional[List[str]] = None):
+    """Parse a spooled upload in the parse executor, one worker per sheet for multi-sheet workbooks
+
+    Every worker opens the workbook read-only and parses a single sheet; results are merged in
+    workbook sheet order, so the rows are the same as a sequential parse_excel_content call.
+    Sheets not in sheet_names are never parsed.
+    """
+    workbook_sheets = await run_in_parse_executor(list_workbook_sheets, file_path)
+    selected_sheets = sheet_names
+    if workbook_sheets is not None:
+        selected_sheets = [name for name in workbook_sheets if sheet_names is None or name in sheet_names]
+        if not selected_sheets:
+            raise ExcelParseError(f"Seçilen sayfalar dosyada bulunamadı: {', '.join(sheet_names)}")
+    
+    if workbook_sheets is None or len(selected_sheets) == 1 or EXCEL_PARSE_WORKERS <= 1:
+        return await run_in_parse_executor(parse_excel_content, file_path, company_name, saved_layout, selected_sheets)
+    
+    logger.info(f"Parsing {len(selected_sheets)} sheets in parallel")
+    try:
+        sheet_results = await asyncio.gather(*(
+            run_in_parse_executor(parse_colored_sheets, file_path, company_name, saved_layout, [sheet_name])
+            for sheet_name in selected_sheets
+        ))
+    except ExcelParseError as color_parse_error:
+        logger.warning(f"Color-based parsing failed: {color_parse_error}")
+        return await run_in_parse_executor(parse_traditional_excel, file_path, saved_layout, selected_sheets[0])
+    
+    products_data = [product for sheet_products, _, _ in sheet_results for product in sheet_products]
+    detected_sheets = [sheet for _, _, sheet_layouts in sheet_results for sheet in sheet_layouts]
+    logger.info(f"Color-based parsing successful: {len(products_data)} products")
+    color_table = merge_color_table_summaries([summary for _, summary, _ in sheet_results])
+    return products_data, color_table, {"parser": "color", "sheets": detected_sheets} if detected_sheets else None
+
+# CSV/TSV price lists are read in row chunks and imported chunk by chunk (constant memory)
+CSV_CHUNK_ROWS = 10_000
+CSV_SNIFF_BYTES = 64 * 1024
+
+def detect_csv_format(path: str, filename: str) -> Dict[str, str]:
+    """Encoding, delimiter and decimal mark of a CSV/TSV file, from its first bytes"""
+    with open(path, 'rb') as f:
+        sample = f.read(CSV_SNIFF_BYTES)
+    try:
+        # Artımlı çözücü: örneğin sonu çok baytlı bir karakterin ortasında kesilmiş olabilir
+        text = codecs.getincrementaldecoder('utf-8')().decode(sample)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        # Excel'in Türkçe Windows CSV çıktısı
+        encoding = 'cp1254'
+        text = sample.decode(encoding, errors='replace')
+    
+    if filename.lower().endswith('.tsv'):
+        delimiter = '\t'
+    else:
+        # Son satır kesik olabilir, ayraç tam satırlardan tahmin edilir
+        lines = text.lstrip('\ufeff').splitlines()[:50]
+        try:
+            delimiter = csv.Sniffer().sniff("\n".join(lines[:-1] or lines), delimiters=',;\t|').delimiter
+        except csv.Error:
+            delimiter = ','
+    
+    # Noktalı virgülle ayrılmış dosyalar Türkçe yerel ayarla kaydedilmiştir: 1.234,56
+    if delimiter == ';':
+        return {"encoding": encoding, "delimiter": delimiter, "decimal": ',', "thousands": '.'}
+    return {"encoding": encoding, "delimiter": delimiter, "decimal": '.', "thousands": None}
+
+def read_csv_products(path: str, filename: str):
+    """Products of a CSV/TSV price list, yielded as one list per CSV_CHUNK_ROWS rows
+
+    The first line is the header; column roles are mapped like the general Excel format
+    (ExcelService._map_general_columns on the first chunk, reused for the whole file).
+    """
+    csv_format = detect_csv_format(path, filename)
+    logger.info(f"Reading CSV {filename}: {csv_format}")
+    mapped_columns = None
+    with pd.read_csv(
+        path,
+        sep=csv_format['delimiter'],
+        decimal=csv_format['decimal'],
+        thousands=csv_format['thousands'],
+        encoding=csv_format['encoding'],
+        encoding_errors='replace',
+        skipinitialspace=True,
+        on_bad_lines='warn',
+        chunksize=CSV_CHUNK_ROWS
+    ) as reader:
+        for chunk in reader:
+            if mapped_columns is None:
+                mapped_columns = ExcelService._map_general_columns(chunk)
+            chunk.columns = mapped_columns
+            products = ExcelService._extract_general_rows(chunk)
+            del chunk
+            # pandas .str erişimcisi Series ile döngüsel referans kurar; toplanmazsa
+            # her parçanın ara dizileri eski nesle geçer ve bellek dosya boyuyla büyür
+            gc.collect()
+            yield products
+
+async def stream_csv_product_chunks(path: str, filename: str):
+    """read_csv_products one chunk at a time in a worker thread, so parsing never blocks the event loop"""
+    loop = asyncio.get_running_loop()
+    chunks = read_csv_products(path, filename)
+    try:
+        while True:
+            try:
+                products = await loop.run_in_executor(None, next, chunks, None)
+            except Exception as e:
+                logger.error(f"Error reading CSV file: {e}")
+                raise HTTPException(status_code=400, detail=f"CSV dosyası işlenemedi: {str(e)}")
+            if products is None:
+                break
+            yield products
+    finally:
+        chunks.close()
+
+# Cross-supplier price comparison (eşdeğer ürün grupları)
+TURKISH_ASCII_MAP = str.maketrans({
+    'ç': 'c', 'ğ': 'g', 'ı': 'i', 'ö': 'o', 'ş': 's', 'ü': 'u',
+    'Ç': 'C', 'Ğ': 'G', 'İ': 'I', 'Ö': 'O', 'Ş': 'S', 'Ü': 'U'
+})
+
+def fold_turkish_text(text: Optional[str]) -> str:
+    """Lowercase ASCII form of a text: Turkish letters folded, punctuation collapsed to spaces"""
+    if not text:
+        return ""
+    folded = unicodedata.normalize('NFKD', str(text).translate(TURKISH_ASCII_MAP))
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch)).lower()
+    return re.sub(r'[^a-z0-9]+', ' ', folded).strip()
+
+def build_product_fingerprint(name: Optional[str], brand: Optional[str] = "") -> str:
+    """Supplier-independent key for equivalent products, built from name and brand tokens"""
+    # Token kümesi kullanılır: marka isimde tekrar etse de, kelime sırası farklı olsa da aynı anahtar
+    tokens = set(fold_turkish_text(brand).split()) | set(fold_turkish_text(name).split())
+    return " ".join(sorted(tokens))
+
+# Türkçe büyük harfler: I -> ı, İ -> i (str.lower() İ'yi iki karaktere böler)
+TURKISH_LOWER_MAP = str.maketrans({'I': 'ı', 'İ': 'i'})
+
+def build_product_name_key(name: Optional[str]) -> str:
+    """Matching key for a product name within a company: Turkish-aware lowercase, whitespace collapsed"""
+    text = unicodedata.normalize("NFC", name or "").translate(TURKISH_LOWER_MAP).lower()
+    return " ".join(text.split())
+
+# API sürecindeki yenilemeler sırayla çalışır; tam yeniden oluşturma artımlı yenilemelerle iç içe geçmez
+product_groups_refresh_lock = asyncio.Lock()
+
+async def refresh_product_groups(fingerprints: Optional[List[str]] = None) -> int:
+    """Rebuild product_groups for the given fingerprints, or all groups when None"""
+    async with product_groups_refresh_lock:
+        return await _refresh_product_groups(fingerprints)
+
+async def _refresh_product_groups(fingerprints: Optional[List[str]] = None) -> int:
+    pipeline = []
+    if fingerprints is not None:
+        fingerprints = list({fp for fp in fingerprints if fp})
+        if not fingerprints:
+            return 0
+        pipeline.append({"$match": {"fingerprint": {"$in": fingerprints}}})
+    else:
+        pipeline.append({"$match": {"fingerprint": {"$exists": True, "$ne": ""}}})
+
+    # Fiyatı olan ürünler; bunların parmak izleri grup üretir
+    pipeline.extend([
+        {"$project": {
+            "_id": 0,
+            "fingerprint": 1,
+            "id": 1,
+            "name": 1,
+            "brand": 1,
+            "company_id": 1,
+            "currency": 1,
+            "list_price": 1,
+            "discounted_price": 1,
+            "price_try": {"$ifNull": ["$discounted_price_try", "$list_price_try"]}
+        }},
+        {"$match": {"price_try": {"$gt": 0}}},
+    ])
+    grouped_fingerprints_pipeline = pipeline + [{"$group": {"_id": "$fingerprint"}}]
+
+    pipeline = pipeline + [
+        {"$sort": {"price_try": 1}},
+        # Her tedarikçiden sadece en ucuz ürün
+        {"$group": {
+            "_id": {"fingerprint": "$fingerprint", "company_id": "$company_id"},
+            "product_id": {"$first": "$id"},
+            "name": {"$first": "$name"},
+            "brand": {"$first": "$brand"},
+            "currency": {"$first": "$currency"},
+            "list_price": {"$first": "$list_price"},
+            "discounted_price": {"$first": "$discounted_price"},
+            "price_try": {"$first": "$price_try"}
+        }},
+        {"$lookup": {
+            "from": "companies",
+            "localField": "_id.company_id",
+            "foreignField": "id",
+            "as": "company"
+        }},
+        {"$sort": {"price_try": 1}},
+        {"$group": {
+            "_id": "$_id.fingerprint",
+            "name": {"$first": "$name"},
+            "brand": {"$first": "$brand"},
+            "offers": {"$push": {
+                "product_id": "$product_id",
+                "company_id": "$_id.company_id",
+                "company_name": {"$ifNull": [{"$arrayElemAt": ["$company.name", 0]}, "Unknown"]},
+                "name": "$name",
+                "currency": "$currency",
+                "list_price": "$list_price",
+                "discounted_price": "$discounted_price",
+                "price_try": "$price_try"
+            }},
+            "cheapest_price_try": {"$min": "$price_try"},
+            "highest_price_try": {"$max": "$price_try"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "fingerprint": "$_id",
+            "name": 1,
+            "brand": 1,
+            "offers": 1,
+            "company_count": {"$size": "$offers"},
+            "cheapest_price_try": 1,
+            "highest_price_try": 1,
+            "cheapest_product_id": {"$arrayElemAt": ["$offers.product_id", 0]},
+            "cheapest_company_id": {"$arrayElemAt": ["$offers.company_id", 0]},
+            "savings_try": {"$subtract": ["$highest_price_try", "$cheapest_price_try"]},
+            "savings_percent": {"$round": [{"$multiply": [
+                {"$divide": [{"$subtract": ["$highest_price_try", "$cheapest_price_try"]}, "$highest_price_try"]},
+                100
+            ]}, 2]},
+            "updated_at": "$$NOW"
+        }},
+        {"$merge": {
+            "into": "product_groups",
+            "on": "fingerprint",
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+    await db.products.aggregate(pipeline).to_list(None)
+
+    # Artık ürünü kalmayan grupları temizle. Silme kararı ürün verisinden verilir, yenileme kimliğinden değil:
+    # başka bir süreçteki (ör. iş kuyruğu işçisi) eşzamanlı yenilemenin yazdığı gruplar silinmez.
+    grouped_fingerprints = {
+        row["_id"] async for row in db.products.aggregate(grouped_fingerprints_pipeline, allowDiskUse=True)
+    }
+    if fingerprints is not None:
+        stale_fingerprints = [fp for fp in fingerprints if fp not in grouped_fingerprints]
+    else:
+        stale_fingerprints = [
+            group["fingerprint"] async for group in db.product_groups.find({}, {"_id": 0, "fingerprint": 1})
+            if group.get("fingerprint") not in grouped_fingerprints
+        ]
+    for start in range(0, len(stale_fingerprints), 1000):
+        await db.product_groups.delete_many({"fingerprint": {"$in": stale_fingerprints[start:start + 1000]}})
+
+    return len(grouped_fingerprints)
+
+async def bulk_write_chunk(collection, operations: List[Any]) -> Dict[int, str]:
+    """Run one unordered bulk_write; returns {operation index: error message} for the writes that failed"""
+    if not operations:
+        return {}
+    try:
+        await collection.bulk_write(operations, ordered=False)
+        return {}
+    except BulkWriteError as e:
+        return {error['index']: error.get('errmsg', 'Yazma hatası') for error in e.details.get('writeErrors', [])}
+    except PyMongoError as e:
+        logger.error(f"Bulk write of {len(operations)} operations failed: {e}")
+        return {index: str(e) for index in range(len(operations))}
+
+async def backfill_product_fingerprints() -> int:
+    """Stamp fingerprints on products that were created before price comparison existed"""
+    operations = []
+    updated = 0
+    async for product in db.products.find(
+        {"fingerprint": {"$exists": False}}, {"_id": 0, "id": 1, "name": 1, "brand": 1}
+    ):
+        operations.append(UpdateOne(
+            {"id": product["id"]},
+            {"$set": {"fingerprint": build_product_fingerprint(product.get("name"), product.get("brand"))}}
+        ))
+        if len(operations) >= BULK_WRITE_CHUNK_SIZE:
+            result = await db.products.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+    if operations:
+        result = await db.products.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+    return updated
+
+async def refresh_product_groups_safely(fingerprints: Optional[List[str]] = None):
+    """Refresh groups without failing the write that triggered it"""
+    try:
+        await refresh_product_groups(fingerprints)
+    except Exception as e:
+        logger.error(f"Error refreshing product groups: {e}")
+
+async def adjust_product_counters(changes: List[tuple]):
+    """Apply (company_id, category_id, delta) changes to the per-company/category counters"""
+    deltas = {}
+    for company_id, category_id, delta in changes:
+        if not delta:
+            continue
+        if company_id:
+            deltas[f"company:{company_id}"] = deltas.get(f"company:{company_id}", 0) + delta
+        if category_id:
+            deltas[f"category:{category_id}"] = deltas.get(f"category:{category_id}", 0) + delta
+
+    operations = [
+        UpdateOne({"_id": counter_id}, {"$inc": {"count": delta}}, upsert=True)
+        for counter_id, delta in deltas.items() if delta
+    ]
+    try:
+        if operations:
+            await db.product_counters.bulk_write(operations, ordered=False)
+    except Exception as e:
+        logger.error(f"Error adjusting product counters: {e}")
+    await invalidate_product_counts()
+
+async def rebuild_product_counters():
+    """Recount products per company and per category from scratch"""
+    try:
+        counts = {}
+        for field in ("company_id", "category_id"):
+            prefix = field.split("_")[0]
+            async for row in db.products.aggregate([
+                {"$match": {field: {"$nin": [None, ""]}}},
+                {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}
+            ]):
+                counts[f"{prefix}:{row['_id']}"] = row["count"]
+        counter_ids = list(counts.keys())
+        operations = [
+            UpdateOne({"_id": counter_id}, {"$set": {"count": count}}, upsert=True)
+            for counter_id, count in counts.items()
+        ]
+        await db.product_counters.delete_many({"_id": {"$nin": counter_ids}})
+        if operations:
+            await db.product_counters.bulk_write(operations, ordered=False)
+        logger.info(f"Product counters rebuilt: {len(operations)} counters")
+    except Exception as e:
+        logger.error(f"Error rebuilding product counters: {e}")
+
+async def initialize_product_groups():
+    """Backfill fingerprints and build product groups on first start"""
+    try:
+        if await db.product_groups.estimated_document_count() == 0:
+            backfilled = await backfill_product_fingerprints()
+            groups = await refresh_product_groups()
+            logger.info(f"Product groups initialized: {backfilled} fingerprints, {groups} groups")
+    except Exception as e:
+        logger.error(f"Error initializing product groups: {e}")
+
+PRODUCT_NAME_KEY_INDEX = "company_name_key_unique"
+DUPLICATE_PRODUCT_NAME_DETAIL = "Bu firmada aynı isimde bir ürün zaten var"
+
+def product_write_time(product: Dict[str, Any]) -> datetime:
+    """Last write time of a product; updated_at is a datetime or an ISO string depending on the endpoint"""
+    value = product.get("updated_at") or product.get("created_at")
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            value = None
+    if not isinstance(value, datetime):
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+async def merge_duplicate_products(product_ids: List[str]) -> int:
+    """Merge products sharing one (company_id, name_key) into the most recently written one"""
+    products = await db.products.find({"id": {"$in": product_ids}}).to_list(None)
+    if len(products) < 2:
+        return 0
+    
+    products.sort(key=product_write_time, reverse=True)
+    survivor, duplicates = products[0], products[1:]
+    duplicate_ids = [product["id"] for product in duplicates]
+    
+    # Güncel fiyatlar kalan üründe; boş alanlar kopyalardan tamamlanır
+    fill_fields = {}
+    for field in ("category_id", "description", "image_url", "brand"):
+        if not survivor.get(field):
+            value = next((product[field] for product in duplicates if product.get(field)), None)
+            if value:
+                fill_fields[field] = value
+    if not survivor.get("is_favorite") and any(product.get("is_favorite") for product in duplicates):
+        fill_fields["is_favorite"] = True
+    if fill_fields:
+        await db.products.update_one({"id": survivor["id"]}, {"$set": fill_fields})
+    
+    # Paketlerdeki referanslar kalan ürüne taşınır
+    for collection in (db.package_products, db.package_supplies):
+        await collection.update_many({"product_id": {"$in": duplicate_ids}}, {"$set": {"product_id": survivor["id"]}})
+    
+    result = await db.products.delete_many({"id": {"$in": duplicate_ids}})
+    logger.info(f"Merged {result.deleted_count} duplicates into product {survivor['id']} ({survivor.get('name')})")
+    return result.deleted_count
+
+async def migrate_product_name_keys() -> Dict[str, int]:
+    """Backfill name_key and merge duplicates so the unique (company_id, name_key) index can be built
+
+    Runs until the unique index exists; after that every product write maintains name_key itself.
+    """
+    stats = {"backfilled": 0, "merged": 0}
+    try:
+        if PRODUCT_NAME_KEY_INDEX in await db.products.index_information():
+            return stats
+        
+        operations = []
+        async for product in db.products.find({"name_key": {"$exists": False}}, {"_id": 0, "id": 1, "name": 1}):
+            operations.append(UpdateOne(
+                {"id": product["id"]},
+                {"$set": {"name_key": build_product_name_key(product.get("name"))}}
+            ))
+            if len(operations) >= BULK_WRITE_CHUNK_SIZE:
+                result = await db.products.bulk_write(operations, ordered=False)
+                stats["backfilled"] += result.modified_count
+                operations = []
+        if operations:
+            result = await db.products.bulk_write(operations, ordered=False)
+            stats["backfilled"] += result.modified_count
+        
+        duplicate_groups = await db.products.aggregate([
+            {"$group": {
+                "_id": {"company_id": "$company_id", "name_key": "$name_key"},
+                "ids": {"$push": "$id"},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True).to_list(None)
+        for group in duplicate_groups:
+            stats["merged"] += await merge_duplicate_products(group["ids"])
+        
+        if stats["merged"]:
+            invalidate_cache("/api/products")
+            await refresh_product_groups_safely()
+        logger.info(f"Product name keys migrated: {stats['backfilled']} backfilled, {stats['merged']} duplicates merged")
+    except Exception as e:
+        logger.error(f"Error migrating product name keys: {e}")
+    return stats
+
 # API Routes
 
 @api_router.get("/")
@@ -1579,7 +3402,18 @@ async def delete_company(company_id: str):
             raise HTTPException(status_code=404, detail="Firma bulunamadı")
         
         # Also delete all products of this company
+        fingerprints = await db.products.distinct("fingerprint", {"company_id": company_id})
+        category_counts = await db.products.aggregate([
+            {"$match": {"company_id": company_id}},
+            {"$group": {"_id": "$category_id", "count": {"$sum": 1}}}
+        ]).to_list(None)
         await db.products.delete_many({"company_id": company_id})
+        await db.column_layouts.delete_one({"company_id": company_id})
+        await db.upload_before_images.delete_many({"company_id": company_id})
+        await adjust_product_counters([
+            (company_id, row["_id"], -row["count"]) for row in category_counts
+        ])
+        await refresh_product_groups_safely(fingerprints)
         
         return {"success": True, "message": "Firma silindi"}
     except HTTPException:
@@ -1628,6 +3462,13 @@ async def update_product(product_id: str, update_data: ProductUpdate):
             update_dict["currency"] = update_data.currency.upper()
         if update_data.category_id is not None:
             update_dict["category_id"] = update_data.category_id
+        if update_data.name is not None or "name_key" not in existing_product:
+            update_dict["name_key"] = build_product_name_key(update_dict.get("name", existing_product.get("name")))
+        if update_data.name is not None or update_data.brand is not None or "fingerprint" not in existing_product:
+            update_dict["fingerprint"] = build_product_fingerprint(
+                update_dict.get("name", existing_product.get("name")),
+                update_dict.get("brand", existing_product.get("brand"))
+            )
         
         # If currency or prices changed, recalculate TRY prices
         if update_data.currency is not None or update_data.list_price is not None or update_data.discounted_price is not None:
@@ -1655,13 +3496,31 @@ async def update_product(product_id: str, update_data: ProductUpdate):
         
         # Update product
         if update_dict:
-            result = await db.products.update_one(
-                {"id": product_id},
-                {"$set": update_dict}
-            )
+            product_update = {"$set": update_dict}
+            if product_edit_changes_upload_fields(existing_product, update_dict):
+                product_update["$unset"] = {"last_upload_id": ""}
+            try:
+                result = await db.products.update_one({"id": product_id}, product_update)
+            except DuplicateKeyError:
+                raise HTTPException(status_code=400, detail=DUPLICATE_PRODUCT_NAME_DETAIL)
             
             if result.modified_count == 0:
                 raise HTTPException(status_code=404, detail="Ürün güncellenemedi")
+            
+            if "company_id" in update_dict or "category_id" in update_dict:
+                await adjust_product_counters([
+                    (existing_product.get("company_id"), existing_product.get("category_id"), -1),
+                    (update_dict.get("company_id", existing_product.get("company_id")),
+                     update_dict.get("category_id", existing_product.get("category_id")), 1)
+                ])
+            elif "name" in update_dict or "brand" in update_dict:
+                # Arama sayıları ad ve markaya göre filtrelenir
+                await invalidate_product_counts()
+            
+            await refresh_product_groups_safely([
+                existing_product.get("fingerprint"),
+                update_dict.get("fingerprint", existing_product.get("fingerprint"))
+            ])
         
         # Get updated product
         updated_product = await db.products.find_one({"id": product_id})
@@ -1681,10 +3540,18 @@ async def update_product(product_id: str, update_data: ProductUpdate):
 async def delete_product(product_id: str):
     """Delete a product"""
     try:
-        result = await db.products.delete_one({"id": product_id})
-        if result.deleted_count == 0:
+        deleted_product = await db.products.find_one_and_delete(
+            {"id": product_id}, projection={"_id": 0, "fingerprint": 1, "company_id": 1, "category_id": 1}
+        )
+        if deleted_product is None:
             raise HTTPException(status_code=404, detail="Ürün bulunamadı")
         
+        await adjust_product_counters([
+            (deleted_product.get("company_id"), deleted_product.get("category_id"), -1)
+        ])
+        
+        await refresh_product_groups_safely([deleted_product.get("fingerprint")])
+        
         return {"success": True, "message": "Ürün silindi"}
     except HTTPException:
         raise
@@ -1721,19 +3588,44 @@ async def update_product(product_id: str, product_update: Dict[str, Any]):
         for field in allowed_fields:
             if field in product_update:
                 update_data[field] = product_update[field]
+        if "name" in update_data or "name_key" not in existing_product:
+            update_data["name_key"] = build_product_name_key(update_data.get("name", existing_product.get("name")))
+        if "name" in update_data or "brand" in update_data or "fingerprint" not in existing_product:
+            update_data["fingerprint"] = build_product_fingerprint(
+                update_data.get("name", existing_product.get("name")),
+                update_data.get("brand", existing_product.get("brand"))
+            )
         
         # Güncelleme zamanını ekle
         update_data["updated_at"] = datetime.utcnow().isoformat() + "Z"
         
-        # Ürünü güncelle
-        result = await db.products.update_one(
-            {"id": product_id},
-            {"$set": update_data}
-        )
+        # Ürünü güncelle; elle düzeltilen fiyat/para birimi/marka artık yüklemeye ait sayılmaz
+        product_changes = {"$set": update_data}
+        if product_edit_changes_upload_fields(existing_product, update_data):
+            product_changes["$unset"] = {"last_upload_id": ""}
+        try:
+            result = await db.products.update_one({"id": product_id}, product_changes)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=DUPLICATE_PRODUCT_NAME_DETAIL)
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Ürün bulunamadı")
         
+        if "company_id" in update_data or "category_id" in update_data:
+            await adjust_product_counters([
+                (existing_product.get("company_id"), existing_product.get("category_id"), -1),
+                (update_data.get("company_id", existing_product.get("company_id")),
+                 update_data.get("category_id", existing_product.get("category_id")), 1)
+            ])
+        elif "name" in update_data or "brand" in update_data:
+            # Arama sayıları ad ve markaya göre filtrelenir
+            await invalidate_product_counts()
+        
+        await refresh_product_groups_safely([
+            existing_product.get("fingerprint"),
+            update_data.get("fingerprint", existing_product.get("fingerprint"))
+        ])
+        
         # Güncellenmiş ürünü döndür
         updated_product = await db.products.find_one({"id": product_id})
         if updated_product:
@@ -1769,9 +3661,14 @@ async def create_quote(quote: QuoteCreate):
         total_discounted_price = 0
         processed_products = []
         
+        # Firma bilgilerini tek sorguda getir
+        companies_by_id = await get_documents_by_ids(
+            db.companies, [product["company_id"] for product in products], ["name"]
+        )
+        
         for product in products:
             # Get company info
-            company = await db.companies.find_one({"id": product["company_id"]})
+            company = companies_by_id.get(product["company_id"])
             
             # Get quantity for this product
             quantity = product_quantities.get(product["id"], 1)
@@ -1830,12 +3727,37 @@ async def create_quote(quote: QuoteCreate):
         logger.error(f"Error creating quote: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating quote: {str(e)}")
 
+def quote_display_stage(display_currency: str, rate: float) -> Dict[str, Any]:
+    """$addFields stage converting quote totals and product prices to the display currency"""
+    return {"$addFields": {
+        "display_currency": display_currency.upper(),
+        "display_total_list_price": display_price_expression("$total_list_price", rate),
+        "display_total_discounted_price": display_price_expression("$total_discounted_price", rate),
+        "display_total_net_price": display_price_expression("$total_net_price", rate),
+        "products": {"$map": {
+            "input": {"$ifNull": ["$products", []]},
+            "as": "product",
+            "in": {"$mergeObjects": ["$$product", {
+                "display_list_price": display_price_expression("$$product.list_price_try", rate),
+                "display_discounted_price": display_price_expression("$$product.discounted_price_try", rate)
+            }]}
+        }}
+    }}
+
 @api_router.get("/quotes", response_model=List[QuoteResponse])
-async def get_quotes():
+async def get_quotes(display_currency: Optional[str] = None):
     """Get all quotes"""
+    display_rate = await resolve_display_rate(display_currency)
+    
     try:
-        quotes_cursor = db.quotes.find({"status": "active"}).sort("created_at", -1)
-        quotes = await quotes_cursor.to_list(length=None)
+        pipeline = [
+            {"$match": {"status": "active"}},
+            {"$sort": {"created_at": -1}}
+        ]
+        if display_rate:
+            pipeline.append(quote_display_stage(display_currency, display_rate))
+        
+        quotes = await db.quotes.aggregate(pipeline).to_list(length=None)
         
         return quotes
         
@@ -1844,10 +3766,17 @@ async def get_quotes():
         raise HTTPException(status_code=500, detail=f"Error fetching quotes: {str(e)}")
 
 @api_router.get("/quotes/{quote_id}", response_model=QuoteResponse)
-async def get_quote(quote_id: str):
+async def get_quote(quote_id: str, display_currency: Optional[str] = None):
     """Get specific quote by ID"""
+    display_rate = await resolve_display_rate(display_currency)
+    
     try:
-        quote = await db.quotes.find_one({"id": quote_id})
+        pipeline = [{"$match": {"id": quote_id}}, {"$limit": 1}]
+        if display_rate:
+            pipeline.append(quote_display_stage(display_currency, display_rate))
+        
+        quotes = await db.quotes.aggregate(pipeline).to_list(length=1)
+        quote = quotes[0] if quotes else None
         
         if not quote:
             raise HTTPException(status_code=404, detail="Quote not found")
@@ -2924,10 +4853,11 @@ async def download_package_pdf_with_prices(package_id: str):
         # Paket ürünlerini getir
         package_products = await db.package_products.find({"package_id": package_id}).to_list(None)
         
-        # Ürün detaylarını al
+        # Ürün detaylarını tek sorguda al
+        products_by_id = await get_documents_by_ids(db.products, [pp["product_id"] for pp in package_products])
         products = []
         for pp in package_products:
-            product = await db.products.find_one({"id": pp["product_id"]})
+            product = products_by_id.get(pp["product_id"])
             if product:
                 # Use custom price if available, otherwise use original prices
                 custom_price = pp.get("custom_price")
@@ -2989,10 +4919,11 @@ async def download_package_pdf_without_prices(package_id: str):
         # Paket ürünlerini getir
         package_products = await db.package_products.find({"package_id": package_id}).to_list(None)
         
-        # Ürün detaylarını al
+        # Ürün detaylarını tek sorguda al
+        products_by_id = await get_documents_by_ids(db.products, [pp["product_id"] for pp in package_products])
         products = []
         for pp in package_products:
-            product = await db.products.find_one({"id": pp["product_id"]})
+            product = products_by_id.get(pp["product_id"])
             if product:
                 product_data = {
                     "name": product["name"],
@@ -3204,11 +5135,11 @@ async def add_supplies_to_package(package_id: str, supplies: List[PackageSupplyC
         await db.package_supplies.delete_many({"package_id": package_id})
         
         # Add new supplies
+        existing_products = await get_documents_by_ids(db.products, [supply.product_id for supply in supplies], ["id"])
         package_supplies = []
         for supply in supplies:
             # Verify product exists
-            existing_product = await db.products.find_one({"id": supply.product_id})
-            if not existing_product:
+            if supply.product_id not in existing_products:
                 continue
                 
             package_supply = {
@@ -3309,7 +5240,7 @@ async def get_supply_products():
         # Get products from supplies category
         products = await db.products.find({
             "category_id": supplies_category["id"]
-        }).sort("name", 1).to_list(None)
+        }).collation(PRODUCT_NAME_COLLATION).sort("name", 1).to_list(None)
         
         return [Product(**product) for product in products]
     except Exception as e:
@@ -3324,6 +5255,10 @@ async def get_supply_products():
 async def assign_product_to_category(product_id: str, category_id: str = None):
     """Assign a product to a category"""
     try:
+        existing_product = await db.products.find_one(
+            {"id": product_id}, {"_id": 0, "company_id": 1, "category_id": 1}
+        )
+        
         update_dict = {"category_id": category_id} if category_id else {"$unset": {"category_id": ""}}
         
         result = await db.products.update_one(
@@ -3334,6 +5269,11 @@ async def assign_product_to_category(product_id: str, category_id: str = None):
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Ürün bulunamadı")
         
+        await adjust_product_counters([
+            (None, existing_product.get("category_id"), -1),
+            (None, category_id, 1)
+        ])
+        
         return {"success": True, "message": "Ürün kategoriye atandı"}
         
     except HTTPException:
@@ -3441,7 +5381,7 @@ async def update_product_stock(product_id: str, stock_quantity: int = Form(...))
 async def get_favorite_products():
     """Get all favorite products"""
     try:
-        products = await db.products.find({"is_favorite": True}).sort("name", 1).to_list(None)
+        products = await db.products.find({"is_favorite": True}).collation(PRODUCT_NAME_COLLATION).sort("name", 1).to_list(None)
         return [Product(**product) for product in products]
     except Exception as e:
         logger.error(f"Error getting favorite products: {e}")
@@ -3545,8 +5485,10 @@ async def update_package(package_id: str, package_data: PackageUpdate):
         raise HTTPException(status_code=500, detail="Paket güncellenemedi")
 
 @api_router.get("/packages/{package_id}", response_model=PackageWithProducts)
-async def get_package_with_products(package_id: str):
+async def get_package_with_products(package_id: str, display_currency: Optional[str] = None):
     """Get package with its products"""
+    display_rate = await resolve_display_rate(display_currency)
+    
     try:
         # Get package
         package = await db.packages.find_one({"id": package_id})
@@ -3560,8 +5502,10 @@ async def get_package_with_products(package_id: str):
         products = []
         total_discounted_price = Decimal('0')
         
+        products_by_id = await get_documents_by_ids(db.products, [pp["product_id"] for pp in package_products])
+        
         for pp in package_products:
-            product = await db.products.find_one({"id": pp["product_id"]})
+            product = products_by_id.get(pp["product_id"])
             if product:
                 # Use custom price if available, otherwise use original prices
                 custom_price = pp.get("custom_price")
@@ -3598,6 +5542,9 @@ async def get_package_with_products(package_id: str):
                     "notes": pp.get("notes"),  # Ürün notları
                     "has_notes": bool(pp.get("notes") and pp.get("notes").strip())  # Not var mı?
                 }
+                if display_rate:
+                    product_data["display_list_price"] = convert_from_try_value(list_price_try_value, display_rate)
+                    product_data["display_discounted_price"] = convert_from_try_value(discounted_price_try_value, display_rate)
                 products.append(product_data)
                 
                 # Calculate total using effective price
@@ -3610,8 +5557,10 @@ async def get_package_with_products(package_id: str):
         supplies = []
         total_supplies_price = Decimal('0')
         
+        supplies_by_id = await get_documents_by_ids(db.products, [ps["product_id"] for ps in package_supplies])
+        
         for ps in package_supplies:
-            supply = await db.products.find_one({"id": ps["product_id"]})
+            supply = supplies_by_id.get(ps["product_id"])
             if supply:
                 supply_data = {
                     "id": supply["id"],
@@ -3626,6 +5575,9 @@ async def get_package_with_products(package_id: str):
                     "company_id": supply.get("company_id"),
                     "category_id": supply.get("category_id")
                 }
+                if display_rate:
+                    supply_data["display_list_price"] = convert_from_try_value(supply.get("list_price_try", 0), display_rate)
+                    supply_data["display_discounted_price"] = convert_from_try_value(supply.get("discounted_price_try"), display_rate)
                 supplies.append(supply_data)
                 
                 # Calculate supply price total
@@ -3648,6 +5600,11 @@ async def get_package_with_products(package_id: str):
             supplies=supplies,
             total_discounted_price=total_discounted_price,
             total_discounted_price_with_supplies=total_discounted_price + total_supplies_price,
+            display_currency=display_currency.upper() if display_rate else None,
+            display_total_discounted_price=convert_from_try_value(total_discounted_price, display_rate) if display_rate else None,
+            display_total_discounted_price_with_supplies=(
+                convert_from_try_value(total_discounted_price + total_supplies_price, display_rate) if display_rate else None
+            ),
             status="active"  # Default status
         )
     except HTTPException:
@@ -3825,11 +5782,11 @@ async def add_products_to_package(package_id: str, products: List[PackageProduct
         await db.package_products.delete_many({"package_id": package_id})
         
         # Add new products
+        existing_products = await get_documents_by_ids(db.products, [product.product_id for product in products], ["id"])
         package_products = []
         for product in products:
             # Verify product exists
-            existing_product = await db.products.find_one({"id": product.product_id})
-            if not existing_product:
+            if product.product_id not in existing_products:
                 continue
                 
             package_product = {
@@ -3926,15 +5883,136 @@ async def update_package_product(package_id: str, package_product_id: str, updat
 async def get_favorite_products():
     """Get all favorite products"""
     try:
-        products = await db.products.find({"is_favorite": True}).sort("name", 1).to_list(None)
+        products = await db.products.find({"is_favorite": True}).collation(PRODUCT_NAME_COLLATION).sort("name", 1).to_list(None)
         return [Product(**product) for product in products]
     except Exception as e:
         logger.error(f"Error getting favorite products: {e}")
         raise HTTPException(status_code=500, detail="Favori ürünler getirilemedi")
 
+def parse_upload_options(currency: Optional[str], discount: Optional[str]) -> Tuple[Optional[str], float]:
+    """Validated currency override and discount percentage of an upload form"""
+    # Handle user-selected currency override
+    user_selected_currency = None
+    if currency and currency.upper() in ['USD', 'EUR', 'TRY']:
+        user_selected_currency = currency.upper()
+        logger.info(f"User selected currency override: {user_selected_currency}")
+    
+    # Handle discount percentage
+    discount_percentage = 0.0
+    try:
+        if discount and discount.strip():
+            discount_percentage = float(discount)
+            if discount_percentage < 0 or discount_percentage > 100:
+                raise ValueError("Discount must be between 0 and 100")
+            logger.info(f"User selected discount: {discount_percentage}%")
+    except ValueError as e:
+        logger.error(f"Invalid discount value: {discount}, error: {e}")
+        raise HTTPException(status_code=400, detail=f"Geçersiz iskonto değeri: {discount}")
+    return user_selected_currency, discount_percentage
+
+async def find_duplicate_upload(company_id: str, filename: str, file_hash: str, upload_options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """"No changes" response when the file is the company's last upload with the same options, else None"""
+    last_upload = await db.upload_history.find_one(
+        {"company_id": company_id, "status": "completed"},
+        sort=[("upload_date", -1)]
+    )
+    if not (last_upload and last_upload.get('file_hash') == file_hash
+            and last_upload.get('parser_version') == EXCEL_PARSER_VERSION
+            and last_upload.get('upload_options') == upload_options
+            and not last_upload.get('failed_products')):
+        return None
+    
+    logger.info(f"Upload {filename} is identical to upload {last_upload['id']}, skipped")
+    return {
+        "success": True,
+        "message": "Dosya son yüklenen listeyle aynı, değişiklik yok",
+        "upload_id": last_upload['id'],
+        "duplicate_of": last_upload['id'],
+        "summary": {
+            "total_products": last_upload['total_products'],
+            "new_products": 0,
+            "updated_products": 0,
+            "unchanged_products": last_upload['total_products'],
+            "price_changes": 0,
+            "currency_distribution": last_upload['currency_distribution'],
+            "failed_products": 0,
+            "import_errors": [],
+            "color_table": None
+        }
+    }
+
+def parse_sheet_names(sheets: Optional[str]) -> Optional[List[str]]:
+    """Sorted sheet allow-list of a comma separated form value, None for all sheets"""
+    return sorted({name.strip() for name in (sheets or "").split(",") if name.strip()}) or None
+
+async def excel_upload_options(company_id: str, user_selected_currency: Optional[str], discount_percentage: float,
+                               sheet_names: Optional[List[str]]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[str]]:
+    """Upload options recorded in the history, with the company's saved column layout and its cache key"""
+    upload_options = {"currency": user_selected_currency, "discount": discount_percentage}
+    
+    # Firmanın kayıtlı kolon eşlemesi; sabitlenmiş eşleme ayrıştırma sonucunu değiştirdiği için seçeneklere girer
+    saved_layout = await get_column_layout(company_id)
+    layout_key = column_layout_key(saved_layout)
+    if layout_key:
+        upload_options["column_layout"] = layout_key
+    
+    if sheet_names:
+        upload_options["sheets"] = sheet_names
+    return upload_options, saved_layout, layout_key
+
+async def load_excel_parse_result(company: Dict[str, Any], file_path: str, filename: str, file_hash: str,
+                                  saved_layout: Optional[Dict[str, Any]], layout_key: Optional[str],
+                                  sheet_names: Optional[List[str]]) -> Tuple[List[Dict[str, Any]], Any, Optional[Dict[str, Any]]]:
+    """Parse result of a spooled workbook: from the parse cache, else parsed in the parse executor"""
+    # Try color-based parsing first, then fall back to traditional parsing (in the parse executor);
+    # a file parsed recently by the same parser version is taken from the parse cache
+    parse_result = get_cached_parse_result(file_hash, company['name'], layout_key, sheet_names)
+    if parse_result is None:
+        try:
+            parse_result = await parse_excel_upload(file_path, company['name'], saved_layout, sheet_names)
+        except ExcelParseError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        store_parse_result(file_hash, company['name'], parse_result, layout_key, sheet_names)
+    else:
+        logger.info(f"Using cached parse result for {filename} ({file_hash[:12]})")
+    return parse_result
+
+def upload_preview_response(preview: Dict[str, Any], file_hash: str) -> Dict[str, Any]:
+    """Response of a dry-run upload"""
+    return {
+        "success": True,
+        "dry_run": True,
+        "message": (
+            f"Önizleme: {preview['new_products']} yeni, {preview['updated_products']} güncellenecek, "
+            f"{preview['unchanged_products']} değişmeyecek, {preview['removed_products']} ürün listede yok"
+        ),
+        "file_hash": file_hash,
+        "summary": preview
+    }
+
 @api_router.post("/companies/{company_id}/upload-excel")  
-async def upload_excel(company_id: str, file: UploadFile = File(...), currency: str = Form(None), discount: str = Form("0")):
-    """Upload Excel file for a company with smart update system"""
+async def upload_excel(
+    company_id: str,
+    file: UploadFile = File(...),
+    currency: str = Form(None),
+    discount: str = Form("0"),
+    force: bool = Form(False),
+    sheets: Optional[str] = Form(None),
+    dry_run: bool = False,
+    background: bool = False
+):
+    """Upload Excel file for a company with smart update system
+
+    sheets (comma separated sheet names) limits parsing to those sheets; the other sheets of
+    the workbook are never parsed. Multi-sheet workbooks are parsed one sheet per worker.
+    Re-sending the file of the company's last upload (same content, options and parser version)
+    returns a "no changes" result without importing it again, unless force is set.
+    With dry_run the file is parsed and diffed against the catalog but nothing is written; the parsed
+    rows stay in the parse cache, so confirming with the same file imports it without parsing again.
+    With background the file is queued as an excel_import job and the response carries its job_id
+    (poll GET /api/jobs/{job_id}); the upload history entry stays "processing" until the job ends.
+    The import holds the company's serial lock: 409 while a job or another upload of the company runs.
+    """
     try:
         # Verify company exists
         company = await db.companies.find_one({"id": company_id})
@@ -3945,239 +6023,937 @@ async def upload_excel(company_id: str, file: UploadFile = File(...), currency:
         if not file.filename.endswith(('.xlsx', '.xls')):
             raise HTTPException(status_code=400, detail="Sadece Excel dosyaları (.xlsx, .xls) kabul edilir")
         
-        # Read file content
-        file_content = await file.read()
+        user_selected_currency, discount_percentage = parse_upload_options(currency, discount)
+        
+        # Yalnızca seçilen sayfalar ayrıştırılır
+        sheet_names = parse_sheet_names(sheets)
+        upload_options, saved_layout, layout_key = await excel_upload_options(
+            company_id, user_selected_currency, discount_percentage, sheet_names
+        )
+        
+        # Spool the upload to disk (hashing it on the way); the parsers read the file from its path
+        file_path, file_hash = await spool_upload(file)
         
-        # Try color-based parsing first, then fall back to traditional parsing
         try:
-            # Color-based parsing
-            products_data = ColorBasedExcelService.parse_colored_excel(file_content, company['name'])
-            logger.info(f"Color-based parsing successful: {len(products_data)} products")
-        except Exception as color_parse_error:
-            logger.warning(f"Color-based parsing failed: {color_parse_error}")
-            # Fall back to traditional parsing
-            products_data = excel_service.parse_excel_file(file_content)
-            logger.info(f"Traditional parsing used: {len(products_data)} products")
+            # Aynı dosya aynı seçeneklerle son yükleme olarak zaten işlendiyse tekrar yazılmaz
+            if not force and not dry_run:
+                duplicate_response = await find_duplicate_upload(company_id, file.filename, file_hash, upload_options)
+                if duplicate_response:
+                    return duplicate_response
+            
+            if background and not dry_run:
+                return await enqueue_excel_import(
+                    company, file_path, file.filename, file_hash, upload_options,
+                    user_selected_currency, discount_percentage, sheet_names
+                )
+            
+            parse_result = await load_excel_parse_result(
+                company, file_path, file.filename, file_hash, saved_layout, layout_key, sheet_names
+            )
+            # Özgün dosya, ileride yeni ayrıştırıcıyla tekrar işlenebilsin diye saklanır
+            stored_file = None
+            if parse_result[0] and not dry_run:
+                stored_file = await store_upload_file(file_path, file_hash, file.filename)
+        finally:
+            remove_spooled_upload(file_path)
+        products_data, color_table, detected_layout = parse_result
         
         if not products_data:
             raise HTTPException(status_code=400, detail="Excel dosyasında geçerli ürün verisi bulunamadı")
         
-        # Handle user-selected currency override
-        user_selected_currency = None
-        if currency and currency.upper() in ['USD', 'EUR', 'TRY']:
-            user_selected_currency = currency.upper()
-            logger.info(f"User selected currency override: {user_selected_currency}")
+        if dry_run:
+            preview = await preview_excel_import(company, iterate_product_chunks(products_data), user_selected_currency, discount_percentage)
+            preview["color_table"] = color_table
+            preview["column_layout"] = detected_layout
+            return upload_preview_response(preview, file_hash)
+        
+        # Bir sonraki yüklemede başlık tespiti atlanabilsin diye kullanılan eşleme kaydedilir
+        await save_detected_column_layout(company_id, saved_layout, detected_layout)
+        
+        async with company_write_lock(company_id):
+            return await import_product_chunks(
+                company, iterate_product_chunks(products_data), file.filename, file_hash, upload_options,
+                user_selected_currency, discount_percentage, color_table, stored_file=stored_file
+            )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error uploading Excel file: {e}")
+        raise HTTPException(status_code=500, detail=f"Excel dosyası yüklenemedi: {str(e)}")
+
+@api_router.post("/companies/{company_id}/upload-csv")
+async def upload_csv(
+    company_id: str,
+    file: UploadFile = File(...),
+    currency: str = Form(None),
+    discount: str = Form("0"),
+    force: bool = Form(False),
+    dry_run: bool = False
+):
+    """Upload a CSV/TSV price list for a company
+
+    The first line is the header and column roles are mapped like the general Excel format (no colours).
+    Rows are read and written chunk by chunk, so very large lists import with constant memory.
+    Re-upload detection, force, dry_run and the company lock (409) work as for upload-excel.
+    """
+    try:
+        company = await db.companies.find_one({"id": company_id})
+        if not company:
+            raise HTTPException(status_code=404, detail="Firma bulunamadı")
+        
+        if not file.filename.lower().endswith(('.csv', '.tsv')):
+            raise HTTPException(status_code=400, detail="Sadece CSV/TSV dosyaları (.csv, .tsv) kabul edilir")
         
-        # Handle discount percentage
-        discount_percentage = 0.0
+        user_selected_currency, discount_percentage = parse_upload_options(currency, discount)
+        upload_options = {"currency": user_selected_currency, "discount": discount_percentage}
+        
+        file_path, file_hash = await spool_upload(file, CSV_UPLOAD_MAX_BYTES)
         try:
-            if discount and discount.strip():
-                discount_percentage = float(discount)
-                if discount_percentage < 0 or discount_percentage > 100:
-                    raise ValueError("Discount must be between 0 and 100")
-                logger.info(f"User selected discount: {discount_percentage}%")
-        except ValueError as e:
-            logger.error(f"Invalid discount value: {discount}, error: {e}")
-            raise HTTPException(status_code=400, detail=f"Geçersiz iskonto değeri: {discount}")
-        
-        # Get current exchange rates
-        await currency_service.get_exchange_rates()
-        
-        # Initialize counters and tracking
-        new_products = 0
-        updated_products = 0
-        price_changes = []
-        currency_distribution = {}
-        created_products = []
-        
-        # Get existing products for this company for comparison
-        existing_products_cursor = db.products.find({"company_id": company_id})
-        existing_products = {product['name']: product async for product in existing_products_cursor}
-        
-        # Process and save products with smart update
-        for product_data in products_data:
-            try:
-                # Handle company management for color-based parsing
-                target_company_id = company_id
-                target_company_name = company['name']
-                
-                # If product has a different company name (from color-based parsing)
-                if (product_data.get('company_name') and 
-                    product_data['company_name'] != company['name'] and
-                    product_data['company_name'] != "Unknown"):
-                    
-                    # Check if this company already exists
-                    existing_company = await db.companies.find_one({"name": product_data['company_name']})
-                    if existing_company:
-                        target_company_id = existing_company['id']
-                        target_company_name = existing_company['name']
-                    else:
-                        # Create new company
-                        new_company_dict = {
-                            "id": str(uuid.uuid4()),
-                            "name": product_data['company_name'],
-                            "created_at": datetime.now(timezone.utc)
-                        }
-                        await db.companies.insert_one(new_company_dict)
-                        target_company_id = new_company_dict['id']
-                        target_company_name = new_company_dict['name']
-                        logger.info(f"Created new company: {product_data['company_name']}")
-                
-                # Use user-selected currency if provided, otherwise use detected currency
-                final_currency = user_selected_currency if user_selected_currency else product_data.get('currency', 'USD')
-                
-                # Apply discount if specified
-                original_list_price = Decimal(str(product_data['list_price']))
-                list_price = original_list_price  # Liste fiyatı orijinal fiyat olarak kalır
-                
-                # Calculate discounted price based on user discount percentage
-                discounted_price = None
-                if discount_percentage > 0:
-                    # İskonto yüzdesi varsa, orijinal fiyattan indirim yap
-                    discount_amount = original_list_price * (Decimal(str(discount_percentage)) / Decimal('100'))
-                    discounted_price = original_list_price - discount_amount
-                    logger.info(f"Applied {discount_percentage}% discount: {original_list_price} -> {discounted_price}")
-                elif product_data.get('discounted_price'):
-                    # Excel'de zaten indirimli fiyat varsa onu kullan
-                    discounted_price = Decimal(str(product_data['discounted_price']))
-                
-                # Convert prices to TRY
-                list_price_try = await currency_service.convert_to_try(list_price, final_currency)
-                
-                discounted_price_try = None
-                if discounted_price:
-                    discounted_price_try = await currency_service.convert_to_try(discounted_price, final_currency)
-                
-                # Count currency distribution (use final currency)
-                currency = final_currency
-                currency_distribution[currency] = currency_distribution.get(currency, 0) + 1
-                
-                # Check if product already exists (by name and company)
-                product_name = product_data['name']
-                if product_name in existing_products:
-                    # Product exists - update it
-                    existing_product = existing_products[product_name]
-                    old_list_price = float(existing_product.get('list_price', 0))
-                    new_list_price = float(product_data['list_price'])
-                    
-                    # Calculate price change
-                    new_list_price = float(list_price)
-                    if old_list_price != new_list_price:
-                        price_change_amount = new_list_price - old_list_price
-                        price_change_percent = ((new_list_price - old_list_price) / old_list_price * 100) if old_list_price > 0 else 0
-                        
-                        price_changes.append({
-                            "product_name": product_name,
-                            "old_price": old_list_price,
-                            "new_price": new_list_price,
-                            "change_amount": price_change_amount,
-                            "change_percent": round(price_change_percent, 2),
-                            "currency": currency,
-                            "change_type": "increase" if price_change_amount > 0 else "decrease"
-                        })
-                    
-                    # Update existing product
-                    update_data = {
-                        "brand": product_data.get('brand', ''),  # Marka güncellemesi
-                        "list_price": float(list_price),
-                        "discounted_price": float(discounted_price) if discounted_price else None,
-                        "currency": final_currency,
-                        "list_price_try": float(list_price_try),
-                        "discounted_price_try": float(discounted_price_try) if discounted_price_try else None,
-                        "updated_at": datetime.now(timezone.utc)
-                    }
+            if not force and not dry_run:
+                duplicate_response = await find_duplicate_upload(company_id, file.filename, file_hash, upload_options)
+                if duplicate_response:
+                    return duplicate_response
+            
+            product_chunks = stream_csv_product_chunks(file_path, file.filename)
+            if dry_run:
+                preview = await preview_excel_import(company, product_chunks, user_selected_currency, discount_percentage)
+                if not preview['total_products']:
+                    raise HTTPException(status_code=400, detail="Dosyada geçerli ürün verisi bulunamadı")
+                return upload_preview_response(preview, file_hash)
+            
+            async with company_write_lock(company_id):
+                return await import_product_chunks(
+                    company, product_chunks, file.filename, file_hash, upload_options,
+                    user_selected_currency, discount_percentage,
+                    stored_file=await store_upload_file(file_path, file_hash, file.filename)
+                )
+        finally:
+            remove_spooled_upload(file_path)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error uploading CSV file: {e}")
+        raise HTTPException(status_code=500, detail=f"CSV dosyası yüklenemedi: {str(e)}")
+
+@api_router.post("/upload-excel/batch")
+async def upload_excel_batch(
+    files: List[UploadFile] = File(...),
+    company_ids: str = Form(...),
+    currency: str = Form(None),
+    discount: str = Form("0"),
+    force: bool = Form(False)
+):
+    """Upload several Excel price lists at once: the n-th file belongs to the n-th id of company_ids
+
+    company_ids is comma separated, one id per file (a company may appear more than once).
+    All workbooks are parsed concurrently in the parse executor; then each company's files are
+    committed on their own (companies in parallel, a company's files in upload order), so a failing
+    file never affects the others. Prices of the whole batch use a single exchange-rate snapshot.
+    Returns one result per file, shaped like the upload-excel response, and a combined summary;
+    a file whose company is busy (job or other upload running) fails with status_code 409.
+    """
+    try:
+        ids = [company_id.strip() for company_id in company_ids.split(",") if company_id.strip()]
+        if not files or len(ids) != len(files):
+            raise HTTPException(status_code=400, detail="Her dosya için bir firma belirtilmelidir (company_ids)")
+        if len(files) > MAX_BATCH_UPLOAD_FILES:
+            raise HTTPException(status_code=400, detail=f"Tek seferde en fazla {MAX_BATCH_UPLOAD_FILES} dosya yüklenebilir")
+        for file in files:
+            if not file.filename.endswith(('.xlsx', '.xls')):
+                raise HTTPException(status_code=400, detail=f"Sadece Excel dosyaları (.xlsx, .xls) kabul edilir: {file.filename}")
+        
+        companies = {company['id']: company async for company in db.companies.find({"id": {"$in": list(set(ids))}})}
+        missing_ids = [company_id for company_id in ids if company_id not in companies]
+        if missing_ids:
+            raise HTTPException(status_code=404, detail=f"Firma bulunamadı: {', '.join(missing_ids)}")
+        
+        user_selected_currency, discount_percentage = parse_upload_options(currency, discount)
+        
+        # Tüm dosyalar aynı kur görüntüsüyle TL'ye çevrilir
+        rates = await currency_service.get_exchange_rates()
+        
+        spooled_files = []
+        parse_tasks = []
+        try:
+            for file in files:
+                spooled_files.append(await spool_upload(file))
+            
+            async def parse_item(index: int):
+                """(duplicate response, None) for an unchanged re-upload, else (None, parse context)"""
+                company = companies[ids[index]]
+                file_path, file_hash = spooled_files[index]
+                upload_options, saved_layout, layout_key = await excel_upload_options(
+                    company['id'], user_selected_currency, discount_percentage, None
+                )
+                if not force:
+                    duplicate_response = await find_duplicate_upload(company['id'], files[index].filename, file_hash, upload_options)
+                    if duplicate_response:
+                        return duplicate_response, None
+                parse_result = await load_excel_parse_result(
+                    company, file_path, files[index].filename, file_hash, saved_layout, layout_key, None
+                )
+                stored_file = await store_upload_file(file_path, file_hash, files[index].filename) if parse_result[0] else None
+                return None, (upload_options, saved_layout, parse_result, stored_file)
+            
+            async def commit_item(index: int) -> Dict[str, Any]:
+                company = companies[ids[index]]
+                result = {"company_id": company['id'], "company_name": company['name'], "filename": files[index].filename}
+                try:
+                    duplicate_response, parsed = await parse_tasks[index]
+                    if duplicate_response:
+                        return {**result, **duplicate_response}
                     
-                    await db.products.update_one(
-                        {"id": existing_product['id']},
-                        {"$set": update_data}
-                    )
-                    updated_products += 1
+                    upload_options, saved_layout, (products_data, color_table, detected_layout), stored_file = parsed
+                    if not products_data:
+                        raise HTTPException(status_code=400, detail="Excel dosyasında geçerli ürün verisi bulunamadı")
                     
-                else:
-                    # New product - create it
-                    product_dict = {
-                        "id": str(uuid.uuid4()),
-                        "name": product_data['name'],
-                        "company_id": target_company_id,
-                        "brand": product_data.get('brand', ''),  # Marka alanı
-                        "description": product_data.get('description'),
-                        "image_url": None,
-                        "list_price": float(list_price),
-                        "discounted_price": float(discounted_price) if discounted_price else None,
-                        "currency": final_currency,
-                        "list_price_try": float(list_price_try),
-                        "discounted_price_try": float(discounted_price_try) if discounted_price_try else None,
-                        "created_at": datetime.now(timezone.utc)
-                    }
-                    
-                    await db.products.insert_one(product_dict)
-                    created_products.append(Product(**product_dict))
-                    new_products += 1
-                
-            except Exception as e:
-                logger.warning(f"Error processing product {product_data.get('name', 'Unknown')}: {e}")
-                continue
-        
-        # Create upload history record
-        upload_history = {
-            "id": str(uuid.uuid4()),
-            "company_id": company_id,
-            "company_name": company['name'],
-            "filename": file.filename,
-            "upload_date": datetime.now(timezone.utc),
-            "total_products": len(products_data),
-            "new_products": new_products,
-            "updated_products": updated_products,
-            "currency_distribution": currency_distribution,
-            "price_changes": price_changes,
-            "status": "completed"
+                    await save_detected_column_layout(company['id'], saved_layout, detected_layout)
+                    async with company_write_lock(company['id']):
+                        response = await import_product_chunks(
+                            company, iterate_product_chunks(products_data), files[index].filename, spooled_files[index][1],
+                            upload_options, user_selected_currency, discount_percentage, color_table, rates,
+                            stored_file=stored_file
+                        )
+                    return {**result, **response}
+                except HTTPException as e:
+                    return {**result, "success": False, "status_code": e.status_code, "error": e.detail}
+                except Exception as e:
+                    logger.error(f"Error uploading {files[index].filename} in batch: {e}")
+                    return {**result, "success": False, "status_code": 500, "error": f"Excel dosyası yüklenemedi: {str(e)}"}
+            
+            async def commit_company(indexes: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+                return [(index, await commit_item(index)) for index in indexes]
+            
+            parse_tasks = [asyncio.ensure_future(parse_item(index)) for index in range(len(files))]
+            
+            company_indexes = {}
+            for index, company_id in enumerate(ids):
+                company_indexes.setdefault(company_id, []).append(index)
+            results = [None] * len(files)
+            for company_results in await asyncio.gather(*(commit_company(indexes) for indexes in company_indexes.values())):
+                for index, result in company_results:
+                    results[index] = result
+        finally:
+            for task in parse_tasks:
+                task.cancel()
+            for file_path, _ in spooled_files:
+                remove_spooled_upload(file_path)
+        
+        summary = {
+            "files": len(results),
+            "succeeded_files": 0,
+            "failed_files": 0,
+            "duplicate_files": 0,
+            "total_products": 0,
+            "new_products": 0,
+            "updated_products": 0,
+            "unchanged_products": 0,
+            "failed_products": 0,
+            "price_changes": 0,
+            "currency_distribution": {}
         }
-        
-        await db.upload_history.insert_one(upload_history)
-        
-        # Create detailed response message
-        messages = []
-        if new_products > 0:
-            messages.append(f"{new_products} yeni ürün eklendi")
-        if updated_products > 0:
-            messages.append(f"{updated_products} ürün güncellendi")
-        if price_changes:
-            price_increases = len([c for c in price_changes if c['change_type'] == 'increase'])
-            price_decreases = len([c for c in price_changes if c['change_type'] == 'decrease'])
-            if price_increases > 0:
-                messages.append(f"{price_increases} ürünün fiyatı zamlandı")
-            if price_decreases > 0:
-                messages.append(f"{price_decreases} ürünün fiyatı ucuzladı")
-        
-        message = ". ".join(messages) if messages else "Liste başarıyla yüklendi"
+        for result in results:
+            if not result['success']:
+                summary["failed_files"] += 1
+                continue
+            summary["succeeded_files"] += 1
+            if result.get('duplicate_of'):
+                summary["duplicate_files"] += 1
+            for key in ("total_products", "new_products", "updated_products", "unchanged_products", "failed_products", "price_changes"):
+                summary[key] += result['summary'][key]
+            for currency_code, count in result['summary']['currency_distribution'].items():
+                summary["currency_distribution"][currency_code] = summary["currency_distribution"].get(currency_code, 0) + count
+        
+        message = (
+            f"{summary['succeeded_files']}/{summary['files']} dosya yüklendi: {summary['new_products']} yeni ürün, "
+            f"{summary['updated_products']} güncellendi, {summary['unchanged_products']} değişmedi"
+        )
+        if summary["failed_files"]:
+            message += f". {summary['failed_files']} dosya yüklenemedi"
         
         return {
-            "success": True,
+            "success": summary["failed_files"] == 0,
             "message": message,
-            "upload_id": upload_history["id"],
-            "summary": {
-                "total_products": len(products_data),
-                "new_products": new_products,
-                "updated_products": updated_products,
-                "price_changes": len(price_changes),
-                "currency_distribution": currency_distribution
-            }
+            "summary": summary,
+            "results": results
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error uploading Excel file: {e}")
-        raise HTTPException(status_code=500, detail=f"Excel dosyası yüklenemedi: {str(e)}")
+        logger.error(f"Error uploading Excel batch: {e}")
+        raise HTTPException(status_code=500, detail=f"Excel dosyaları yüklenemedi: {str(e)}")
+
+# Watched upload inbox: price lists dropped into UPLOAD_INBOX_DIR/<firma>/ are imported automatically
+UPLOAD_INBOX_DIR = os.environ.get('UPLOAD_INBOX_DIR') or None  # None: watcher disabled
+UPLOAD_INBOX_POLL_SECONDS = float(os.environ.get('UPLOAD_INBOX_POLL_SECONDS', 30))
+UPLOAD_INBOX_SETTLE_SECONDS = float(os.environ.get('UPLOAD_INBOX_SETTLE_SECONDS', 10))
+UPLOAD_INBOX_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.tsv')
+upload_inbox_observed = {}  # path -> (size, mtime_ns) seen on the previous poll
+upload_inbox_handled = {}  # path -> (size, mtime_ns) already imported or skipped
+upload_inbox_task = None
+
+def scan_upload_inbox(root: str) -> List[Tuple[str, str, int, int]]:
+    """(company folder, path, size, mtime_ns) of the price lists in the inbox subfolders"""
+    entries = []
+    with os.scandir(root) as folders:
+        for folder in folders:
+            if folder.name.startswith('.') or not folder.is_dir():
+                continue
+            with os.scandir(folder.path) as files:
+                for entry in files:
+                    # Excel kilit dosyaları (~$) ve gizli/geçici dosyalar atlanır
+                    if (entry.name.startswith(('.', '~$')) or not entry.name.lower().endswith(UPLOAD_INBOX_EXTENSIONS)
+                            or not entry.is_file()):
+                        continue
+                    stat = entry.stat()
+                    entries.append((folder.name, entry.path, stat.st_size, stat.st_mtime_ns))
+    return entries
+
+def spool_local_file(path: str, max_bytes: int) -> Tuple[str, str]:
+    """Copy a local file to the upload spool like spool_upload, so it may change while it is parsed
+
+    Returns the spool path and the SHA-256 of the copied content.
+    """
+    if os.path.getsize(path) > max_bytes:
+        raise HTTPException(status_code=413, detail=upload_too_large_detail(max_bytes))
+    fd, spool_path = tempfile.mkstemp(prefix="upload_", suffix=Path(path).suffix, dir=EXCEL_UPLOAD_SPOOL_DIR)
+    try:
+        content_hash = hashlib.sha256()
+        with open(path, "rb") as source, os.fdopen(fd, "wb") as spool:
+            while chunk := source.read(UPLOAD_SPOOL_CHUNK_SIZE):
+                content_hash.update(chunk)
+                spool.write(chunk)
+    except BaseException:
+        remove_spooled_upload(spool_path)
+        raise
+    return spool_path, content_hash.hexdigest()
+
+async def resolve_inbox_company(folder_name: str) -> Optional[Dict[str, Any]]:
+    """Company of an inbox subfolder, named by company id or company name (Turkish letters folded)"""
+    company = await db.companies.find_one({"$or": [{"id": folder_name}, {"name": folder_name}]})
+    if company:
+        return company
+    folded_name = fold_turkish_text(folder_name)
+    async for company in db.companies.find({}, {"_id": 0}):
+        if fold_turkish_text(company['name']) == folded_name:
+            return company
+    return None
+
+async def record_failed_upload(company: Dict[str, Any], filename: str, file_hash: Optional[str],
+                               upload_options: Dict[str, Any], error: str, source: str,
+                               stored_file: Optional[str] = None, upload_id: Optional[str] = None,
+                               summary: Optional[Dict[str, Any]] = None):
+    """Upload history entry of an upload that could not be imported
+
+    With upload_id the entry is only added when the upload has none yet (a partial import already
+    recorded its own, a background job keeps its entry). summary holds the counts of the rows written
+    before the import stopped.
+    """
+    upload_history = UploadHistory(
+        company_id=company['id'],
+        company_name=company['name'],
+        filename=filename,
+        total_products=0,
+        new_products=0,
+        updated_products=0,
+        currency_distribution={},
+        file_hash=file_hash,
+        parser_version=EXCEL_PARSER_VERSION,
+        upload_options=upload_options,
+        status="failed",
+        source=source,
+        error=error,
+        stored_file=stored_file
+    ).dict()
+    if upload_id:
+        upload_history["id"] = upload_id
+    upload_history.update(summary or {})
+    await db.upload_history.update_one({"id": upload_history["id"]}, {"$setOnInsert": upload_history}, upsert=True)
+
+async def import_inbox_file(folder_name: str, path: str) -> Optional[Dict[str, Any]]:
+    """Import one inbox file through the upload pipeline (default options); failures go to upload_history
+
+    A file whose content was already handled from the inbox under the same name is skipped, also
+    after a restart, so the watcher only imports new or changed files.
+    """
+    filename = os.path.basename(path)
+    company = await resolve_inbox_company(folder_name)
+    if not company:
+        logger.warning(f"Upload inbox: no company for folder '{folder_name}', {filename} skipped")
+        return None
+    
+    is_csv = filename.lower().endswith(('.csv', '.tsv'))
+    upload_options = {"currency": None, "discount": 0.0}
+    file_path = file_hash = stored_file = None
+    upload_id = str(uuid.uuid4())
+    try:
+        loop = asyncio.get_running_loop()
+        file_path, file_hash = await loop.run_in_executor(
+            None, spool_local_file, path, CSV_UPLOAD_MAX_BYTES if is_csv else EXCEL_UPLOAD_MAX_BYTES
+        )
+        if not is_csv:
+            upload_options, saved_layout, layout_key = await excel_upload_options(company['id'], None, 0.0, None)
+        
+        last_import = await db.upload_history.find_one(
+            {"company_id": company['id'], "filename": filename, "source": "inbox"},
+            sort=[("upload_date", -1)]
+        )
+        # Aynı içerik başarısız olduysa da tekrar denenmez; ayrıştırıcı sürümü veya seçenekler değişince denenir
+        if (last_import and last_import.get('file_hash') == file_hash
+                and last_import.get('parser_version') == EXCEL_PARSER_VERSION
+                and last_import.get('upload_options') == upload_options):
+            logger.info(f"Upload inbox: {folder_name}/{filename} already imported, skipped")
+            return None
+        
+        # Ayrıştırılamayan dosyalar da saklanır: ayrıştırıcı düzeltilince yeniden işlenebilir
+        stored_file = await store_upload_file(file_path, file_hash, filename)
+        if is_csv:
+            product_chunks = stream_csv_product_chunks(file_path, filename)
+            color_table = None
+        else:
+            products_data, color_table, detected_layout = await load_excel_parse_result(
+                company, file_path, filename, file_hash, saved_layout, layout_key, None
+            )
+            if not products_data:
+                raise HTTPException(status_code=400, detail="Excel dosyasında geçerli ürün verisi bulunamadı")
+            await save_detected_column_layout(company['id'], saved_layout, detected_layout)
+            product_chunks = iterate_product_chunks(products_data)
+        
+        async with company_write_lock(company['id']):
+            result = await import_product_chunks(
+                company, product_chunks, filename, file_hash, upload_options, None, 0.0, color_table, source="inbox",
+                upload_id=upload_id, stored_file=stored_file
+            )
+        logger.info(f"Upload inbox: {folder_name}/{filename} imported - {result['message']}")
+        return result
+    except Exception as e:
+        if isinstance(e, HTTPException) and e.status_code == 409:
+            # Firmanın başka bir işlemi sürüyor: dosya bir sonraki taramada tekrar denenir
+            logger.info(f"Upload inbox: {folder_name}/{filename} postponed, the company is busy")
+            upload_inbox_handled.pop(path, None)
+            return None
+        error = e.detail if isinstance(e, HTTPException) else str(e)
+        logger.error(f"Upload inbox: {folder_name}/{filename} could not be imported: {error}")
+        await record_failed_upload(company, filename, file_hash, upload_options, error, "inbox", stored_file, upload_id)
+        return None
+    finally:
+        remove_spooled_upload(file_path)
+
+async def poll_upload_inbox(root: str) -> int:
+    """One pass over the inbox: import the new or changed files that have settled, returns their count"""
+    entries = await asyncio.get_running_loop().run_in_executor(None, scan_upload_inbox, root)
+    now_ns = time.time_ns()
+    observed = {}
+    imported = 0
+    for folder_name, path, size, mtime_ns in entries:
+        state = (size, mtime_ns)
+        observed[path] = state
+        if upload_inbox_handled.get(path) == state:
+            continue
+        # Yazılmakta olan dosya beklenir: iki taramada boyutu/zamanı aynı kalmalı ve yeterince eski olmalı
+        if upload_inbox_observed.get(path) != state or now_ns - mtime_ns < UPLOAD_INBOX_SETTLE_SECONDS * 1e9:
+            continue
+        upload_inbox_handled[path] = state
+        if await import_inbox_file(folder_name, path):
+            imported += 1
+    
+    upload_inbox_observed.clear()
+    upload_inbox_observed.update(observed)
+    # Silinen dosyalar unutulur; aynı adla tekrar bırakılırsa yeniden değerlendirilir
+    for path in [path for path in upload_inbox_handled if path not in observed]:
+        del upload_inbox_handled[path]
+    return imported
+
+async def watch_upload_inbox(root: str):
+    """Poll the upload inbox forever (files are imported one at a time)"""
+    logger.info(f"Watching upload inbox {root} every {UPLOAD_INBOX_POLL_SECONDS:g}s")
+    while True:
+        try:
+            await poll_upload_inbox(root)
+        except Exception as e:
+            logger.error(f"Upload inbox poll failed: {e}")
+        await asyncio.sleep(UPLOAD_INBOX_POLL_SECONDS)
+
+def start_upload_inbox_watcher():
+    """Start the inbox watcher when UPLOAD_INBOX_DIR is configured"""
+    global upload_inbox_task
+    if not UPLOAD_INBOX_DIR:
+        return
+    if not os.path.isdir(UPLOAD_INBOX_DIR):
+        logger.error(f"UPLOAD_INBOX_DIR {UPLOAD_INBOX_DIR} is not a directory, upload inbox disabled")
+        return
+    upload_inbox_task = asyncio.create_task(watch_upload_inbox(UPLOAD_INBOX_DIR))
+
+def stop_upload_inbox_watcher():
+    if upload_inbox_task:
+        upload_inbox_task.cancel()
+
+# Background jobs: long operations are queued in db.jobs and run by a worker holding a renewable lease.
+# A worker is started inside the API process unless JOB_WORKER_IN_APP=false; separate workers run with
+# `python -m backend.worker`. Jobs with the same serial_key (company:<id>) never run at the same time.
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 120))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 2))
+JOB_RETRY_DELAY_SECONDS = 30  # attempt n is retried after n * 30 s
+JOB_CLAIM_SCAN_LIMIT = 50  # queued jobs looked at per claim (jobs of busy companies are skipped)
+JOB_WORKER_IN_APP = os.environ.get('JOB_WORKER_IN_APP', 'true').lower() != 'false'
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', 1))
+# Queued uploads are kept here until their job finishes; workers must see the same directory
+UPLOAD_JOB_DIR = os.environ.get('UPLOAD_JOB_DIR') or str(ROOT_DIR / 'upload_jobs')
+job_worker_task = None
+
+async def enqueue_job(job_type: str, params: Dict[str, Any], serial_key: Optional[str] = None,
+                      upload_id: Optional[str] = None) -> Dict[str, Any]:
+    job = Job(type=job_type, params=params, serial_key=serial_key, upload_id=upload_id).dict()
+    await db.jobs.insert_one(job)
+    job.pop('_id', None)
+    logger.info(f"Queued {job_type} job {job['id']}")
+    return job
+
+def job_response(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Response of an endpoint that queued a background job"""
+    return {
+        "success": True,
+        "message": "İşlem arka planda çalışmak üzere sıraya alındı",
+        "job_id": job['id'],
+        "status": job['status'],
+        "upload_id": job.get('upload_id')
+    }
+
+async def acquire_job_lock(key: str, job_id: str, expires_at: datetime) -> bool:
+    """Take (or renew) the serial lock of a job; False while another job holds an unexpired lock"""
+    try:
+        await db.job_locks.update_one(
+            {"_id": key, "$or": [{"job_id": job_id}, {"expires_at": {"$lt": datetime.now(timezone.utc)}}]},
+            {"$set": {"job_id": job_id, "expires_at": expires_at}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def release_job_lock(job: Dict[str, Any]):
+    if job.get('serial_key'):
+        await db.job_locks.delete_one({"_id": job['serial_key'], "job_id": job['id']})
+
+COMPANY_BUSY_DETAIL = "Bu firma için devam eden bir işlem var, daha sonra tekrar deneyin"
+
+@asynccontextmanager
+async def company_write_lock(company_id: str):
+    """Hold the company:<id> serial lock during a foreground import, rollback or relabel
+
+    Jobs of the company are not claimed meanwhile; 409 when a job or another request of the company
+    holds the lock. The lock is renewed like a job lease until the block ends.
+    """
+    holder = {"id": f"request:{uuid.uuid4()}", "serial_key": f"company:{company_id}"}
+    
+    def lock_expiry() -> datetime:
+        return datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)
+    
+    if not await acquire_job_lock(holder['serial_key'], holder['id'], lock_expiry()):
+        raise HTTPException(status_code=409, detail=COMPANY_BUSY_DETAIL)
+    
+    async def renew_lock():
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            if not await acquire_job_lock(holder['serial_key'], holder['id'], lock_expiry()):
+                logger.warning(f"Lock {holder['serial_key']} of request {holder['id']} was taken over")
+                return
+    
+    renewal = asyncio.ensure_future(renew_lock())
+    try:
+        yield
+    finally:
+        renewal.cancel()
+        await release_job_lock(holder)
+
+async def claim_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """Lease the oldest runnable queued job whose serial lock is free"""
+    now = datetime.now(timezone.utc)
+    lease_expires_at = now + timedelta(seconds=JOB_LEASE_SECONDS)
+    candidates = await db.jobs.find(
+        {"status": "queued", "run_after": {"$lte": now}}, {"_id": 0, "id": 1, "serial_key": 1}
+    ).sort("created_at", 1).limit(JOB_CLAIM_SCAN_LIMIT).to_list(JOB_CLAIM_SCAN_LIMIT)
+    
+    for candidate in candidates:
+        if candidate.get('serial_key') and not await acquire_job_lock(candidate['serial_key'], candidate['id'], lease_expires_at):
+            continue
+        job = await db.jobs.find_one_and_update(
+            {"id": candidate['id'], "status": "queued"},
+            {
+                "$set": {"status": "running", "lease_owner": worker_id, "lease_expires_at": lease_expires_at, "started_at": now},
+                "$inc": {"attempts": 1}
+            },
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            return job
+        # Başka bir işçi önce aldı
+        await release_job_lock(candidate)
+    return None
+
+async def finish_job(job: Dict[str, Any], status: str, worker_id: Optional[str] = None,
+                     result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
+    """Move a job to a final state and clean up its lock, upload file and upload history entry
+
+    With worker_id the job is only finished while that worker holds its lease; False (and no cleanup)
+    when the lease was lost, since another worker may already run the job again.
+    """
+    job_filter = {"id": job['id']}
+    if worker_id:
+        job_filter["lease_owner"] = worker_id
+    finished = await db.jobs.update_one(job_filter, {"$set": {
+        "status": status,
+        "result": result,
+        "error": error,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "finished_at": datetime.now(timezone.utc)
+    }})
+    if not finished.matched_count:
+        logger.warning(f"Job {job['id']} ({job['type']}) lease lost before it could be marked {status}")
+        return False
+    await release_job_lock(job)
+    remove_spooled_upload(job['params'].get('file_path'))
+    if job.get('upload_id') and status != "completed":
+        await db.upload_history.update_one(
+            {"id": job['upload_id'], "status": "processing"},
+            {"$set": {"status": status, "error": error}}
+        )
+    logger.info(f"Job {job['id']} ({job['type']}) {status}" + (f": {error}" if error else ""))
+    return True
+
+async def retry_or_fail_job(job: Dict[str, Any], worker_id: Optional[str], error: str):
+    """Queue the job again after a delay, or fail it once its attempts are used up"""
+    if job['attempts'] >= job['max_attempts']:
+        await finish_job(job, "failed", worker_id, error=error)
+        return
+    job_filter = {"id": job['id']}
+    if worker_id:
+        job_filter["lease_owner"] = worker_id
+    requeued = await db.jobs.update_one(job_filter, {"$set": {
+        "status": "queued",
+        "error": error,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "run_after": datetime.now(timezone.utc) + timedelta(seconds=JOB_RETRY_DELAY_SECONDS * job['attempts'])
+    }})
+    if not requeued.matched_count:
+        logger.warning(f"Job {job['id']} ({job['type']}) lease lost before it could be retried")
+        return
+    await release_job_lock(job)
+    logger.warning(f"Job {job['id']} ({job['type']}) attempt {job['attempts']} failed, will retry: {error}")
+
+async def recover_expired_jobs():
+    """Requeue (or fail) running jobs whose worker stopped renewing the lease"""
+    async for job in db.jobs.find(
+        {"status": "running", "lease_expires_at": {"$lt": datetime.now(timezone.utc)}}, {"_id": 0}
+    ):
+        if job.get('cancel_requested'):
+            await finish_job(job, "cancelled", job['lease_owner'], error="İş iptal edildi")
+        else:
+            await retry_or_fail_job(job, job['lease_owner'], "İşçi yanıt vermedi (süre aşımı)")
+
+async def run_job(job: Dict[str, Any], worker_id: str):
+    """Run a claimed job, renewing its lease until it ends; cancel requests stop it at the next renewal"""
+    handler = JOB_HANDLERS.get(job['type'])
+    if not handler:
+        await finish_job(job, "failed", worker_id, error=f"Bilinmeyen iş türü: {job['type']}")
+        return
+    
+    async def report_progress(done: int, total: Optional[int] = None):
+        await db.jobs.update_one(
+            {"id": job['id'], "lease_owner": worker_id},
+            {"$set": {"progress": {"done": done, "total": total}}}
+        )
+    
+    task = asyncio.ensure_future(handler(job, report_progress))
+    lease_lost = False
+    lock_lost = False
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=JOB_LEASE_SECONDS / 3)
+            if task.done():
+                break
+            lease_expires_at = datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)
+            current = await db.jobs.find_one_and_update(
+                {"id": job['id'], "lease_owner": worker_id},
+                {"$set": {"lease_expires_at": lease_expires_at}},
+                projection={"_id": 0, "cancel_requested": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            lease_lost = current is None
+            if not lease_lost and job.get('serial_key'):
+                lock_lost = not await acquire_job_lock(job['serial_key'], job['id'], lease_expires_at)
+            if lease_lost or lock_lost or current.get('cancel_requested'):
+                # İptal istendi, kira başka bir işçiye geçti ya da firma kilidi başka bir işe geçti
+                task.cancel()
+                await asyncio.wait({task})
+    except asyncio.CancelledError:
+        # İşçi kapanıyor: iş hemen tekrar sıraya alınır, deneme hakkı harcanmaz
+        task.cancel()
+        requeued = await db.jobs.update_one(
+            {"id": job['id'], "lease_owner": worker_id},
+            {"$set": {"status": "queued", "lease_owner": None, "lease_expires_at": None}, "$inc": {"attempts": -1}}
+        )
+        if requeued.matched_count:
+            await release_job_lock(job)
+        raise
+    
+    if lease_lost:
+        # İş başka bir işçide yeniden çalışıyor olabilir: kilidine ve dosyasına dokunulmaz
+        logger.warning(f"Job {job['id']} ({job['type']}) stopped, its lease was taken over")
+    elif lock_lost:
+        await retry_or_fail_job(job, worker_id, "İşin firma kilidi başka bir işe geçti")
+    elif task.cancelled():
+        await finish_job(job, "cancelled", worker_id, error="İş iptal edildi")
+    elif isinstance(task.exception(), HTTPException) and task.exception().status_code < 500:
+        # Dosya/istek hatası: tekrar denemek sonucu değiştirmez
+        await finish_job(job, "failed", worker_id, error=task.exception().detail)
+    elif task.exception():
+        error = task.exception()
+        logger.error(f"Job {job['id']} ({job['type']}) failed: {error}")
+        await retry_or_fail_job(job, worker_id, error.detail if isinstance(error, HTTPException) else str(error))
+    else:
+        await finish_job(job, "completed", worker_id, result=jsonable_encoder(task.result()))
+
+async def run_job_worker(worker_id: Optional[str] = None, concurrency: int = JOB_WORKER_CONCURRENCY):
+    """Claim and run jobs forever, concurrency jobs at a time"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Job worker {worker_id} started ({concurrency} slots)")
+    
+    async def worker_slot(slot: int):
+        slot_id = f"{worker_id}:{slot}"
+        while True:
+            try:
+                await recover_expired_jobs()
+                job = await claim_job(slot_id)
+                if job:
+                    await run_job(job, slot_id)
+                    continue
+            except Exception as e:
+                logger.error(f"Job worker {slot_id} error: {e}")
+            await asyncio.sleep(JOB_POLL_SECONDS)
+    
+    await asyncio.gather(*(worker_slot(slot) for slot in range(concurrency)))
+
+def start_job_worker():
+    """Run a job worker inside the API process unless JOB_WORKER_IN_APP=false"""
+    global job_worker_task
+    if JOB_WORKER_IN_APP:
+        job_worker_task = asyncio.create_task(run_job_worker())
+
+def stop_job_worker():
+    if job_worker_task:
+        job_worker_task.cancel()
+
+async def enqueue_excel_import(company: Dict[str, Any], file_path: str, filename: str, file_hash: str,
+                               upload_options: Dict[str, Any], user_selected_currency: Optional[str],
+                               discount_percentage: float, sheet_names: Optional[List[str]]) -> Dict[str, Any]:
+    """Queue a spooled Excel upload as an excel_import job with a "processing" upload history entry"""
+    # Aynı dosya aynı seçeneklerle zaten sıradaysa yeni iş açılmaz
+    pending_job = await db.jobs.find_one({
+        "type": "excel_import",
+        "status": {"$in": ["queued", "running"]},
+        "params.company_id": company['id'],
+        "params.file_hash": file_hash,
+        "params.upload_options": upload_options
+    }, {"_id": 0})
+    if pending_job:
+        return job_response(pending_job)
+    
+    stored_file = await store_upload_file(file_path, file_hash, filename)
+    os.makedirs(UPLOAD_JOB_DIR, exist_ok=True)
+    job_file_path = os.path.join(UPLOAD_JOB_DIR, f"{uuid.uuid4()}{Path(filename).suffix}")
+    shutil.move(file_path, job_file_path)
+    
+    upload_history = UploadHistory(
+        company_id=company['id'],
+        company_name=company['name'],
+        filename=filename,
+        total_products=0,
+        new_products=0,
+        updated_products=0,
+        currency_distribution={},
+        file_hash=file_hash,
+        parser_version=EXCEL_PARSER_VERSION,
+        upload_options=upload_options,
+        status="processing",
+        stored_file=stored_file
+    )
+    await db.upload_history.insert_one(upload_history.dict())
+    
+    job = await enqueue_job("excel_import", {
+        "company_id": company['id'],
+        "filename": filename,
+        "file_path": job_file_path,
+        "file_hash": file_hash,
+        "upload_options": upload_options,
+        "currency": user_selected_currency,
+        "discount": discount_percentage,
+        "sheets": sheet_names,
+        "stored_file": stored_file
+    }, serial_key=f"company:{company['id']}", upload_id=upload_history.id)
+    return job_response(job)
+
+async def run_excel_import_job(job: Dict[str, Any], report_progress) -> Dict[str, Any]:
+    params = job['params']
+    company = await db.companies.find_one({"id": params['company_id']})
+    if not company:
+        raise HTTPException(status_code=404, detail="Firma bulunamadı")
+    
+    upload_options, saved_layout, layout_key = await excel_upload_options(
+        company['id'], params['currency'], params['discount'], params.get('sheets')
+    )
+    products_data, color_table, detected_layout = await load_excel_parse_result(
+        company, params['file_path'], params['filename'], params['file_hash'], saved_layout, layout_key, params.get('sheets')
+    )
+    if not products_data:
+        raise HTTPException(status_code=400, detail="Excel dosyasında geçerli ürün verisi bulunamadı")
+    
+    await save_detected_column_layout(company['id'], saved_layout, detected_layout)
+    total = len(products_data)
+    await report_progress(0, total)
+    return await import_product_chunks(
+        company, iterate_product_chunks(products_data), params['filename'], params['file_hash'], upload_options,
+        params['currency'], params['discount'], color_table,
+        upload_id=job['upload_id'], on_progress=lambda done: report_progress(done, total),
+        stored_file=params.get('stored_file')
+    )
+
+async def run_reparse_upload_job(job: Dict[str, Any], report_progress) -> Dict[str, Any]:
+    """Import the stored file of an earlier upload again with the current parser, under the same upload"""
+    upload = await db.upload_history.find_one({"id": job['params']['upload_id']}, {"_id": 0})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload bulunamadı")
+    file_path = stored_upload_path(upload.get('stored_file'))
+    if not file_path:
+        raise HTTPException(status_code=404, detail="Yüklemenin özgün dosyası saklanmamış")
+    company = await db.companies.find_one({"id": upload['company_id']})
+    if not company:
+        raise HTTPException(status_code=404, detail="Firma bulunamadı")
+    
+    options = upload.get('upload_options') or {}
+    currency, discount = options.get('currency'), options.get('discount', 0.0)
+    if upload['filename'].lower().endswith(('.csv', '.tsv')):
+        upload_options = {"currency": currency, "discount": discount}
+        product_chunks = stream_csv_product_chunks(file_path, upload['filename'])
+        color_table = None
+        total = None
+    else:
+        upload_options, saved_layout, layout_key = await excel_upload_options(
+            company['id'], currency, discount, options.get('sheets')
+        )
+        products_data, color_table, _ = await load_excel_parse_result(
+            company, file_path, upload['filename'], upload['file_hash'], saved_layout, layout_key, options.get('sheets')
+        )
+        if not products_data:
+            raise HTTPException(status_code=400, detail="Excel dosyasında geçerli ürün verisi bulunamadı")
+        product_chunks = iterate_product_chunks(products_data)
+        total = len(products_data)
+    
+    # Geri alma kayıtları yeniden işlemeden öncesini gösterir
+    await db.upload_before_images.delete_many({"upload_id": upload['id']})
+    await report_progress(0, total)
+    return await import_product_chunks(
+        company, product_chunks, upload['filename'], upload['file_hash'], upload_options,
+        currency, discount, color_table, on_progress=lambda done: report_progress(done, total),
+        stored_file=upload['stored_file'], reparse_of=upload
+    )
+
+async def run_refresh_prices_job(job: Dict[str, Any], report_progress) -> Dict[str, Any]:
+    updated_count = await refresh_all_product_prices(report_progress)
+    return {"updated_count": updated_count}
+
+async def run_change_upload_currency_job(job: Dict[str, Any], report_progress) -> Dict[str, Any]:
+    upload = await db.upload_history.find_one({"id": job['params']['upload_id']})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload bulunamadı")
+    return await apply_upload_currency_change(upload, job['params']['new_currency'])
+
+async def run_rollback_upload_job(job: Dict[str, Any], report_progress) -> Dict[str, Any]:
+    upload = await db.upload_history.find_one({"id": job['params']['upload_id']})
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload bulunamadı")
+    if upload.get('status') not in ("completed", "failed"):
+        raise HTTPException(status_code=400, detail=f"Bu upload geri alınamaz (durum: {upload.get('status')})")
+    return await apply_upload_rollback(upload)
+
+JOB_HANDLERS = {
+    "excel_import": run_excel_import_job,
+    "reparse_upload": run_reparse_upload_job,
+    "refresh_prices": run_refresh_prices_job,
+    "change_upload_currency": run_change_upload_currency_job,
+    "rollback_upload": run_rollback_upload_job
+}
+
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    """Get the status, progress and result of a background job"""
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="İş bulunamadı")
+    return Job(**job)
+
+@api_router.post("/jobs/{job_id}/cancel", response_model=Job)
+async def cancel_job(job_id: str):
+    """Cancel a background job: a queued job is cancelled at once, a running one at its next lease renewal
+
+    Rows an import wrote before it was stopped stay written.
+    """
+    # Sıradaki iş tek adımda iptal edilir, böylece arada bir işçi tarafından alınamaz
+    job = await db.jobs.find_one_and_update(
+        {"id": job_id, "status": "queued"},
+        {"$set": {"status": "cancelled", "cancel_requested": True}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if job:
+        await finish_job(job, "cancelled", error="İş iptal edildi")
+    else:
+        job = await db.jobs.find_one_and_update(
+            {"id": job_id, "status": "running"},
+            {"$set": {"cancel_requested": True}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if not job:
+            if not await db.jobs.find_one({"id": job_id}, {"_id": 1}):
+                raise HTTPException(status_code=404, detail="İş bulunamadı")
+            raise HTTPException(status_code=400, detail="İş zaten tamamlandı")
+    return Job(**await db.jobs.find_one({"id": job_id}, {"_id": 0}))
 
 @api_router.get("/products/count")
 async def get_products_count(
     company_id: Optional[str] = None,
     category_id: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    approximate: bool = False
 ):
     """Get optimized total count of products with optional filters"""
     try:
+        # Yaklaşık mod: aramasız, tek filtreli sorgular sayaçlardan O(1) okunur
+        if approximate and not (search and search.strip()):
+            if not company_id and not category_id:
+                count = await db.products.estimated_document_count()
+                return {"count": count, "approximate": True}
+            if bool(company_id) != bool(category_id):
+                counter_id = f"company:{company_id}" if company_id else f"category:{category_id}"
+                counter = await db.product_counters.find_one({"_id": counter_id})
+                return {"count": max(counter["count"], 0) if counter else 0, "approximate": True}
+        
+        # Normalize edilmiş filtreye göre önbellek; başka süreçteki yazmalar nesli artırır
+        cache_key = (
+            await product_count_generation(),
+            company_id or "", category_id or "", " ".join((search or "").split()).lower()
+        )
+        cached = products_count_cache.get(cache_key)
+        if cached and time.time() - cached[1] < COUNT_CACHE_DURATION:
+            return {"count": cached[0]}
+        
         query = {}
         if company_id:
             query["company_id"] = company_id
@@ -4191,8 +6967,8 @@ async def get_products_count(
             else:
                 # Fallback for short searches
                 query["$or"] = [
-                    {"name": {"$regex": f"^{search}", "$options": "i"}},
-                    {"brand": {"$regex": f"^{search}", "$options": "i"}}
+                    {"name": {"$regex": f"^{search_term}", "$options": "i"}},
+                    {"brand": {"$regex": f"^{search_term}", "$options": "i"}}
                 ]
             
         # Use estimated count for better performance on large collections
@@ -4200,6 +6976,10 @@ async def get_products_count(
             count = await db.products.estimated_document_count()
         else:
             count = await db.products.count_documents(query)
+        
+        if len(products_count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            products_count_cache.pop(next(iter(products_count_cache)))
+        products_count_cache[cache_key] = (count, time.time())
             
         return {"count": count}
     except Exception as e:
@@ -4225,9 +7005,13 @@ async def get_products(
     page: int = 1,
     limit: int = 100,
     skip_pagination: bool = False,  # For backward compatibility
+    display_currency: Optional[str] = None,
     request: Request = None
 ):
     """Get products with optimized pagination, filtering by company, category, or search term"""
+    # Tek kur anlık görüntüsü, dönüşüm aggregation içinde yapılır
+    display_rate = await resolve_display_rate(display_currency)
+    
     try:
         query = {}
         if company_id:
@@ -4299,8 +7083,19 @@ async def get_products(
         else:
             pipeline.append({"$limit": 5000})  # Max limit
         
-        # Execute aggregation pipeline
-        cursor = db.products.aggregate(pipeline)
+        # _id JSON'a çevrilemez, sadece sayfadaki ürünler için çıkarılır
+        pipeline.append({"$project": {"_id": 0}})
+        
+        # Display currency: converted on the page only, after skip/limit
+        if display_rate:
+            pipeline.append({"$addFields": {
+                "display_currency": display_currency.upper(),
+                "display_list_price": display_price_expression("$list_price_try", display_rate),
+                "display_discounted_price": display_price_expression("$discounted_price_try", display_rate)
+            }})
+        
+        # Execute aggregation pipeline (Turkish collation matches the tr_* indexes)
+        cursor = db.products.aggregate(pipeline, collation=PRODUCT_NAME_COLLATION)
         products = await cursor.to_list(None)
         
         # Convert Decimal fields to float for JSON serialization
@@ -4318,6 +7113,8 @@ async def get_products(
             
             response_data.append(product)
         
+        response_data = jsonable_encoder(response_data)
+        
         # PERFORMANCE: Cache invalidation for products to ensure fresh sorting
         if not search:
             response = JSONResponse(content=response_data)
@@ -4366,7 +7163,7 @@ async def get_products(
             
             skip = (page - 1) * limit if not skip_pagination else 0
             # IMPORTANT: Use the same sorting as aggregate pipeline - FAVORITES FIRST!
-            products = await db.products.find(basic_query).sort([("is_favorite", -1), ("name", 1)]).skip(skip).limit(limit).to_list(limit)
+            products = await db.products.find(basic_query).collation(PRODUCT_NAME_COLLATION).sort([("is_favorite", -1), ("name", 1)]).skip(skip).limit(limit).to_list(limit)
             
             # Convert Decimal fields to float for JSON serialization
             response_data = []
@@ -4381,6 +7178,11 @@ async def get_products(
                 if 'discounted_price_try' in product and isinstance(product['discounted_price_try'], Decimal):
                     product['discounted_price_try'] = float(product['discounted_price_try'])
                 
+                if display_rate:
+                    product['display_currency'] = display_currency.upper()
+                    product['display_list_price'] = convert_from_try_value(product.get('list_price_try'), display_rate)
+                    product['display_discounted_price'] = convert_from_try_value(product.get('discounted_price_try'), display_rate)
+                
                 response_data.append(product)
             
             return response_data
@@ -4413,6 +7215,8 @@ async def create_product(product: ProductCreate):
         product_data = jsonable_encoder(product.dict())
         product_data["id"] = str(uuid.uuid4())  
         product_data["created_at"] = datetime.now(timezone.utc)
+        product_data["fingerprint"] = build_product_fingerprint(product.name, product.brand)
+        product_data["name_key"] = build_product_name_key(product.name)
         
         # Convert prices to TRY
         if product.currency == 'USD':
@@ -4429,10 +7233,15 @@ async def create_product(product: ProductCreate):
                 product_data["discounted_price_try"] = float(product.discounted_price)
         
         # Insert into database
-        await db.products.insert_one(product_data)
+        try:
+            await db.products.insert_one(product_data)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail=DUPLICATE_PRODUCT_NAME_DETAIL)
         
         # PERFORMANCE: Invalidate cache
         invalidate_cache("/api/products")
+        await adjust_product_counters([(product.company_id, product.category_id, 1)])
+        await refresh_product_groups_safely([product_data["fingerprint"]])
         
         return Product(**product_data)
         
@@ -4442,50 +7251,98 @@ async def create_product(product: ProductCreate):
         logger.error(f"Error creating product: {e}")
         raise HTTPException(status_code=500, detail="Ürün oluşturulamadı")
 
-
-@api_router.post("/refresh-prices")
-async def refresh_prices():
-    """Refresh all product prices with current exchange rates"""
+@api_router.post("/products/batch")
+async def get_products_batch(batch_request: ProductBatchRequest):
+    """Get many products by id in one query, reporting ids that were not found"""
     try:
-        # Get fresh exchange rates
-        await currency_service.get_exchange_rates()
+        if len(batch_request.ids) > MAX_BATCH_PRODUCT_IDS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tek seferde en fazla {MAX_BATCH_PRODUCT_IDS} ürün istenebilir"
+            )
         
-        # Get all products
-        products = await db.products.find().to_list(None)
-        updated_count = 0
+        products_by_id = await get_documents_by_ids(db.products, batch_request.ids, batch_request.fields)
         
-        for product in products:
-            try:
-                if product['currency'] != 'TRY':
-                    # Convert prices to TRY
-                    list_price_try = await currency_service.convert_to_try(
-                        Decimal(str(product['list_price'])), 
-                        product['currency']
-                    )
-                    
-                    discounted_price_try = None
-                    if product.get('discounted_price'):
-                        discounted_price_try = await currency_service.convert_to_try(
-                            Decimal(str(product['discounted_price'])), 
-                            product['currency']
-                        )
-                    
-                    # Update product
-                    await db.products.update_one(
-                        {"id": product["id"]},
-                        {
-                            "$set": {
-                                "list_price_try": float(list_price_try),
-                                "discounted_price_try": float(discounted_price_try) if discounted_price_try else None
-                            }
-                        }
-                    )
-                    updated_count += 1
-                    
-            except Exception as e:
-                logger.warning(f"Error updating product {product.get('name', 'Unknown')}: {e}")
-                continue
+        # İstek sırasını koru, tekrar eden id'leri bir kez döndür
+        requested_ids = list(dict.fromkeys(batch_request.ids))
+        products = [products_by_id[pid] for pid in requested_ids if pid in products_by_id]
+        missing_ids = [pid for pid in requested_ids if pid not in products_by_id]
+        
+        return {
+            "products": products,
+            "missing_ids": missing_ids,
+            "requested": len(requested_ids),
+            "found": len(products)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting products batch: {e}")
+        raise HTTPException(status_code=500, detail="Ürünler getirilemedi")
+
+
+async def refresh_all_product_prices(on_progress=None) -> int:
+    """Recompute the TRY prices of all foreign-currency products with fresh rates; returns the updated count
+
+    Products are streamed and written in bulk chunks; on_progress is awaited with (done, total) per chunk.
+    """
+    # Get fresh exchange rates (tek görüntü, ürün başına kur isteği yok)
+    rates = await currency_service.get_exchange_rates()
+    
+    query = {"currency": {"$ne": "TRY"}}
+    total = await db.products.count_documents(query)
+    updated_count = 0
+    operations = []
+    
+    async def flush():
+        nonlocal operations, updated_count
+        failed_rows = await bulk_write_chunk(db.products, operations)
+        updated_count += len(operations) - len(failed_rows)
+        operations = []
+        if on_progress:
+            await on_progress(updated_count, total)
+    
+    async for product in db.products.find(query, {"_id": 0, "id": 1, "name": 1, "list_price": 1, "discounted_price": 1, "currency": 1}):
+        try:
+            # Convert prices to TRY
+            list_price_try = currency_service.convert_with_rates(
+                Decimal(str(product['list_price'])), product['currency'], rates
+            )
+            discounted_price_try = None
+            if product.get('discounted_price'):
+                discounted_price_try = currency_service.convert_with_rates(
+                    Decimal(str(product['discounted_price'])), product['currency'], rates
+                )
+        except Exception as e:
+            logger.warning(f"Error updating product {product.get('name', 'Unknown')}: {e}")
+            continue
+        
+        operations.append(UpdateOne(
+            {"id": product["id"]},
+            {"$set": {
+                "list_price_try": float(list_price_try),
+                "discounted_price_try": float(discounted_price_try) if discounted_price_try else None
+            }}
+        ))
+        if len(operations) >= BULK_WRITE_CHUNK_SIZE:
+            await flush()
+    await flush()
+    
+    # Döviz kurları tüm TL fiyatlarını etkiler, karşılaştırma gruplarını baştan oluştur
+    await refresh_product_groups_safely()
+    return updated_count
+
+@api_router.post("/refresh-prices")
+async def refresh_prices(background: bool = False):
+    """Refresh all product prices with current exchange rates
+
+    With background the refresh runs as a refresh_prices job (poll GET /api/jobs/{job_id}).
+    """
+    try:
+        if background:
+            return job_response(await enqueue_job("refresh_prices", {}, serial_key="refresh_prices"))
         
+        updated_count = await refresh_all_product_prices()
         return {
             "success": True,
             "message": f"{updated_count} ürünün fiyatı güncellendi",
@@ -4496,6 +7353,115 @@ async def refresh_prices():
         logger.error(f"Error refreshing prices: {e}")
         raise HTTPException(status_code=500, detail="Fiyatlar güncellenemedi")
 
+# Price Comparison Endpoints
+@api_router.get("/product-groups")
+async def get_product_groups(
+    page: int = 1,
+    limit: int = 50,
+    min_companies: int = 2,
+    search: Optional[str] = None
+):
+    """Get equivalent product groups across suppliers, biggest savings first"""
+    try:
+        query = {"company_count": {"$gte": min_companies}}
+        if search and search.strip():
+            # Gruplar katlanmış token anahtarına göre tutulur, arama da aynı forma çevrilir
+            search_tokens = fold_turkish_text(search).split()
+            if search_tokens:
+                query["$and"] = [{"fingerprint": {"$regex": re.escape(token)}} for token in search_tokens]
+        
+        page = max(page, 1)
+        limit = min(max(limit, 1), 200)
+        
+        total = await db.product_groups.count_documents(query)
+        groups = await db.product_groups.find(query, {"_id": 0, "refresh_id": 0}).sort(
+            [("savings_try", -1), ("fingerprint", 1)]
+        ).skip((page - 1) * limit).limit(limit).to_list(limit)
+        
+        return {
+            "groups": groups,
+            "total": total,
+            "page": page,
+            "limit": limit
+        }
+    except Exception as e:
+        logger.error(f"Error getting product groups: {e}")
+        raise HTTPException(status_code=500, detail="Fiyat karşılaştırma grupları getirilemedi")
+
+@api_router.post("/product-groups/rebuild")
+async def rebuild_product_groups():
+    """Backfill missing fingerprints and rebuild all price comparison groups"""
+    try:
+        backfilled = await backfill_product_fingerprints()
+        group_count = await refresh_product_groups()
+        return {
+            "success": True,
+            "message": f"{group_count} karşılaştırma grubu oluşturuldu",
+            "backfilled_products": backfilled,
+            "group_count": group_count
+        }
+    except Exception as e:
+        logger.error(f"Error rebuilding product groups: {e}")
+        raise HTTPException(status_code=500, detail="Fiyat karşılaştırma grupları oluşturulamadı")
+
+# Column Layout Endpoints
+@api_router.get("/companies/{company_id}/column-layout", response_model=ColumnLayout)
+async def get_company_column_layout(company_id: str):
+    """Get the saved Excel column layout of a company"""
+    layout = await get_column_layout(company_id)
+    if not layout:
+        raise HTTPException(status_code=404, detail="Kayıtlı kolon eşlemesi bulunamadı")
+    return ColumnLayout(**layout)
+
+@api_router.put("/companies/{company_id}/column-layout", response_model=ColumnLayout)
+async def pin_company_column_layout(company_id: str, layout_update: ColumnLayoutUpdate):
+    """Pin a column layout: later uploads use it without header detection, even if the header changes"""
+    try:
+        company = await db.companies.find_one({"id": company_id})
+        if not company:
+            raise HTTPException(status_code=404, detail="Firma bulunamadı")
+        
+        if layout_update.parser not in ('color', 'traditional'):
+            raise HTTPException(status_code=400, detail="Geçersiz ayrıştırıcı, 'color' veya 'traditional' olmalı")
+        if not layout_update.sheets:
+            raise HTTPException(status_code=400, detail="En az bir sayfa eşlemesi gerekli")
+        if layout_update.parser == 'traditional' and len(layout_update.sheets) > 1:
+            raise HTTPException(status_code=400, detail="Geleneksel ayrıştırıcı yalnızca ilk sayfayı okur")
+        
+        for sheet in layout_update.sheets:
+            if sheet.header_row < -1:
+                raise HTTPException(status_code=400, detail=f"Geçersiz başlık satırı: {sheet.header_row}")
+            if layout_update.parser != 'color':
+                continue
+            if not sheet.sheet:
+                raise HTTPException(status_code=400, detail="Renk tabanlı eşlemede sayfa adı gerekli")
+            unknown_roles = set(sheet.columns) - set(COLUMN_LAYOUT_ROLES)
+            if unknown_roles:
+                raise HTTPException(status_code=400, detail=f"Geçersiz kolon rolleri: {', '.join(sorted(unknown_roles))}")
+            if sheet.columns.get('product_name', -1) < 0 or sheet.columns.get('list_price', -1) < 0:
+                raise HTTPException(status_code=400, detail="Ürün adı ve liste fiyatı kolonları gerekli")
+            if sheet.currency and sheet.currency not in ['USD', 'EUR', 'TRY']:
+                raise HTTPException(status_code=400, detail=f"Geçersiz para birimi: {sheet.currency}")
+        
+        layout = ColumnLayout(company_id=company_id, parser=layout_update.parser, sheets=layout_update.sheets, pinned=True)
+        await db.column_layouts.update_one({"company_id": company_id}, {"$set": layout.dict()}, upsert=True)
+        logger.info(f"Pinned column layout for company {company_id}")
+        return layout
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error pinning column layout: {e}")
+        raise HTTPException(status_code=500, detail="Kolon eşlemesi kaydedilemedi")
+
+@api_router.delete("/companies/{company_id}/column-layout")
+async def delete_company_column_layout(company_id: str):
+    """Forget the saved column layout; the next upload detects the columns again"""
+    result = await db.column_layouts.delete_one({"company_id": company_id})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Kayıtlı kolon eşlemesi bulunamadı")
+    return {"success": True, "message": "Kolon eşlemesi silindi"}
+
 # Upload History Endpoints
 @api_router.get("/companies/{company_id}/upload-history", response_model=List[UploadHistoryResponse])
 async def get_company_upload_history(company_id: str):
@@ -4547,8 +7513,12 @@ async def get_all_upload_history():
         raise HTTPException(status_code=500, detail="Upload geçmişi getirilemedi")
 
 @api_router.post("/upload-history/{upload_id}/change-currency")
-async def change_upload_currency(upload_id: str, new_currency: str):
-    """Change currency for all products in a specific upload"""
+async def change_upload_currency(upload_id: str, new_currency: str, background: bool = False):
+    """Change currency for all products in a specific upload
+
+    With background the change runs as a change_upload_currency job, after any running import
+    of the same company (poll GET /api/jobs/{job_id}).
+    """
     try:
         # Validate currency
         valid_currencies = ['USD', 'EUR', 'TRY', 'GBP']
@@ -4560,123 +7530,328 @@ async def change_upload_currency(upload_id: str, new_currency: str):
         if not upload:
             raise HTTPException(status_code=404, detail="Upload bulunamadı")
         
-        # Get current exchange rates
-        await currency_service.get_exchange_rates()
-        
-        # Find all products uploaded in this batch
-        # We'll identify products by upload date range (within 5 minutes of upload)
-        upload_date = upload['upload_date']
-        start_time = upload_date - timedelta(minutes=5)
-        end_time = upload_date + timedelta(minutes=5)
-        
-        # Get products from this company within the time range
-        company_id = upload['company_id']
-        products_cursor = db.products.find({
-            "company_id": company_id,
-            "created_at": {"$gte": start_time, "$lte": end_time}
-        })
-        products = await products_cursor.to_list(None)
-        
-        if not products:
-            # Alternative method: get products by estimated count
-            # This is less precise but more reliable
-            company_products_cursor = db.products.find({"company_id": company_id}).sort("created_at", -1)
-            all_company_products = await company_products_cursor.to_list(None)
-            
-            # Take approximately the number of products that were in the upload
-            expected_count = upload.get('total_products', 0)
-            if expected_count > 0 and len(all_company_products) >= expected_count:
-                products = all_company_products[:expected_count]
-            else:
-                raise HTTPException(status_code=404, detail="Bu upload'a ait ürünler bulunamadı")
+        if background:
+            return job_response(await enqueue_job(
+                "change_upload_currency", {"upload_id": upload_id, "new_currency": new_currency},
+                serial_key=f"company:{upload['company_id']}"
+            ))
         
-        updated_count = 0
-        price_changes = []
+        async with company_write_lock(upload['company_id']):
+            return await apply_upload_currency_change(upload, new_currency)
         
-        # Update each product's currency (PRESERVE PRICE VALUES, ONLY CHANGE CURRENCY LABEL)
-        for product in products:
-            try:
-                old_currency = product.get('currency', 'TRY')
-                old_list_price = product.get('list_price', 0)
-                old_discounted_price = product.get('discounted_price')
-                
-                # Skip if already in target currency
-                if old_currency == new_currency:
-                    continue
-                
-                ## IMPORTANT: Keep the same price values, only change currency label
-                ## This is for cases where Excel had correct prices but wrong currency was detected
-                
-                # Keep the same numeric values, just change the currency
-                new_list_price = old_list_price  # Same value!
-                new_discounted_price = old_discounted_price  # Same value!
-                
-                # Recalculate TRY prices based on new currency (for internal calculations)
-                new_list_price_try = await currency_service.convert_to_try(
-                    Decimal(str(new_list_price)), new_currency
-                )
-                
-                new_discounted_price_try = None
-                if new_discounted_price:
-                    new_discounted_price_try = await currency_service.convert_to_try(
-                        Decimal(str(new_discounted_price)), new_currency
-                    )
-                
-                # Update product in database
-                update_data = {
-                    "currency": new_currency,
-                    "list_price": float(new_list_price),  # Same numeric value
-                    "list_price_try": float(new_list_price_try),  # Recalculated for TRY
-                    "updated_at": datetime.now(timezone.utc)
-                }
-                
-                if new_discounted_price:
-                    update_data["discounted_price"] = float(new_discounted_price)  # Same numeric value
-                    update_data["discounted_price_try"] = float(new_discounted_price_try)  # Recalculated for TRY
-                    
-                    await db.products.update_one(
-                        {"id": product['id']},
-                        {"$set": update_data}
-                    )
-                    
-                    updated_count += 1
-                    
-                    # Track currency change (prices stay the same, only currency label changes)
-                    price_changes.append({
-                        "product_name": product['name'],
-                        "old_currency": old_currency,
-                        "new_currency": new_currency,
-                        "price_value": float(old_list_price),  # Same value in both currencies
-                        "change_type": "currency_label_only"
-                    })
-                    
-            except Exception as e:
-                logger.warning(f"Error updating product {product.get('name', 'Unknown')}: {e}")
-                continue
-        
-        # Update upload history to reflect the currency change
-        await db.upload_history.update_one(
-            {"id": upload_id},
-            {
-                "$set": {
-                    "currency_changes": price_changes,
-                    "last_currency_update": datetime.now(timezone.utc)
-                }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error changing upload currency: {e}")
+        raise HTTPException(status_code=500, detail=f"Para birimi güncellenemedi: {str(e)}")
+
+async def keep_relabel_before_images(upload_id: str, product_query: Dict[str, Any]):
+    """Turn the ownership-only before-images of the products a relabel will change into full ones
+
+    Unchanged rows of an upload only record their previous owner; once the relabel writes them,
+    rolling the upload back must also restore their old currency and TRY prices.
+    """
+    images = db.upload_before_images.find(
+        {"upload_id": upload_id, "owner_only": True}, {"_id": 0, "product_id": 1, "fields": 1}
+    )
+    while True:
+        chunk = await images.to_list(BULK_WRITE_CHUNK_SIZE)
+        if not chunk:
+            break
+        previous_owners = {image['product_id']: image.get('fields', {}) for image in chunk}
+        operations = []
+        async for product in db.products.find(
+            {**product_query, "id": {"$in": list(previous_owners)}}, UPLOAD_SNAPSHOT_PROJECTION
+        ):
+            fields = {
+                field: product[field] for field in UPLOAD_BEFORE_IMAGE_FIELDS
+                if field in product and field != "last_upload_id"
             }
-        )
+            fields.update(previous_owners[product['id']])
+            operations.append(UpdateOne(
+                {"upload_id": upload_id, "product_id": product['id'], "owner_only": True},
+                {"$set": {"fields": fields}, "$unset": {"owner_only": ""}}
+            ))
+        if operations:
+            await db.upload_before_images.bulk_write(operations, ordered=False)
+
+async def apply_upload_currency_change(upload: Dict[str, Any], new_currency: str) -> Dict[str, Any]:
+    """Relabel the currency of the products of an upload (price values are kept, TRY prices recomputed)
+
+    The products are the ones stamped with the upload as their last_upload_id: one indexed pipeline
+    update_many, without loading them. Products imported again by a later upload belong to that upload.
+    Unchanged rows the upload only stamped are relabeled too; their before-images are completed first,
+    so a rollback of the upload restores them and hands them back to their previous upload.
+    """
+    upload_id = upload['id']
+    product_query = {"last_upload_id": upload_id}
+    if not await db.products.find_one(product_query, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Bu upload'a ait ürünler bulunamadı")
+    
+    # Get current exchange rates
+    rates = await currency_service.get_exchange_rates()
+    rate = float(rates.get(new_currency, Decimal('1'))) if new_currency != 'TRY' else 1.0
+    
+    # Skip products already in target currency
+    product_query["currency"] = {"$ne": new_currency}
+    sample_products = await db.products.find(
+        product_query, {"_id": 0, "name": 1, "currency": 1, "list_price": 1}
+    ).limit(10).to_list(10)
+    fingerprints = await db.products.distinct("fingerprint", product_query)
+    
+    # Yüklemenin değiştirmeden sahiplendiği ürünlerin eski hali saklanır; geri alma etiketi de geri alır
+    await keep_relabel_before_images(upload_id, product_query)
+    
+    ## IMPORTANT: Keep the same price values, only change currency label
+    ## This is for cases where Excel had correct prices but wrong currency was detected
+    result = await db.products.update_many(product_query, [{"$set": {
+        "currency": new_currency,
+        "list_price_try": {"$multiply": ["$list_price", rate]},
+        "discounted_price_try": {"$cond": [
+            {"$ifNull": ["$discounted_price", False]},
+            {"$multiply": ["$discounted_price", rate]},
+            None
+        ]},
+        "updated_at": datetime.now(timezone.utc)
+    }}])
+    updated_count = result.modified_count
+    
+    await refresh_product_groups_safely(fingerprints)
+    
+    # Track currency change (prices stay the same, only currency label changes)
+    currency_changes = [
+        {
+            "product_name": product['name'],
+            "old_currency": product.get('currency'),
+            "new_currency": new_currency,
+            "price_value": float(product.get('list_price') or 0),  # Same value in both currencies
+            "change_type": "currency_label_only"
+        }
+        for product in sample_products
+    ]
+    
+    # Update upload history to reflect the currency change
+    await db.upload_history.update_one(
+        {"id": upload_id},
+        {
+            "$set": {
+                "currency_changes": currency_changes,
+                "currency_changed_products": updated_count,
+                "last_currency_update": datetime.now(timezone.utc)
+            }
+        }
+    )
+    
+    return {
+        "success": True,
+        "message": f"{updated_count} ürünün para birimi {new_currency} olarak güncellendi (fiyat değerleri aynı kaldı)",
+        "updated_count": updated_count,
+        "currency_changes": currency_changes  # Show first 10 changes
+    }
+
+@api_router.post("/upload-history/reparse")
+async def reparse_uploads(company_id: Optional[str] = None, upload_ids: Optional[str] = None, include_current: bool = False):
+    """Queue reparse_upload jobs that import stored upload files again with the current parser
+
+    upload_ids (comma separated) selects uploads directly; otherwise the latest stored upload of each
+    file name is taken (of company_id, or of all companies). Uploads already imported by the current
+    EXCEL_PARSER_VERSION are skipped unless include_current is set. Jobs of a company run one at a
+    time in upload order; each re-import keeps its upload's id and date (poll GET /api/jobs/{job_id}).
+    """
+    try:
+        query = {"stored_file": {"$ne": None}, "status": {"$in": ["completed", "failed"]}}
+        if company_id:
+            query["company_id"] = company_id
+        selected_ids = [upload_id.strip() for upload_id in (upload_ids or "").split(",") if upload_id.strip()]
+        if selected_ids:
+            query["id"] = {"$in": selected_ids}
+        
+        uploads = {}
+        async for upload in db.upload_history.find(
+            query, {"_id": 0, "id": 1, "company_id": 1, "filename": 1, "upload_date": 1, "parser_version": 1}
+        ).sort("upload_date", 1):
+            # Aynı adlı dosyanın yalnızca son yüklemesi tekrar işlenir (seçilenler hariç)
+            uploads[upload['id'] if selected_ids else (upload['company_id'], upload['filename'])] = upload
+        if selected_ids and len(uploads) != len(set(selected_ids)):
+            missing_ids = sorted(set(selected_ids) - set(uploads))
+            raise HTTPException(status_code=404, detail=f"Yeniden işlenebilecek upload bulunamadı: {', '.join(missing_ids)}")
+        
+        jobs = []
+        for upload in sorted(uploads.values(), key=lambda upload: upload['upload_date']):
+            if not include_current and upload.get('parser_version') == EXCEL_PARSER_VERSION:
+                continue
+            pending_job = await db.jobs.find_one({
+                "type": "reparse_upload", "status": {"$in": ["queued", "running"]}, "params.upload_id": upload['id']
+            }, {"_id": 0})
+            jobs.append(pending_job or await enqueue_job(
+                "reparse_upload", {"upload_id": upload['id']},
+                serial_key=f"company:{upload['company_id']}", upload_id=upload['id']
+            ))
         
         return {
             "success": True,
-            "message": f"{updated_count} ürünün para birimi {new_currency} olarak güncellendi (fiyat değerleri aynı kaldı)",
-            "updated_count": updated_count,
-            "currency_changes": price_changes[:10]  # Show first 10 changes
+            "message": f"{len(jobs)} yükleme yeniden işlenmek üzere sıraya alındı",
+            "queued": len(jobs),
+            "jobs": [job_response(job) for job in jobs]
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error changing upload currency: {e}")
-        raise HTTPException(status_code=500, detail=f"Para birimi güncellenemedi: {str(e)}")
+        logger.error(f"Error queueing upload reparse: {e}")
+        raise HTTPException(status_code=500, detail=f"Yüklemeler yeniden işlenemedi: {str(e)}")
+
+@api_router.post("/upload-history/{upload_id}/rollback")
+async def rollback_upload(upload_id: str, background: bool = False):
+    """Undo an upload: restore the before-images of the products it changed and delete the ones it created
+
+    Products imported again by a later upload belong to that upload and are left as they are.
+    With background the rollback runs as a rollback_upload job, after any running import of the
+    same company (poll GET /api/jobs/{job_id}).
+    """
+    try:
+        upload = await db.upload_history.find_one({"id": upload_id})
+        if not upload:
+            raise HTTPException(status_code=404, detail="Upload bulunamadı")
+        if upload.get('status') not in ("completed", "failed"):
+            raise HTTPException(status_code=400, detail=f"Bu upload geri alınamaz (durum: {upload.get('status')})")
+        
+        lock_key = f"company:{upload['company_id']}"
+        if background:
+            return job_response(await enqueue_job("rollback_upload", {"upload_id": upload_id}, serial_key=lock_key))
+        
+        # Aynı firmanın içe aktarımı sürerken geri alma yapılmaz
+        async with company_write_lock(upload['company_id']):
+            return await apply_upload_rollback(upload)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error rolling back upload: {e}")
+        raise HTTPException(status_code=500, detail=f"Upload geri alınamadı: {str(e)}")
+
+async def apply_upload_rollback(upload: Dict[str, Any]) -> Dict[str, Any]:
+    """Restore the before-images of an upload with guarded bulk writes
+
+    Every write is guarded by last_upload_id, so products changed by a later upload or edited by hand
+    in the meantime are skipped (and counted) instead of being overwritten with older prices. Products
+    the upload only stamped (unchanged rows) are handed back to their previous owner upload. TRY prices
+    of restored products are recomputed from the restored prices at current rates.
+    """
+    upload_id = upload['id']
+    if not await db.upload_before_images.find_one({"upload_id": upload_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Bu upload için geri alma kaydı bulunamadı (süresi dolmuş olabilir)")
+    
+    # Hâlâ bu yüklemeye ait olan ürünler
+    owned_products = {}
+    async for product in db.products.find(
+        {"last_upload_id": upload_id}, {"_id": 0, "id": 1, "company_id": 1, "category_id": 1, "fingerprint": 1}
+    ):
+        owned_products[product['id']] = product
+    
+    restore_operations = []
+    owner_operations = []
+    created_products = []
+    fingerprints = set()
+    skipped_products = 0
+    rates = await currency_service.get_exchange_rates()
+    async for image in db.upload_before_images.find({"upload_id": upload_id}, {"_id": 0}):
+        product = owned_products.get(image['product_id'])
+        if not product:
+            skipped_products += 1
+            continue
+        product_filter = {"id": image['product_id'], "last_upload_id": upload_id}
+        fields = image.get('fields', {})
+        if image.get('owner_only'):
+            previous_owner = fields.get('last_upload_id')
+            owner_operations.append(UpdateOne(
+                product_filter,
+                {"$set": {"last_upload_id": previous_owner}} if previous_owner else {"$unset": {"last_upload_id": ""}}
+            ))
+            continue
+        fingerprints.add(product.get('fingerprint'))
+        if image.get('created'):
+            created_products.append(product)
+            continue
+        # Eski kayıtlardaki TL fiyatları yazılmaz; değerler $literal ile pipeline ifadesi sayılmaz
+        fields = {field: value for field, value in fields.items() if field in UPLOAD_BEFORE_IMAGE_FIELDS}
+        update = [{"$set": {field: {"$literal": value} for field, value in fields.items()}}]
+        # Yüklemeden önce olmayan alanlar (ör. eski ürünlerde last_upload_id) kaldırılır
+        missing_fields = [field for field in UPLOAD_BEFORE_IMAGE_FIELDS if field not in fields]
+        if missing_fields:
+            update.append({"$unset": missing_fields})
+        currency = (fields.get('currency') or 'TRY').upper()
+        rate = float(rates.get(currency, Decimal('1'))) if currency != 'TRY' else 1.0
+        update.append({"$set": {
+            "list_price_try": {"$multiply": [{"$ifNull": ["$list_price", 0]}, rate]},
+            "discounted_price_try": {"$cond": [
+                {"$ifNull": ["$discounted_price", False]},
+                {"$multiply": ["$discounted_price", rate]},
+                None
+            ]}
+        }})
+        restore_operations.append(UpdateOne(product_filter, update))
+        fingerprints.add(fields.get('fingerprint'))
+    
+    async def guarded_bulk_write(operations) -> Tuple[int, int]:
+        """Run the guarded writes; returns (matched writes, failed writes)"""
+        if not operations:
+            return 0, 0
+        try:
+            result = await db.products.bulk_write(operations, ordered=False)
+            return result.matched_count, 0
+        except BulkWriteError as e:
+            return e.details.get('nMatched', 0), len(e.details.get('writeErrors', []))
+    
+    restored_products, failed_restores = await guarded_bulk_write(restore_operations)
+    released_products, failed_releases = await guarded_bulk_write(owner_operations)
+    failed_products = failed_restores + failed_releases
+    if failed_products:
+        logger.warning(f"Rollback of upload {upload_id}: {failed_products} of "
+                       f"{len(restore_operations) + len(owner_operations)} writes failed")
+    
+    # Yüklemenin eklediği ürünler silinir; arada başka yüklemeye geçenler kalır
+    deleted_products = []
+    for chunk_start in range(0, len(created_products), BULK_WRITE_CHUNK_SIZE):
+        chunk = created_products[chunk_start:chunk_start + BULK_WRITE_CHUNK_SIZE]
+        product_ids = [product['id'] for product in chunk]
+        result = await db.products.delete_many({"id": {"$in": product_ids}, "last_upload_id": upload_id})
+        if result.deleted_count == len(chunk):
+            deleted_products.extend(chunk)
+        elif result.deleted_count:
+            remaining_ids = set(await db.products.distinct("id", {"id": {"$in": product_ids}}))
+            deleted_products.extend(product for product in chunk if product['id'] not in remaining_ids)
+    
+    skipped_products += (
+        len(restore_operations) - restored_products - failed_restores
+        + len(owner_operations) - released_products - failed_releases
+        + len(created_products) - len(deleted_products)
+    )
+    await adjust_product_counters([
+        (product.get('company_id'), product.get('category_id'), -1) for product in deleted_products
+    ])
+    fingerprints.discard(None)
+    await refresh_product_groups_safely(list(fingerprints))
+    
+    rollback_summary = {
+        "restored_products": restored_products,
+        "deleted_products": len(deleted_products),
+        "released_products": released_products,
+        "skipped_products": skipped_products,
+        "failed_products": failed_products
+    }
+    await db.upload_history.update_one(
+        {"id": upload_id},
+        {"$set": {"status": "rolled_back", "rolled_back_at": datetime.now(timezone.utc), "rollback": rollback_summary}}
+    )
+    await db.upload_before_images.delete_many({"upload_id": upload_id})
+    
+    return {
+        "success": True,
+        "message": f"Upload geri alındı: {rollback_summary['restored_products']} ürün eski haline döndü, "
+                   f"{rollback_summary['deleted_products']} yeni ürün silindi",
+        "summary": rollback_summary
+    }
 
 # Category Groups CRUD Operations
 @api_router.get("/category-groups")
@@ -4910,7 +8085,10 @@ app.include_router(api_router)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    stop_upload_inbox_watcher()
+    stop_job_worker()
     client.close()
+    shutdown_parse_executor()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,34 @@
+"""Background job worker
+
+Runs the jobs queued in db.jobs (Excel imports, price refreshes, upload currency changes) in a
+separate process, so they do not share the API process and survive request timeouts:
+
+    python -m backend.worker
+
+Start as many workers as needed; set JOB_WORKER_IN_APP=false on the API to run jobs only here.
+JOB_WORKER_CONCURRENCY sets the number of jobs one worker runs at a time.
+"""
+
+import asyncio
+import os
+import sys
+
+# server.py is imported as the API loads it (uvicorn server:app from backend/), not as backend.server
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import server  # noqa: E402
+
+
+async def main():
+    try:
+        await server.run_job_worker()
+    finally:
+        server.client.close()
+        server.shutdown_parse_executor()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
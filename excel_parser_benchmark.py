@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the color-based Excel parser
+Measures wall time and peak memory on the sample price lists and a synthetic 100k-row workbook
+"""
+
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+
+from server import ColorBasedExcelService
+
+SAMPLE_FILES = ["VENTA_LISTE.xlsx", "HAVENSIS_SOLAR.xlsx"]
+SYNTHETIC_ROWS = 100_000
+
+COLUMN_FILLS = [
+    ("Ürün Adı", "FFFF0000"),
+    ("Açıklama", "FF0070C0"),
+    ("Marka", "FFFFFF00"),
+    ("Liste Fiyatı USD", "FF00B050"),
+    ("İndirimli Fiyat", "FFFFC000"),
+]
+
+def build_synthetic_workbook(rows=SYNTHETIC_ROWS):
+    """Build a colored price list with the given number of product rows"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Fiyat Listesi")
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for _, rgb in COLUMN_FILLS]
+
+    def colored_row(values):
+        row = []
+        for value, fill in zip(values, fills):
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.fill = fill
+            row.append(cell)
+        return row
+
+    sheet.append(colored_row([title for title, _ in COLUMN_FILLS]))
+    rng = random.Random(42)
+    for i in range(rows):
+        list_price = round(rng.uniform(10, 5000), 2)
+        sheet.append(colored_row([
+            f"Sentetik Ürün {i + 1}",
+            f"Açıklama {i + 1}",
+            f"Marka {i % 50}",
+            list_price,
+            round(list_price * 0.85, 2),
+        ]))
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def measure(name, file_content):
+    """Parse once for wall time, once more under tracemalloc for peak memory"""
+    start = time.perf_counter()
+    products = ColorBasedExcelService.parse_colored_excel(file_content, "Benchmark")
+    wall_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    ColorBasedExcelService.parse_colored_excel(file_content, "Benchmark")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "file_size_kb": round(len(file_content) / 1024, 1),
+        "products": len(products),
+        "wall_time_s": round(wall_time, 3),
+        "peak_memory_mb": round(peak / (1024 * 1024), 1),
+        "rows_per_second": round(len(products) / wall_time) if wall_time > 0 else None,
+    }
+    print(f"📊 {name}: {result}")
+    return result
+
+def main():
+    print("🚀 Color-Based Excel Parser Benchmark")
+    print("=" * 60)
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+
+    for file_name in SAMPLE_FILES:
+        path = os.path.join(base_dir, file_name)
+        if not os.path.exists(path):
+            print(f"⚠️  {file_name} not found, skipping")
+            continue
+        with open(path, "rb") as f:
+            results[file_name] = measure(file_name, f.read())
+
+    print(f"\n🔧 Building synthetic workbook with {SYNTHETIC_ROWS} rows...")
+    results[f"synthetic_{SYNTHETIC_ROWS}"] = measure(f"synthetic_{SYNTHETIC_ROWS}", build_synthetic_workbook())
+
+    output = sys.argv[1] if len(sys.argv) > 1 else "excel_parser_benchmark_results.json"
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Results written to {output}")
+
+if __name__ == "__main__":
+    main()
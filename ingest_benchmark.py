@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Ingest Benchmark with Synthetic Supplier Workbooks
+Times the colour-based parser, each ExcelService format path and the full upload-excel flow
+(against a local MongoDB) on generated 1k/10k/100k-row price lists, and writes wall time,
+peak RSS and rows/sec to a JSON file:
+
+    python ingest_benchmark.py [--sizes 1000,10000,100000] [--skip-upload] [--compare old.json]
+
+Every case runs in a fresh process, so peak RSS is that case's own high-water mark; the upload
+case also reports the parse workers' peak. MONGO_URL defaults to mongodb://localhost:27017 and
+each upload case uses a throwaway company in the "benchmark" database.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+COLOR_SHEETS = 5
+# Önceki sonuca göre bu oranın üzerindeki yavaşlama gerileme sayılır
+REGRESSION_THRESHOLD = 0.20
+
+BRANDS = ["HEGEL", "HEGEL-CHISAGE", "Elektrozirve", "HAVENSİS", "Venta", "Lexron", "Tommatech"]
+PRODUCT_TYPES = [
+    "LİFEPO4 LİTYUM AKÜ 25.6V 200AH", "TAM SİNÜS İNVERTÖR 2000W 12V", "GÜNEŞ PANELİ 450W HALF-CUT",
+    "ŞARJ KONTROL CİHAZI MPPT 60A", "SOLAR KABLO ÇİFT İZOLASYON 6mm2", "JEL AKÜ 12V 150AH"
+]
+
+def product_name(kind, i):
+    return f"{PRODUCT_TYPES[i % len(PRODUCT_TYPES)]} {kind}-{i + 1:06d}"
+
+def build_color_workbook(path, rows, sheets=COLOR_SHEETS):
+    """Colour-coded workbook modeled on VENTA_LISTE.xlsx and ELEKTROZIRVE.xlsx
+
+    VENTA-style sheets: blank lead rows, a coloured header with the price currency (USD, EUR, TL)
+    in its text, red names, blue descriptions, yellow brands, green prices; rgb, theme and indexed
+    fills are mixed. The last sheet is ELEKTROZIRVE-style: no header, TL prices with an orange net price.
+    """
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import PatternFill
+    from openpyxl.styles.colors import Color
+
+    def fill(color):
+        return PatternFill(fill_type="solid", start_color=color, end_color=color)
+
+    red = [fill(Color(rgb="FFFF0000")), fill(Color(rgb="FFCC0000")), fill(Color(indexed=10))]
+    blue = [fill(Color(theme=4, tint=0.6)), fill(Color(rgb="FF0070C0"))]
+    yellow = [fill(Color(rgb="FFFFFF00")), fill(Color(theme=5))]
+    green = [fill(Color(rgb="FF00B050")), fill(Color(indexed=11))]
+    orange = fill(Color(rgb="FFFFC000"))
+    price_headers = ["NET FİYAT USD KDV DAHİL", "LİSTE FİYATI EUR", "FİYAT TL", " FİYAT\nUSD "]
+
+    workbook = openpyxl.Workbook(write_only=True)
+    rng = random.Random(42)
+    rows_per_sheet = [rows // sheets + (1 if index < rows % sheets else 0) for index in range(sheets)]
+    number = 0
+
+    def colored_row(sheet, values, fills):
+        row = []
+        for value, cell_fill in zip(values, fills):
+            cell = WriteOnlyCell(sheet, value=value)
+            if cell_fill is not None:
+                cell.fill = cell_fill
+            row.append(cell)
+        return row
+
+    for index, sheet_rows in enumerate(rows_per_sheet[:-1]):
+        sheet = workbook.create_sheet(f"Table {index + 1}")
+        fills = [None, None, red[index % len(red)], blue[index % len(blue)], yellow[index % len(yellow)], green[index % len(green)]]
+        for _ in range(3):
+            sheet.append([])
+        sheet.append(colored_row(sheet, ["NO", "RESİM", "ÜRÜN ADI", "ÜRÜN AÇIKLAMA", "MARKA", price_headers[index % len(price_headers)]], fills))
+        for _ in range(sheet_rows):
+            number += 1
+            sheet.append(colored_row(sheet, [
+                number, None, product_name("V", number), f"Teknik özellik {number}, {rng.randint(1, 500)}W",
+                BRANDS[number % len(BRANDS)], round(rng.uniform(0.9, 5000), 2)
+            ], fills))
+
+    sheet = workbook.create_sheet("Fiyat Liste")
+    fills = [red[0], yellow[0], green[0], None, orange]
+    for _ in range(rows_per_sheet[-1]):
+        number += 1
+        list_price = round(rng.uniform(100, 20000), 2)
+        sheet.append(colored_row(sheet, [
+            product_name("E", number), "Elektrozirve", list_price, 0.58, round(list_price * 0.42, 2)
+        ], fills))
+
+    workbook.save(path)
+
+def build_plain_workbook(path, kind, rows):
+    """Workbook without fills for one ExcelService format path
+
+    elektrozirve: 4 columns (TL, net price); havensis: 22 columns with the product in column 3 and
+    USD prices in columns 6/8; general: named columns with a per-row currency; headerless: no
+    header keywords, name / price / currency text in each row.
+    As in the supplier files, a title row sits above the keyword header: pandas takes the first row
+    as column names, so the header must be a data row for the header scan to find it. HAVENSİS lists
+    have their header below the company details and products from the 13th row on.
+    """
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sayfa1")
+    rng = random.Random(7)
+
+    if kind == "elektrozirve":
+        sheet.append(["ELEKTROZİRVE"])
+        sheet.append(["Güneş Panelleri", "LİSTE FİYATI", "İskonto", "Net Fiyat"])
+        for i in range(rows):
+            list_price = round(rng.uniform(100, 20000), 2)
+            sheet.append([product_name("E", i), list_price, 0.58, round(list_price * 0.42, 2)])
+    elif kind == "havensis":
+        header = [None] * 22
+        header[3], header[6], header[7], header[8], header[12] = "ÜRÜN", "FİYAT $", "İSKONTO", "İSKONTOLU FİYAT $", "FİRMA"
+        sheet.append([None, None, None, "HAVENSİS"])
+        for line in ["Adres: Organize Sanayi Bölgesi", "Tel: 0232 000 00 00", "Tarih: 01.10.2026"] + [""] * 8:
+            sheet.append([None, None, None, line or None])
+        sheet.append(header)
+        for i in range(rows):
+            row = [None] * 22
+            price = rng.randint(100, 900)
+            row[3], row[4], row[6], row[7], row[8], row[12] = (
+                f"{rng.randint(100, 600)}W MONOKRİSTAL PANEL {i + 1:06d}", "(166*100)cm", price, 0.5, price * 0.5, "HAVENSİS"
+            )
+            sheet.append(row)
+    elif kind == "general":
+        sheet.append(["Tedarikçi Listesi"])
+        sheet.append(["Ürün Adı", "Marka", "Liste Fiyatı", "Net", "Para Birimi"])
+        for i in range(rows):
+            list_price = round(rng.uniform(1, 5000), 2)
+            sheet.append([product_name("G", i), BRANDS[i % len(BRANDS)], list_price, round(list_price * 0.9, 2), ("USD", "EUR", "TL")[i % 3]])
+    elif kind == "headerless":
+        sheet.append(["A", "B", "C"])
+        for i in range(rows):
+            sheet.append([f"Bağlantı Elemanı {i + 1:06d}", round(rng.uniform(1, 5000), 2), ("USD", "EUR", "₺")[i % 3]])
+    else:
+        raise ValueError(f"Unknown workbook kind: {kind}")
+
+    workbook.save(path)
+
+# Workbook kind -> ExcelService format path it must take
+PLAIN_KINDS = {
+    "elektrozirve": "elektrozirve",
+    "havensis": "havensis",
+    "general": "general",
+    "headerless": "without_header",
+}
+# Log lines of the parsers -> format path they took
+FORMAT_PATH_LOGS = {
+    "Detected ELEKTROZİRVE format": "elektrozirve",
+    "Detected HAVENSİS format": "havensis",
+    "Using general format parsing": "general",
+    "Parsing without header": "without_header",
+}
+
+def import_server():
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "benchmark")
+    # Benchmark süreci iş kuyruğunu çalıştırmaz
+    os.environ["JOB_WORKER_IN_APP"] = "false"
+    os.environ.pop("UPLOAD_INBOX_DIR", None)
+    sys.path.insert(0, os.path.join(BASE_DIR, "backend"))
+    import server
+    return server
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # Linux'ta ru_maxrss KB cinsindendir
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+class FormatPathHandler(logging.Handler):
+    """Collects the ExcelService format paths a case went through, from the parser log lines"""
+
+    def __init__(self):
+        super().__init__()
+        self.paths = []
+
+    def emit(self, record):
+        message = record.getMessage()
+        for prefix, format_path in FORMAT_PATH_LOGS.items():
+            if message.startswith(prefix):
+                self.paths.append(format_path)
+
+def check_case(case, result):
+    """Error text when a case did not parse the expected rows through the expected path"""
+    problems = []
+    if result["rows"] != case["expected_rows"]:
+        problems.append(f"expected {case['expected_rows']} rows, got {result['rows']}")
+    if case.get("format_path") and result["format_paths"] != [case["format_path"]]:
+        problems.append(f"expected format path {case['format_path']}, got {result['format_paths']}")
+    return "; ".join(problems) or None
+
+def run_case(case, path, queue):
+    """Run one case in this (fresh) process and put its measurements on the queue"""
+    try:
+        server = import_server()
+        format_paths = FormatPathHandler()
+        logging.getLogger("server").addHandler(format_paths)
+        result = {"baseline_rss_mb": peak_rss_mb()}
+
+        if case["kind"] == "upload":
+            from fastapi.testclient import TestClient
+
+            with TestClient(server.app) as client:
+                client.get("/api/exchange-rates")  # kurlar önbelleğe alınır, ölçüme girmez
+                company = client.post("/api/companies", json={"name": f"Benchmark {os.getpid()}"}).json()
+                try:
+                    with open(path, "rb") as f:
+                        start = time.perf_counter()
+                        response = client.post(
+                            f"/api/companies/{company['id']}/upload-excel",
+                            params={"force": "true"},
+                            files={"file": (os.path.basename(path), f)}
+                        )
+                        wall_time = time.perf_counter() - start
+                    if response.status_code != 200:
+                        raise RuntimeError(f"upload failed: {response.status_code} - {response.text[:300]}")
+                    rows = response.json()["summary"]["total_products"]
+                finally:
+                    client.delete(f"/api/companies/{company['id']}")
+            # İşçi süreçlerin tepe belleği ancak beklenip toplandıktan sonra RUSAGE_CHILDREN'a yansır
+            if server._parse_executor is not None:
+                server._parse_executor.shutdown(wait=True)
+            result["peak_worker_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        elif case["kind"] == "color":
+            start = time.perf_counter()
+            rows = len(server.ColorBasedExcelService.parse_colored_excel(path, "Benchmark"))
+            wall_time = time.perf_counter() - start
+        else:
+            start = time.perf_counter()
+            rows = len(server.ExcelService.parse_excel_file(path))
+            wall_time = time.perf_counter() - start
+
+        result.update({
+            "rows": rows,
+            "format_paths": sorted(set(format_paths.paths)),
+            "wall_time_s": round(wall_time, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "rows_per_second": round(rows / wall_time) if wall_time > 0 else None,
+        })
+        # Yanlış modellenmiş bir çalışma kitabı makul görünen sayılar yerine hata verir
+        error = check_case(case, result)
+        if error:
+            result["error"] = error
+        queue.put(result)
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+def measure(case, path):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(case, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    result["file_size_kb"] = round(os.path.getsize(path) / 1024, 1)
+    return result
+
+def compare(results, previous_path):
+    """Print the wall time change of every case also in the previous results file"""
+    with open(previous_path) as f:
+        previous = json.load(f).get("cases", {})
+    print(f"\n📈 Compared with {previous_path}")
+    regressions = 0
+    for name, result in results.items():
+        old = previous.get(name)
+        if not old or "wall_time_s" not in old or "wall_time_s" not in result or not old["wall_time_s"]:
+            continue
+        change = (result["wall_time_s"] - old["wall_time_s"]) / old["wall_time_s"]
+        regressed = change > REGRESSION_THRESHOLD
+        regressions += regressed
+        print(f"{'❌' if regressed else '✅'} {name}: {old['wall_time_s']}s -> {result['wall_time_s']}s ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Excel parsing and upload on synthetic supplier workbooks")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="comma-separated row counts")
+    parser.add_argument("--skip-upload", action="store_true", help="only time the parsers (no MongoDB needed)")
+    parser.add_argument("--output", default="ingest_benchmark_results.json")
+    parser.add_argument("--compare", help="previous results file to compare wall times with")
+    args = parser.parse_args()
+
+    print("🚀 Ingest Benchmark")
+    print("=" * 60)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="ingest_benchmark_") as work_dir:
+        for size in sizes:
+            print(f"\n🔧 Building {size}-row workbooks...")
+            color_path = os.path.join(work_dir, f"color_{size}.xlsx")
+            build_color_workbook(color_path, size)
+            cases = [({"kind": "color", "expected_rows": size}, f"color_parse_{size}", color_path)]
+            for kind, format_path in PLAIN_KINDS.items():
+                plain_path = os.path.join(work_dir, f"{kind}_{size}.xlsx")
+                build_plain_workbook(plain_path, kind, size)
+                cases.append((
+                    {"kind": kind, "expected_rows": size, "format_path": format_path},
+                    f"traditional_{kind}_{size}", plain_path
+                ))
+            if not args.skip_upload:
+                cases.append(({"kind": "upload", "expected_rows": size}, f"upload_color_{size}", color_path))
+
+            for case, name, path in cases:
+                results[name] = measure(case, path)
+                print(f"{'⚠️ ' if 'error' in results[name] else '📊'} {name}: {results[name]}")
+
+    output = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "cases": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Results written to {args.output}")
+
+    failed_cases = [name for name, result in results.items() if "error" in result]
+    if failed_cases:
+        print(f"\n❌ Failed cases: {', '.join(failed_cases)}")
+    regressions = compare(results, args.compare) if args.compare else 0
+    if failed_cases or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test Background Jobs for Excel Imports and Price Refreshes
+"""
+
+import io
+import time
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list(prices):
+    """Colored price list: red product names, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FF00B050")]
+    rows = [("Ürün Adı", "Liste Fiyatı USD")] + [(f"Job Test Ürün {i + 1}", price) for i, price in enumerate(prices)]
+    for row in rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Job Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def wait_for_job(job_id, timeout=120):
+    """Poll the job until it leaves queued/running"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{BASE_URL}/jobs/{job_id}", timeout=30).json()
+        if job['status'] not in ("queued", "running"):
+            return job
+        time.sleep(1)
+    return job
+
+def test_background_upload(company_id):
+    """A background upload returns a job at once; the history entry is processing until the job completes"""
+    print("\n🔍 Testing background Excel upload...")
+
+    response = requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        params={"background": "true"},
+        files={"file": ("job_test.xlsx", build_price_list([100.0, 200.0, 300.0]))},
+        timeout=60
+    )
+    if response.status_code != 200 or not response.json().get('job_id'):
+        print(f"❌ Upload was not queued: {response.status_code} - {response.text}")
+        return False
+    queued = response.json()
+    print(f"✅ Upload queued as job {queued['job_id']}")
+
+    job = wait_for_job(queued['job_id'])
+    if job['status'] != "completed" or job['result']['summary']['new_products'] != 3:
+        print(f"❌ Job did not complete: {job['status']} - {job.get('error')}")
+        return False
+    if job['progress'].get('done') != 3:
+        print(f"❌ Unexpected progress: {job['progress']}")
+        return False
+    print(f"✅ Job completed: {job['result']['message']}")
+
+    upload = requests.get(f"{BASE_URL}/upload-history/{queued['upload_id']}", timeout=30).json()
+    if upload['status'] != "completed" or upload['new_products'] != 3:
+        print(f"❌ Upload history not completed: {upload}")
+        return False
+    print("✅ Upload history entry completed by the job")
+
+    return True
+
+def test_refresh_prices_and_cancel():
+    """Price refresh runs as a job; finished jobs cannot be cancelled"""
+    print("\n🔍 Testing background price refresh...")
+
+    response = requests.post(f"{BASE_URL}/refresh-prices", params={"background": "true"}, timeout=30)
+    if response.status_code != 200:
+        print(f"❌ Refresh was not queued: {response.status_code} - {response.text}")
+        return False
+
+    job = wait_for_job(response.json()['job_id'])
+    if job['status'] != "completed":
+        print(f"❌ Refresh job did not complete: {job['status']} - {job.get('error')}")
+        return False
+    print(f"✅ Refresh job completed: {job['result']['updated_count']} products")
+
+    response = requests.post(f"{BASE_URL}/jobs/{job['id']}/cancel", timeout=30)
+    if response.status_code != 400:
+        print(f"❌ Expected 400 when cancelling a finished job, got {response.status_code}")
+        return False
+    print("✅ Finished job cannot be cancelled")
+
+    response = requests.get(f"{BASE_URL}/jobs/unknown-job", timeout=30)
+    if response.status_code != 404:
+        print(f"❌ Expected 404 for unknown job, got {response.status_code}")
+        return False
+    print("✅ Unknown job returns 404")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Background Job Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            test_background_upload(company_id)
+            test_refresh_prices_and_cancel()
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
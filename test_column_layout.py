@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test Saved Column Layouts for Excel Uploads
+"""
+
+import io
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list(prices, title_rows=0):
+    """Colored price list on sheet 'Fiyat': red names, yellow brands, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Fiyat"
+    for _ in range(title_rows):
+        sheet.append(["Layout Test Fiyat Listesi"])
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FFFFFF00", "FF00B050")]
+    rows = [("Ürün Adı", "Marka", "Liste Fiyatı USD")] + [
+        (f"Layout Test Ürün {i + 1}", "Acme", price) for i, price in enumerate(prices)
+    ]
+    for row in rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Layout Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, content):
+    """Upload the price list and return the JSON response"""
+    response = requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        files={"file": ("layout_test.xlsx", content)},
+        timeout=60
+    )
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return None
+    return response.json()
+
+def test_detected_layout_saved(company_id):
+    """The first upload stores the detected layout of the company"""
+    print("\n🔍 Testing detected layout is saved...")
+
+    if not upload(company_id, build_price_list([100.0, 200.0])):
+        return False
+
+    response = requests.get(f"{BASE_URL}/companies/{company_id}/column-layout", timeout=30)
+    if response.status_code != 200:
+        print(f"❌ Layout not saved: {response.status_code}")
+        return False
+
+    layout = response.json()
+    sheet = layout['sheets'][0]
+    if layout['pinned'] or sheet['sheet'] != "Fiyat" or sheet['header_row'] != 0 or sheet['currency'] != "USD":
+        print(f"❌ Unexpected layout: {layout}")
+        return False
+    if sheet['columns']['product_name'] != 0 or sheet['columns']['list_price'] != 2 or not sheet['header_fingerprint']:
+        print(f"❌ Unexpected column roles: {sheet}")
+        return False
+    print("✅ Detected layout saved with header fingerprint")
+
+    return True
+
+def test_pinned_layout(company_id):
+    """A pinned layout is used as is: header below a title row, prices in TRY"""
+    print("\n🔍 Testing pinned layout...")
+
+    response = requests.put(
+        f"{BASE_URL}/companies/{company_id}/column-layout",
+        json={"sheets": [{
+            "sheet": "Fiyat",
+            "header_row": 1,
+            "columns": {"product_name": 0, "brand": 1, "list_price": 2},
+            "currency": "TRY"
+        }]},
+        timeout=30
+    )
+    if response.status_code != 200 or not response.json()['pinned']:
+        print(f"❌ Failed to pin layout: {response.status_code} - {response.text}")
+        return False
+    print("✅ Layout pinned")
+
+    if not upload(company_id, build_price_list([100.0, 200.0], title_rows=1)):
+        return False
+
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    currencies = {product['currency'] for product in products}
+    if currencies != {"TRY"}:
+        print(f"❌ Pinned currency not applied: {currencies}")
+        return False
+    print("✅ Pinned layout applied")
+
+    response = requests.put(
+        f"{BASE_URL}/companies/{company_id}/column-layout",
+        json={"sheets": [{"sheet": "Fiyat", "header_row": 0, "columns": {"price": 2}}]},
+        timeout=30
+    )
+    if response.status_code != 400:
+        print(f"❌ Invalid layout accepted: {response.status_code}")
+        return False
+    print("✅ Invalid layout rejected")
+
+    return True
+
+def test_delete_layout(company_id):
+    """Deleting the layout makes the next upload detect columns again"""
+    print("\n🔍 Testing layout delete...")
+
+    response = requests.delete(f"{BASE_URL}/companies/{company_id}/column-layout", timeout=30)
+    if response.status_code != 200:
+        print(f"❌ Failed to delete layout: {response.status_code}")
+        return False
+
+    response = requests.get(f"{BASE_URL}/companies/{company_id}/column-layout", timeout=30)
+    if response.status_code != 404:
+        print(f"❌ Layout still present: {response.status_code}")
+        return False
+    print("✅ Layout deleted")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Excel Column Layout Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            test_detected_layout_saved(company_id)
+            test_pinned_layout(company_id)
+            test_delete_layout(company_id)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
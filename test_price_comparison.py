@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test Cross-Supplier Price Comparison Groups
+"""
+
+import requests
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def create_company(name):
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": name}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created company {name}: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company {name}: {response.status_code}")
+    return None
+
+def create_product(company_id, name, brand, list_price):
+    """Create a TRY product"""
+    response = requests.post(
+        f"{BASE_URL}/products",
+        json={
+            "name": name,
+            "brand": brand,
+            "company_id": company_id,
+            "list_price": list_price,
+            "currency": "TRY"
+        },
+        timeout=30
+    )
+    return response.json().get('id') if response.status_code == 200 else None
+
+def find_group(search):
+    """Find the comparison group for a search term"""
+    response = requests.get(f"{BASE_URL}/product-groups", params={"search": search}, timeout=30)
+    if response.status_code != 200:
+        print(f"❌ Failed to get product groups: {response.status_code}")
+        return None
+    groups = response.json().get('groups', [])
+    return groups[0] if groups else None
+
+def test_equivalent_products_grouped(company_a, company_b):
+    """The same item from two suppliers forms one group"""
+    print("\n🔍 Testing equivalent product grouping...")
+
+    # Aynı ürün, farklı yazım: büyük/küçük harf, Türkçe karakter, marka isimde
+    create_product(company_a, "Karşılaştırma Test Aküsü 150Ah", "Zirvetest", 5000)
+    cheaper_id = create_product(company_b, "ZIRVETEST karsilastirma test akusu 150ah", "", 4200)
+
+    group = find_group("karsilastirma test akusu 150ah")
+    if not group:
+        print("❌ Group not found")
+        return False
+
+    if group['company_count'] != 2:
+        print(f"❌ Expected 2 suppliers, got {group['company_count']}")
+        return False
+    print("✅ Both suppliers in one group")
+
+    if group['cheapest_product_id'] != cheaper_id or group['cheapest_price_try'] != 4200:
+        print(f"❌ Wrong cheapest offer: {group['cheapest_product_id']} {group['cheapest_price_try']}")
+        return False
+    print("✅ Cheapest offer identified")
+
+    if group['savings_try'] != 800:
+        print(f"❌ Wrong savings: {group['savings_try']}")
+        return False
+    print("✅ Savings calculated: 800 TRY")
+
+    return True
+
+def test_groups_sorted_by_savings():
+    """Group pages come back sorted by savings"""
+    print("\n🔍 Testing savings sort order...")
+
+    response = requests.get(f"{BASE_URL}/product-groups", params={"limit": 20}, timeout=30)
+    if response.status_code != 200:
+        print(f"❌ Failed to get product groups: {response.status_code}")
+        return False
+
+    savings = [g['savings_try'] for g in response.json()['groups']]
+    if savings == sorted(savings, reverse=True):
+        print(f"✅ {len(savings)} groups sorted by savings")
+        return True
+    print(f"❌ Groups not sorted: {savings}")
+    return False
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Price Comparison Groups Test")
+    print("=" * 60)
+
+    company_a = create_company("Karşılaştırma Test A")
+    company_b = create_company("Karşılaştırma Test B")
+    try:
+        if company_a and company_b:
+            test_equivalent_products_grouped(company_a, company_b)
+            test_groups_sorted_by_savings()
+        else:
+            print("❌ Cannot proceed without companies")
+    finally:
+        cleanup_company(company_a)
+        cleanup_company(company_b)
+
+if __name__ == "__main__":
+    main()
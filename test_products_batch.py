@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test Batch Product Fetch Endpoint
+"""
+
+import requests
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(
+        f"{BASE_URL}/companies",
+        json={"name": "Batch Fetch Test Company"},
+        timeout=30
+    )
+
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    else:
+        print(f"❌ Failed to create company: {response.status_code}")
+        return None
+
+def create_test_products(company_id, count=5):
+    """Create a few products for the batch request"""
+    product_ids = []
+    for i in range(count):
+        response = requests.post(
+            f"{BASE_URL}/products",
+            json={
+                "name": f"Batch Test Ürün {i + 1}",
+                "company_id": company_id,
+                "list_price": 100 + i,
+                "currency": "TRY"
+            },
+            timeout=30
+        )
+        if response.status_code == 200:
+            product_ids.append(response.json()['id'])
+    print(f"✅ Created {len(product_ids)} test products")
+    return product_ids
+
+def test_batch_fetch(product_ids):
+    """Fetch products by id, with projection and missing ids"""
+    print("\n🔍 Testing batch fetch with missing ids...")
+
+    requested_ids = product_ids + ["missing-product-id"]
+    response = requests.post(
+        f"{BASE_URL}/products/batch",
+        json={"ids": requested_ids, "fields": ["name", "list_price_try"]},
+        timeout=30
+    )
+
+    if response.status_code != 200:
+        print(f"❌ Batch fetch failed: {response.status_code} - {response.text}")
+        return False
+
+    result = response.json()
+    returned_ids = [p['id'] for p in result['products']]
+
+    if returned_ids != product_ids:
+        print(f"❌ Unexpected products/order: {returned_ids}")
+        return False
+    print(f"✅ All {len(returned_ids)} products returned in request order")
+
+    if result['missing_ids'] != ["missing-product-id"]:
+        print(f"❌ Missing ids not reported: {result['missing_ids']}")
+        return False
+    print("✅ Missing id reported")
+
+    unexpected_fields = set(result['products'][0].keys()) - {"id", "name", "list_price_try"}
+    if unexpected_fields:
+        print(f"❌ Projection not applied, extra fields: {unexpected_fields}")
+        return False
+    print("✅ Projection applied")
+
+    return True
+
+def test_batch_limit():
+    """Requests above the id limit are rejected"""
+    print("\n🔍 Testing batch size limit...")
+
+    response = requests.post(
+        f"{BASE_URL}/products/batch",
+        json={"ids": [f"id-{i}" for i in range(5001)]},
+        timeout=30
+    )
+
+    if response.status_code == 400:
+        print("✅ Oversized batch rejected")
+        return True
+    print(f"❌ Expected 400, got {response.status_code}")
+    return False
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Batch Product Fetch Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            product_ids = create_test_products(company_id)
+            test_batch_fetch(product_ids)
+            test_batch_limit()
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
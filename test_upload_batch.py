@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Test Batch Excel Uploads for Several Companies
+"""
+
+import io
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list(prefix, prices):
+    """Colored price list: red product names, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FF00B050")]
+    rows = [("Ürün Adı", "Liste Fiyatı USD")] + [(f"{prefix} Ürün {i + 1}", price) for i, price in enumerate(prices)]
+    for row in rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company(name):
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": name}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload_batch(company_ids, files):
+    """Upload (filename, content) pairs, the n-th file for the n-th company"""
+    return requests.post(
+        f"{BASE_URL}/upload-excel/batch",
+        files=[("files", (filename, content)) for filename, content in files],
+        data={"company_ids": ",".join(company_ids)},
+        timeout=120
+    )
+
+def test_batch_upload(first_id, second_id):
+    """Files of two companies imported in one request, the second file of a company applied after the first"""
+    print("\n🔍 Testing batch upload...")
+
+    response = upload_batch([first_id, second_id, first_id], [
+        ("batch_a.xlsx", build_price_list("Batch A", [100.0, 200.0])),
+        ("batch_b.xlsx", build_price_list("Batch B", [50.0, 60.0, 70.0])),
+        ("batch_a2.xlsx", build_price_list("Batch A", [110.0, 200.0])),
+    ])
+    if response.status_code != 200:
+        print(f"❌ Batch upload failed: {response.status_code} - {response.text}")
+        return False
+
+    result = response.json()
+    summary = result['summary']
+    if not result['success'] or summary['succeeded_files'] != 3 or summary['new_products'] != 5 or summary['updated_products'] != 1:
+        print(f"❌ Unexpected batch summary: {summary}")
+        return False
+    print(f"✅ Batch imported: {result['message']}")
+
+    if [item['filename'] for item in result['results']] != ["batch_a.xlsx", "batch_b.xlsx", "batch_a2.xlsx"]:
+        print(f"❌ Results not in upload order: {result['results']}")
+        return False
+
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": first_id}, timeout=30).json()
+    prices = sorted(product['list_price'] for product in products)
+    if prices != [110.0, 200.0]:
+        print(f"❌ Later file of the company not applied last: {prices}")
+        return False
+    print("✅ Each company's files applied in order")
+
+    return True
+
+def test_failed_file_isolated(first_id, second_id):
+    """A file without products fails on its own, the rest of the batch is imported"""
+    print("\n🔍 Testing failing file in a batch...")
+
+    empty = openpyxl.Workbook()
+    buffer = io.BytesIO()
+    empty.save(buffer)
+
+    response = upload_batch([first_id, second_id], [
+        ("batch_empty.xlsx", buffer.getvalue()),
+        ("batch_b.xlsx", build_price_list("Batch B", [55.0, 60.0, 70.0])),
+    ])
+    if response.status_code != 200:
+        print(f"❌ Batch upload failed: {response.status_code} - {response.text}")
+        return False
+
+    results = response.json()['results']
+    if results[0]['success'] or results[0]['status_code'] != 400 or not results[1]['success']:
+        print(f"❌ Unexpected results: {results}")
+        return False
+    print("✅ Failing file reported, other company imported")
+
+    response = upload_batch([first_id], [("a.xlsx", b""), ("b.xlsx", b"")])
+    if response.status_code != 400:
+        print(f"❌ Expected 400 for mismatched company ids, got {response.status_code}")
+        return False
+    print("✅ Mismatched company ids rejected")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Batch Excel Upload Test")
+    print("=" * 60)
+
+    first_id = create_test_company("Batch Test Company A")
+    second_id = create_test_company("Batch Test Company B")
+    if first_id and second_id:
+        try:
+            test_batch_upload(first_id, second_id)
+            test_failed_file_isolated(first_id, second_id)
+        finally:
+            cleanup_company(first_id)
+            cleanup_company(second_id)
+    else:
+        print("❌ Cannot proceed without companies")
+        cleanup_company(first_id)
+        cleanup_company(second_id)
+
+if __name__ == "__main__":
+    main()
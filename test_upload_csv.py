@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test CSV/TSV Price List Uploads
+"""
+
+import requests
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+# Türkçe Excel çıktısı: noktalı virgül ayracı, binlik nokta, ondalık virgül, Windows-1254
+SEMICOLON_CSV = (
+    "Ürün Adı;Marka;Liste Fiyatı;Para Birimi\n"
+    "CSV Test Güneş Paneli 450W;Acme;1.234,50;USD\n"
+    "CSV Test Akü 200Ah;Acme;420,00;EUR\n"
+).encode("cp1254")
+
+TAB_TSV = (
+    "Ürün Adı\tMarka\tFiyat\n"
+    "CSV Test İnvertör 3kW\tAcme\t650.00\n"
+).encode("utf-8")
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "CSV Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, filename, content, **params):
+    """Upload a CSV/TSV file and return the response"""
+    return requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-csv",
+        params=params or None,
+        files={"file": (filename, content)},
+        timeout=60
+    )
+
+def test_semicolon_csv(company_id):
+    """Semicolon CSV with Turkish decimals and per-row currencies"""
+    print("\n🔍 Testing semicolon CSV upload...")
+
+    response = upload(company_id, "csv_test.csv", SEMICOLON_CSV)
+    if response.status_code != 200 or response.json()['summary']['new_products'] != 2:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return False
+
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    prices = {product['name']: (product['list_price'], product['currency']) for product in products}
+    if prices.get("CSV Test Güneş Paneli 450W") != (1234.5, "USD") or prices.get("CSV Test Akü 200Ah") != (420.0, "EUR"):
+        print(f"❌ Unexpected prices: {prices}")
+        return False
+    print("✅ Turkish decimals and currencies read correctly")
+
+    response = upload(company_id, "csv_test.csv", SEMICOLON_CSV)
+    if response.status_code != 200 or not response.json().get('duplicate_of'):
+        print(f"❌ Re-upload was imported again: {response.status_code} - {response.text}")
+        return False
+    print("✅ Re-upload detected")
+
+    return True
+
+def test_tsv_and_dry_run(company_id):
+    """TSV dry run writes nothing, the real upload adds the product"""
+    print("\n🔍 Testing TSV dry run and upload...")
+
+    response = upload(company_id, "csv_test.tsv", TAB_TSV, dry_run="true")
+    if response.status_code != 200 or response.json()['summary']['new_products'] != 1:
+        print(f"❌ Unexpected preview: {response.status_code} - {response.text}")
+        return False
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    if len(products) != 2:
+        print(f"❌ Dry run wrote products: {len(products)}")
+        return False
+    print("✅ Dry run wrote nothing")
+
+    response = upload(company_id, "csv_test.tsv", TAB_TSV)
+    if response.status_code != 200 or response.json()['summary']['new_products'] != 1:
+        print(f"❌ TSV upload failed: {response.status_code} - {response.text}")
+        return False
+    print("✅ TSV imported")
+
+    return True
+
+def test_rejected_files(company_id):
+    """Non-CSV files and files without product rows are rejected"""
+    print("\n🔍 Testing rejected files...")
+
+    response = upload(company_id, "csv_test.xlsx", TAB_TSV)
+    if response.status_code != 400:
+        print(f"❌ Expected 400 for .xlsx, got {response.status_code}")
+        return False
+
+    response = upload(company_id, "empty.csv", "Ürün Adı;Fiyat\n".encode("utf-8"))
+    if response.status_code != 400:
+        print(f"❌ Expected 400 for empty CSV, got {response.status_code}")
+        return False
+    print("✅ Invalid files rejected")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 CSV/TSV Upload Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            test_semicolon_csv(company_id)
+            test_tsv_and_dry_run(company_id)
+            test_rejected_files(company_id)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test Upload Currency Relabeling Targets Exactly the Products of the Upload
+"""
+
+import io
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list(rows):
+    """Colored price list: red product names, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FF00B050")]
+    for row in [("Ürün Adı", "Liste Fiyatı USD")] + rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Relabel Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, filename, rows):
+    """Upload the price list and return the upload id"""
+    response = requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        files={"file": (filename, build_price_list(rows))},
+        timeout=60
+    )
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return None
+    return response.json()['upload_id']
+
+def currencies(company_id):
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    return {product['name']: product['currency'] for product in products}
+
+def test_relabel_last_upload_products(company_id):
+    """Relabeling an upload changes its products only, including unchanged rows of a later upload"""
+    print("\n🔍 Testing currency relabel of two overlapping uploads...")
+
+    first_upload = upload(company_id, "relabel_1.xlsx", [
+        ("Relabel Test Panel", 100.0), ("Relabel Test Akü", 200.0), ("Relabel Test Kablo", 5.0)
+    ])
+    second_upload = upload(company_id, "relabel_2.xlsx", [
+        ("Relabel Test Kablo", 5.0), ("Relabel Test Sigorta", 3.0)
+    ])
+    if not first_upload or not second_upload:
+        return False
+
+    response = requests.post(
+        f"{BASE_URL}/upload-history/{first_upload}/change-currency",
+        params={"new_currency": "EUR"},
+        timeout=30
+    )
+    if response.status_code != 200 or response.json()['updated_count'] != 2:
+        print(f"❌ Unexpected relabel result: {response.status_code} - {response.text}")
+        return False
+
+    expected = {
+        "Relabel Test Panel": "EUR", "Relabel Test Akü": "EUR",
+        "Relabel Test Kablo": "USD", "Relabel Test Sigorta": "USD"
+    }
+    if currencies(company_id) != expected:
+        print(f"❌ Wrong products relabeled: {currencies(company_id)}")
+        return False
+    print("✅ Only the products last imported by the first upload were relabeled")
+
+    response = requests.post(
+        f"{BASE_URL}/upload-history/{second_upload}/change-currency",
+        params={"new_currency": "TRY"},
+        timeout=30
+    )
+    if response.status_code != 200 or response.json()['updated_count'] != 2:
+        print(f"❌ Unexpected relabel result: {response.status_code} - {response.text}")
+        return False
+    print("✅ Unchanged row of the second upload belongs to it")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Upload Currency Relabel Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            test_relabel_last_upload_products(company_id)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test Re-Upload Detection for Excel Price Lists
+"""
+
+import io
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list():
+    """Small colored price list: red product names, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    rows = [
+        ("Ürün Adı", "Liste Fiyatı USD"),
+        ("Dedup Test Panel 450W", 180.0),
+        ("Dedup Test Akü 200Ah", 420.0),
+        ("Dedup Test İnvertör 3kW", 650.0),
+    ]
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FF00B050")]
+    for row in rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Dedup Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, content, **form):
+    """Upload the price list and return the JSON response"""
+    response = requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        files={"file": ("dedup_test.xlsx", content)},
+        data=form,
+        timeout=60
+    )
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return None
+    return response.json()
+
+def test_identical_reupload(company_id, content):
+    """The same file sent twice is imported once"""
+    print("\n🔍 Testing identical re-upload...")
+
+    first = upload(company_id, content)
+    second = upload(company_id, content)
+    if not first or not second:
+        return False
+
+    if second.get('duplicate_of') != first['upload_id']:
+        print(f"❌ Re-upload was imported again: {second.get('message')}")
+        return False
+    print(f"✅ Re-upload detected: {second['message']}")
+
+    history = requests.get(f"{BASE_URL}/companies/{company_id}/upload-history", timeout=30).json()
+    if len(history) != 1 or not history[0].get('file_hash') or not history[0].get('parser_version'):
+        print(f"❌ Unexpected upload history: {history}")
+        return False
+    print("✅ One history entry with file hash and parser version")
+
+    return True
+
+def test_forced_and_changed_options(company_id, content):
+    """force and different upload options import the file again"""
+    print("\n🔍 Testing forced upload and changed options...")
+
+    forced = upload(company_id, content, force="true")
+    discounted = upload(company_id, content, discount="10")
+    if not forced or not discounted:
+        return False
+
+    if forced.get('duplicate_of') or discounted.get('duplicate_of'):
+        print("❌ Forced/changed upload was skipped")
+        return False
+    print("✅ Forced and changed-option uploads imported")
+
+    # Aynı içerik zorla yüklendiğinde hiçbir ürün yeniden yazılmaz
+    if forced['summary']['unchanged_products'] != 3 or forced['summary']['updated_products'] != 0:
+        print(f"❌ Forced identical upload rewrote products: {forced['summary']}")
+        return False
+    print("✅ Forced identical upload left all products unchanged")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Excel Re-Upload Detection Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            content = build_price_list()
+            test_identical_reupload(company_id, content)
+            test_forced_and_changed_options(company_id, content)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
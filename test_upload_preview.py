@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test Dry-Run Preview for Excel Uploads
+"""
+
+import io
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list(rows):
+    """Colored price list: red product names, yellow brands, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FFFFFF00", "FF00B050")]
+    for row in [("Ürün Adı", "Marka", "Liste Fiyatı USD")] + rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Preview Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, content, dry_run=False):
+    """Upload the price list and return the JSON response"""
+    response = requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        params={"dry_run": "true"} if dry_run else None,
+        files={"file": ("preview_test.xlsx", content)},
+        timeout=60
+    )
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return None
+    return response.json()
+
+def test_dry_run_writes_nothing(company_id, content):
+    """A dry run reports the import without touching products or history"""
+    print("\n🔍 Testing dry run on an empty catalog...")
+
+    preview = upload(company_id, content, dry_run=True)
+    if not preview:
+        return False
+
+    if not preview.get('dry_run') or preview['summary']['new_products'] != 3:
+        print(f"❌ Unexpected preview: {preview}")
+        return False
+    print(f"✅ Preview: {preview['message']}")
+
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    history = requests.get(f"{BASE_URL}/companies/{company_id}/upload-history", timeout=30).json()
+    if products or history:
+        print(f"❌ Dry run wrote data: {len(products)} products, {len(history)} history entries")
+        return False
+    print("✅ Nothing written")
+
+    return True
+
+def test_preview_diff(company_id, content):
+    """Preview of a changed list matches the import that follows"""
+    print("\n🔍 Testing preview diff against the catalog...")
+
+    if not upload(company_id, content):
+        return False
+
+    changed = build_price_list([
+        ("Preview Test Panel 450W", "Acme", 190.0),
+        ("Preview Test Akü 200Ah", "Acme", 420.0),
+        ("Preview Test Kablo 6mm", "Acme", 12.0),
+    ])
+    preview = upload(company_id, changed, dry_run=True)
+    if not preview:
+        return False
+
+    summary = preview['summary']
+    counts = (summary['new_products'], summary['updated_products'], summary['unchanged_products'], summary['removed_products'])
+    if counts != (1, 1, 1, 1):
+        print(f"❌ Expected 1 new, 1 updated, 1 unchanged, 1 removed, got {counts}")
+        return False
+    print(f"✅ Preview counts: {preview['message']}")
+
+    change = summary['preview']['updated'][0]['changes'].get('list_price')
+    if change != {"old": 180.0, "new": 190.0}:
+        print(f"❌ Unexpected price change sample: {summary['preview']['updated']}")
+        return False
+    print("✅ Price change shown in preview")
+
+    result = upload(company_id, changed)
+    if not result:
+        return False
+    if (result['summary']['new_products'], result['summary']['updated_products']) != (1, 1):
+        print(f"❌ Import differs from preview: {result['summary']}")
+        return False
+    print("✅ Confirmed import matches the preview")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Excel Upload Preview Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            content = build_price_list([
+                ("Preview Test Panel 450W", "Acme", 180.0),
+                ("Preview Test Akü 200Ah", "Acme", 420.0),
+                ("Preview Test İnvertör 3kW", "Acme", 650.0),
+            ])
+            test_dry_run_writes_nothing(company_id, content)
+            test_preview_diff(company_id, content)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test Stored Upload Files and Background Re-parsing
+"""
+
+import io
+import time
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list(rows):
+    """Colored price list: red product names, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FF00B050")]
+    for row in [("Ürün Adı", "Liste Fiyatı USD")] + rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Reparse Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, filename, rows):
+    """Upload the price list and return the upload id"""
+    response = requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        files={"file": (filename, build_price_list(rows))},
+        timeout=60
+    )
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return None
+    return response.json()['upload_id']
+
+def wait_for_job(job_id, timeout=120):
+    """Poll the job until it leaves queued/running"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{BASE_URL}/jobs/{job_id}", timeout=30).json()
+        if job['status'] not in ("queued", "running"):
+            return job
+        time.sleep(1)
+    return job
+
+def reparse(**params):
+    return requests.post(f"{BASE_URL}/upload-history/reparse", params=params, timeout=30)
+
+def test_reparse_stored_upload(company_id):
+    """The original file is stored with the upload and imported again under the same upload"""
+    print("\n🔍 Testing re-parse of a stored upload...")
+
+    first_upload = upload(company_id, "reparse_1.xlsx", [("Reparse Test Panel", 100.0), ("Reparse Test Akü", 200.0)])
+    if not first_upload:
+        return False
+    history = requests.get(f"{BASE_URL}/upload-history/{first_upload}", timeout=30).json()
+    if not history.get('stored_file'):
+        print(f"❌ Original file not stored: {history}")
+        return False
+    print(f"✅ Original file stored as {history['stored_file']}")
+
+    response = reparse(company_id=company_id)
+    if response.status_code != 200 or response.json()['queued'] != 0:
+        print(f"❌ Upload of the current parser re-parsed: {response.status_code} - {response.text}")
+        return False
+    print("✅ Uploads of the current parser version skipped")
+
+    response = reparse(upload_ids=first_upload, include_current="true")
+    if response.status_code != 200 or response.json()['queued'] != 1:
+        print(f"❌ Re-parse not queued: {response.status_code} - {response.text}")
+        return False
+    job = wait_for_job(response.json()['jobs'][0]['job_id'])
+    if job['status'] != "completed" or job['result']['upload_id'] != first_upload:
+        print(f"❌ Re-parse job did not complete: {job['status']} - {job.get('error')}")
+        return False
+
+    reparsed = requests.get(f"{BASE_URL}/upload-history/{first_upload}", timeout=30).json()
+    if not reparsed.get('reparsed_at') or reparsed['upload_date'] != history['upload_date']:
+        print(f"❌ Upload history not re-imported in place: {reparsed}")
+        return False
+    print("✅ Stored file re-imported under the same upload")
+
+    return True
+
+def test_reparse_keeps_later_upload(company_id):
+    """Re-parsing an older upload does not overwrite products a later upload wrote"""
+    print("\n🔍 Testing re-parse under a later upload...")
+
+    older_upload = requests.get(f"{BASE_URL}/companies/{company_id}/upload-history", timeout=30).json()[0]['id']
+    if not upload(company_id, "reparse_2.xlsx", [("Reparse Test Panel", 150.0)]):
+        return False
+
+    response = reparse(upload_ids=older_upload, include_current="true")
+    job = wait_for_job(response.json()['jobs'][0]['job_id'])
+    if job['status'] != "completed" or job['result']['summary']['superseded_products'] != 1:
+        print(f"❌ Unexpected re-parse result: {job['status']} - {job.get('result') or job.get('error')}")
+        return False
+
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    prices = {product['name']: product['list_price'] for product in products}
+    if prices.get("Reparse Test Panel") != 150.0:
+        print(f"❌ Later upload overwritten: {prices}")
+        return False
+    print("✅ Product of the later upload kept")
+
+    response = reparse(upload_ids="unknown-upload")
+    if response.status_code != 404:
+        print(f"❌ Expected 404 for unknown upload, got {response.status_code}")
+        return False
+    print("✅ Unknown upload returns 404")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Upload Re-parse Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            test_reparse_stored_upload(company_id)
+            test_reparse_keeps_later_upload(company_id)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
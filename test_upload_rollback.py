@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Test Upload Rollback from Before-Images
+"""
+
+import io
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+
+def build_price_list(rows):
+    """Colored price list: red product names, green USD list prices"""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FF00B050")]
+    for row in [("Ürün Adı", "Liste Fiyatı USD")] + rows:
+        sheet.append(row)
+        for cell, fill in zip(sheet[sheet.max_row], fills):
+            cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Rollback Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, filename, rows):
+    """Upload the price list and return the upload id"""
+    response = requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        files={"file": (filename, build_price_list(rows))},
+        timeout=60
+    )
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return None
+    return response.json()['upload_id']
+
+def prices(company_id):
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    return {product['name']: product['list_price'] for product in products}
+
+def test_rollback_upload(company_id):
+    """Rollback restores changed prices and deletes the products the upload created"""
+    print("\n🔍 Testing upload rollback...")
+
+    first_upload = upload(company_id, "rollback_1.xlsx", [
+        ("Rollback Test Panel", 100.0), ("Rollback Test Akü", 200.0)
+    ])
+    second_upload = upload(company_id, "rollback_2.xlsx", [
+        ("Rollback Test Panel", 120.0), ("Rollback Test Akü", 200.0), ("Rollback Test Kablo", 5.0)
+    ])
+    if not first_upload or not second_upload:
+        return False
+
+    response = requests.post(f"{BASE_URL}/upload-history/{second_upload}/rollback", timeout=60)
+    if response.status_code != 200:
+        print(f"❌ Rollback failed: {response.status_code} - {response.text}")
+        return False
+    summary = response.json()['summary']
+    if summary['restored_products'] != 1 or summary['deleted_products'] != 1:
+        print(f"❌ Unexpected rollback summary: {summary}")
+        return False
+
+    expected = {"Rollback Test Panel": 100.0, "Rollback Test Akü": 200.0}
+    if prices(company_id) != expected:
+        print(f"❌ Catalog not restored: {prices(company_id)}")
+        return False
+    print("✅ Changed price restored, created product deleted")
+
+    history = requests.get(f"{BASE_URL}/upload-history/{second_upload}", timeout=30).json()
+    if history['status'] != "rolled_back":
+        print(f"❌ Upload not marked rolled back: {history['status']}")
+        return False
+
+    response = requests.post(f"{BASE_URL}/upload-history/{second_upload}/rollback", timeout=30)
+    if response.status_code != 400:
+        print(f"❌ Expected 400 for a second rollback, got {response.status_code}")
+        return False
+    print("✅ Rolled back upload cannot be rolled back again")
+
+    return True
+
+def test_later_upload_kept(company_id):
+    """Products imported again by a later upload are not rolled back with the earlier one"""
+    print("\n🔍 Testing rollback under a later upload...")
+
+    first_upload = upload(company_id, "rollback_3.xlsx", [
+        ("Rollback Test Panel", 130.0), ("Rollback Test Sigorta", 3.0)
+    ])
+    later_upload = upload(company_id, "rollback_4.xlsx", [("Rollback Test Panel", 140.0)])
+    if not first_upload or not later_upload:
+        return False
+
+    response = requests.post(f"{BASE_URL}/upload-history/{first_upload}/rollback", timeout=60)
+    if response.status_code != 200 or response.json()['summary']['skipped_products'] != 1:
+        print(f"❌ Unexpected rollback result: {response.status_code} - {response.text}")
+        return False
+
+    expected = {"Rollback Test Panel": 140.0, "Rollback Test Akü": 200.0}
+    if prices(company_id) != expected:
+        print(f"❌ Later upload overwritten: {prices(company_id)}")
+        return False
+    print("✅ Product of the later upload kept")
+
+    response = requests.post(f"{BASE_URL}/upload-history/unknown-upload/rollback", timeout=30)
+    if response.status_code != 404:
+        print(f"❌ Expected 404 for unknown upload, got {response.status_code}")
+        return False
+    print("✅ Unknown upload returns 404")
+
+    return True
+
+def test_unchanged_rows_returned_to_owner(company_id):
+    """Rolling back an upload that re-sent the same prices hands the products back to the earlier upload"""
+    print("\n🔍 Testing rollback of unchanged rows...")
+
+    first_upload = upload(company_id, "rollback_5.xlsx", [("Rollback Test Kablo", 7.0)])
+    same_upload = upload(company_id, "rollback_6.xlsx", [("Rollback Test Kablo", 7.0)])
+    if not first_upload or not same_upload:
+        return False
+
+    response = requests.post(f"{BASE_URL}/upload-history/{same_upload}/rollback", timeout=60)
+    if response.status_code != 200 or response.json()['summary']['released_products'] != 1:
+        print(f"❌ Unexpected rollback result: {response.status_code} - {response.text}")
+        return False
+    print("✅ Unchanged product handed back to the earlier upload")
+
+    response = requests.post(f"{BASE_URL}/upload-history/{first_upload}/rollback", timeout=60)
+    if response.status_code != 200 or response.json()['summary']['deleted_products'] != 1:
+        print(f"❌ Earlier upload not rolled back: {response.status_code} - {response.text}")
+        return False
+    if "Rollback Test Kablo" in prices(company_id):
+        print(f"❌ Created product kept: {prices(company_id)}")
+        return False
+    print("✅ Earlier upload still rolled back its product")
+
+    return True
+
+def test_manual_edit_kept(company_id):
+    """A price corrected by hand after an upload is not overwritten by rolling the upload back"""
+    print("\n🔍 Testing rollback after a manual price edit...")
+
+    first_upload = upload(company_id, "rollback_7.xlsx", [("Rollback Test Röle", 10.0)])
+    later_upload = upload(company_id, "rollback_8.xlsx", [("Rollback Test Röle", 12.0)])
+    if not first_upload or not later_upload:
+        return False
+
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    product_id = next(product['id'] for product in products if product['name'] == "Rollback Test Röle")
+    response = requests.patch(f"{BASE_URL}/products/{product_id}", json={"list_price": 11.0}, timeout=30)
+    if response.status_code != 200:
+        print(f"❌ Manual edit failed: {response.status_code} - {response.text}")
+        return False
+
+    response = requests.post(f"{BASE_URL}/upload-history/{later_upload}/rollback", timeout=60)
+    if response.status_code != 200 or response.json()['summary']['skipped_products'] != 1:
+        print(f"❌ Unexpected rollback result: {response.status_code} - {response.text}")
+        return False
+    if prices(company_id).get("Rollback Test Röle") != 11.0:
+        print(f"❌ Manual edit overwritten: {prices(company_id)}")
+        return False
+    print("✅ Manual price edit kept")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Upload Rollback Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            test_rollback_upload(company_id)
+            test_later_upload_kept(company_id)
+            test_unchanged_rows_returned_to_owner(company_id)
+            test_manual_edit_kept(company_id)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()
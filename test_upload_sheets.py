@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test Multi-Sheet Excel Uploads and Sheet Selection
+"""
+
+import io
+
+import openpyxl
+import requests
+from openpyxl.styles import PatternFill
+
+BASE_URL = "https://raspberry-forex-api.preview.emergentagent.com/api"
+SHEETS = ["Paneller", "Aküler", "İnvertörler"]
+
+def build_workbook():
+    """Colored price list with one sheet per product group, 3 products each"""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    fills = [PatternFill(start_color=rgb, end_color=rgb, fill_type="solid") for rgb in ("FFFF0000", "FF00B050")]
+    for sheet_name in SHEETS:
+        sheet = workbook.create_sheet(sheet_name)
+        rows = [("Ürün Adı", "Liste Fiyatı USD")] + [(f"Sheet Test {sheet_name} {i + 1}", 100.0 + i) for i in range(3)]
+        for row in rows:
+            sheet.append(row)
+            for cell, fill in zip(sheet[sheet.max_row], fills):
+                cell.fill = fill
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+def create_test_company():
+    """Create a test company"""
+    response = requests.post(f"{BASE_URL}/companies", json={"name": "Sheet Test Company"}, timeout=30)
+    if response.status_code == 200:
+        company_id = response.json().get('id')
+        print(f"✅ Created test company: {company_id}")
+        return company_id
+    print(f"❌ Failed to create company: {response.status_code}")
+    return None
+
+def upload(company_id, content, **form):
+    """Upload the workbook and return the response"""
+    return requests.post(
+        f"{BASE_URL}/companies/{company_id}/upload-excel",
+        files={"file": ("sheet_test.xlsx", content)},
+        data=form,
+        timeout=60
+    )
+
+def test_selected_sheets_only(company_id, content):
+    """Only the sheets in the allow-list are imported"""
+    print("\n🔍 Testing sheet allow-list...")
+
+    response = upload(company_id, content, sheets="Aküler, İnvertörler")
+    if response.status_code != 200:
+        print(f"❌ Upload failed: {response.status_code} - {response.text}")
+        return False
+
+    products = requests.get(f"{BASE_URL}/products", params={"company_id": company_id}, timeout=30).json()
+    names = {product['name'] for product in products}
+    if len(names) != 6 or any("Paneller" in name for name in names):
+        print(f"❌ Unexpected products: {sorted(names)}")
+        return False
+    print("✅ Only the selected sheets were imported")
+
+    return True
+
+def test_all_sheets_and_unknown_sheet(company_id, content):
+    """Without an allow-list every sheet is imported; unknown sheet names are rejected"""
+    print("\n🔍 Testing full workbook and unknown sheet...")
+
+    response = upload(company_id, content)
+    if response.status_code != 200 or response.json()['summary']['new_products'] != 3:
+        print(f"❌ Unexpected full upload result: {response.status_code} - {response.text}")
+        return False
+    print("✅ Remaining sheet imported from the full workbook")
+
+    response = upload(company_id, content, sheets="Kablolar")
+    if response.status_code != 400:
+        print(f"❌ Expected 400 for unknown sheet, got {response.status_code}")
+        return False
+    print("✅ Unknown sheet rejected")
+
+    return True
+
+def cleanup_company(company_id):
+    """Clean up test company (also deletes its products)"""
+    if company_id:
+        response = requests.delete(f"{BASE_URL}/companies/{company_id}", timeout=30)
+        if response.status_code == 200:
+            print(f"✅ Cleaned up company {company_id}")
+        else:
+            print(f"⚠️  Failed to cleanup company {company_id}")
+
+def main():
+    print("🚀 Multi-Sheet Excel Upload Test")
+    print("=" * 60)
+
+    company_id = create_test_company()
+    if company_id:
+        try:
+            content = build_workbook()
+            test_selected_sheets_only(company_id, content)
+            test_all_sheets_and_unknown_sheet(company_id, content)
+        finally:
+            cleanup_company(company_id)
+    else:
+        print("❌ Cannot proceed without company")
+
+if __name__ == "__main__":
+    main()